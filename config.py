@@ -2,7 +2,15 @@ import flask_calendar.constants as constants
 
 DEBUG = True
 DATA_FOLDER = "data"
+# "json" (a file per calendar), "sharded" (a folder per calendar with a file per month) or "sqlite" (a single database
+# inside DATA_FOLDER). See README for migrating between them
+STORAGE_BACKEND = "json"
 USERS_DATA_FOLDER = "users"
+# "sqlite" (a database inside USERS_DATA_FOLDER, shared by all worker processes and kept across restarts) or "memory"
+# (per process, only for single process deployments)
+SESSION_BACKEND = "sqlite"
+# max number of sessions kept in memory per process
+SESSION_CACHE_SIZE = 1024
 BASE_URL = "http://0.0.0.0:5000"
 MIN_YEAR = 2017
 MAX_YEAR = 2200
@@ -16,9 +24,11 @@ WEEK_STARTING_DAY = constants.WEEK_START_DAY_MONDAY
 
 MONTHS_TO_EXPORT = 6  # currently only used for ICS export
 
+# serves an ICS feed of each calendar at /<calendar id>/ics/<ics key of any of its users>
 FEATURE_FLAG_ICAL_EXPORT = False
 
-# (base ^ attempts ) second delays between failed logins
+# (base ^ attempts ) second delays between failed logins (of a username from an address), login attempts within them
+# get a "429 Too Many Requests" response. 0 disables them
 FAILED_LOGIN_DELAY_BASE = 2
 
 # If true, will automatically decorate hyperlinks with <a> tags upon rendering them
@@ -69,6 +79,24 @@ BUTTONS_EMOJIS_LIST = (
     "🐱",
 )
 
+# max number of parsed calendars kept in memory per process (0 disables the cache)
+CALENDAR_CACHE_SIZE = 32
+
+# bytes of rendered month views kept in memory per process, served again (or answered with "304 Not Modified") while
+# their calendar doesn't change. 0 disables it
+RENDERED_PAGE_CACHE_SIZE = 8 * 1024 * 1024
+
+# max number of days the JSON API returns tasks of in a single request
+API_MAX_DAYS = 366
+
+# task changes are appended to a per-calendar journal instead of rewriting the calendar file, until it holds this many
+# operations and gets compacted back into the calendar file (0 disables the journal)
+CALENDAR_JOURNAL_MAX_OPERATIONS = 100
+
+# format calendar and users files are written with: "json" or "compressed" (zlib compressed JSON, smaller but not
+# editable by hand and read whole). Files in either format are read, so it can be changed at any time
+DATA_FILE_FORMAT = "json"
+
 # percent of chance to do a GC-like sweep on save and clean empty and/or past hidden entries.
 # values [0, 100] -> Note that 0 disables it, 100 makes it run every time
 GC_ON_SAVE_CHANCE = 30
@@ -1,23 +1,46 @@
+import calendar
+import gzip
 import re
-from datetime import date, timedelta
-from typing import List, Optional, Tuple, cast  # noqa: F401
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Tuple, cast  # noqa: F401
 
 from flask import abort, current_app, g, jsonify, make_response, redirect, render_template, request
 from werkzeug.wrappers import Response
 
 import flask_calendar.constants as constants
+import flask_calendar.serializer as serializer
 from flask_calendar.app_utils import (
     add_session,
     authenticated,
     authorized,
+    get_calendar_data,
+    get_request_calendar,
+    get_session_store,
     get_session_username,
     new_session_id,
     next_month_link,
     previous_month_link,
 )
 from flask_calendar.authentication import Authentication
+from flask_calendar.authorization import Authorization
 from flask_calendar.calendar_data import CalendarData
 from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.ical_export import CONTENT_TYPE, export_range, ics_chunks
+from flask_calendar.page_cache import page_cache
+
+API_COMPACT_FIELD_NAMES = {
+    "date": "d",
+    "id": "i",
+    "title": "t",
+    "details": "x",
+    "color": "c",
+    "is_all_day": "a",
+    "start_time": "s",
+    "end_time": "e",
+    "repeats": "r",
+}
+# smaller API responses are sent uncompressed, as gzip would barely save anything
+API_GZIP_MIN_SIZE = 1024
 
 
 def get_authentication() -> Authentication:
@@ -27,6 +50,8 @@ def get_authentication() -> Authentication:
             data_folder=current_app.config["USERS_DATA_FOLDER"],
             password_salt=current_app.config["PASSWORD_SALT"],
             failed_login_delay_base=current_app.config["FAILED_LOGIN_DELAY_BASE"],
+            file_format=current_app.config["DATA_FILE_FORMAT"],
+            session_store=get_session_store(),
         )
     return cast(Authentication, auth)
 
@@ -47,8 +72,15 @@ def do_login_action() -> Response:
     username = request.form.get("username", "")
     password = request.form.get("password", "")
     authentication = get_authentication()
+    client_address = str(request.remote_addr)
 
-    if authentication.is_valid(username, password):
+    retry_after = authentication.retry_after(username, client_address)
+    if retry_after > 0:
+        response = make_response("Too many failed login attempts, try again later", 429)
+        response.headers["Retry-After"] = str(retry_after)
+        return cast(Response, response)
+
+    if authentication.is_valid(username, password, client_address):
         session_id = new_session_id()
         add_session(session_id, username)
         response = make_response(redirect("/"))
@@ -76,8 +108,6 @@ def do_login_action() -> Response:
 @authenticated
 @authorized
 def main_calendar_action(calendar_id: str) -> Response:
-    GregorianCalendar.setfirstweekday(current_app.config["WEEK_STARTING_DAY"])
-
     current_day, current_month, current_year = GregorianCalendar.current_date()
     year = int(request.args.get("y", current_year))
     year = max(min(year, current_app.config["MAX_YEAR"]), current_app.config["MIN_YEAR"])
@@ -90,26 +120,41 @@ def main_calendar_action(calendar_id: str) -> Response:
     else:
         view_past_tasks = request.cookies.get("ViewPastTasks", "1") == "1"
 
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
-    try:
-        data = calendar_data.load_calendar(calendar_id)
-    except FileNotFoundError:
-        abort(404)
+    calendar_data = get_calendar_data()
+    start, end = calendar_data.month_view_range(year, month)
+    # everything the page depends on but the calendar itself, which goes as the entry version
+    page_key = (
+        current_app.config["STORAGE_BACKEND"],
+        current_app.config["DATA_FOLDER"],
+        calendar_id,
+        year,
+        month,
+        view_past_tasks,
+        calendar_data.first_weekday,
+        (current_year, current_month, current_day),
+        request.script_root,
+        current_app.config["BASE_URL"],
+        current_app.config["SHOW_VIEW_PAST_BUTTON"],
+        current_app.config["MIN_YEAR"],
+        current_app.config["MAX_YEAR"],
+    )
+    page_version = calendar_data.calendar_version(calendar_id, start, end)
+    page = page_cache.get(page_key, page_version)
 
-    tasks = calendar_data.tasks_from_calendar(year, month, data)
-    tasks = calendar_data.add_repetitive_tasks_from_calendar(year, month, data, tasks)
+    if page is None:
+        data = calendar_data.load_calendar_between(calendar_id, start, end)
 
-    if not view_past_tasks:
-        calendar_data.hide_past_tasks(year, month, tasks)
+        tasks = calendar_data.month_tasks(year, month, data)
 
-    if current_app.config["WEEK_STARTING_DAY"] == constants.WEEK_START_DAY_MONDAY:
-        weekdays_headers = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
-    else:
-        weekdays_headers = ["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"]
+        if not view_past_tasks:
+            calendar_data.hide_past_tasks(year, month, tasks)
 
-    return cast(
-        Response,
-        render_template(
+        if calendar_data.first_weekday == constants.WEEK_START_DAY_MONDAY:
+            weekdays_headers = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
+        else:
+            weekdays_headers = ["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"]
+
+        body = render_template(
             "calendar.html",
             calendar_id=calendar_id,
             year=year,
@@ -118,22 +163,148 @@ def main_calendar_action(calendar_id: str) -> Response:
             current_year=current_year,
             current_month=current_month,
             current_day=current_day,
-            month_days=GregorianCalendar.month_days(year, month),
+            month_days=GregorianCalendar.month_days(year, month, calendar_data.first_weekday),
             previous_month_link=previous_month_link(year, month),
             next_month_link=next_month_link(year, month),
             base_url=current_app.config["BASE_URL"],
             tasks=tasks,
             display_view_past_button=current_app.config["SHOW_VIEW_PAST_BUTTON"],
             weekdays_headers=weekdays_headers,
-        ),
+        )
+        page = page_cache.set(page_key, page_version, body.encode("utf-8"))
+
+    response = make_response(page.body)
+    response.set_etag(page.etag)
+    # private as it requires a session, and always revalidated so changes show up right away
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# Task ocurrences between the `from` and `to` ISO dates (current month by default) as JSON, for clients not needing the
+# month view. `compact=1` shortens field names. Cached and revalidated like month views.
+@authenticated
+@authorized
+def api_tasks_action(calendar_id: str) -> Response:
+    current_day, current_month, current_year = GregorianCalendar.current_date()
+    today = date(current_year, current_month, current_day)
+    last_day = date(current_year, current_month, calendar.monthrange(current_year, current_month)[1])
+    try:
+        start = date.fromisoformat(request.args.get("from", today.replace(day=1).isoformat()))
+        end = date.fromisoformat(request.args.get("to", last_day.isoformat()))
+    except ValueError:
+        abort(400)
+    if end < start or (end - start).days >= current_app.config["API_MAX_DAYS"]:
+        abort(400)
+    compact = request.args.get("compact", "0") == "1"
+    if current_app.config["HIDE_PAST_TASKS"]:
+        start = max(start, today)
+
+    calendar_data = get_calendar_data()
+    page_key = (
+        "api",
+        current_app.config["STORAGE_BACKEND"],
+        current_app.config["DATA_FOLDER"],
+        calendar_id,
+        start,
+        end,
+        compact,
+        calendar_data.first_weekday,
+    )
+    page_version = calendar_data.calendar_version(calendar_id, start, end)
+    page = page_cache.get(page_key, page_version)
+
+    if page is None:
+        data = calendar_data.load_calendar_between(calendar_id, start, end)
+        tasks = calendar_data.task_occurrences(start, end, data) if start <= end else []
+        if compact:
+            tasks = [{API_COMPACT_FIELD_NAMES[key]: value for key, value in task.items()} for task in tasks]
+        body = serializer.dumps(
+            {"calendar_id": calendar_id, "from": start.isoformat(), "to": end.isoformat(), "tasks": tasks}
+        )
+        page = page_cache.set(page_key, page_version, body)
+
+    # worth it for bigger responses, compressed once per calendar version as they are cached too
+    if request.accept_encodings["gzip"] and len(page.body) >= API_GZIP_MIN_SIZE:
+        compressed_page = page_cache.get(page_key + ("gzip",), page_version)
+        if compressed_page is None:
+            compressed_page = page_cache.set(page_key + ("gzip",), page_version, gzip.compress(page.body, mtime=0))
+        response = make_response(compressed_page.body)
+        response.set_etag(compressed_page.etag)
+        response.content_encoding = "gzip"
+    else:
+        response = make_response(page.body)
+        response.set_etag(page.etag)
+    response.mimetype = "application/json"
+    response.vary.add("Accept-Encoding")
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# ICS feed of the next MONTHS_TO_EXPORT months of the calendar, for calendar clients. Authenticated by the ICS key of
+# any user of the calendar, as clients can't log in. Streamed as it's generated and then served from the page cache
+# (and revalidated) until the calendar changes, as clients keep polling it.
+def ics_export_action(calendar_id: str, ics_key: str) -> Response:
+    if not current_app.config["FEATURE_FLAG_ICAL_EXPORT"]:
+        abort(404)
+    username = get_authentication().ics_key_username(ics_key)
+    if username is None:
+        abort(404)
+    calendar_data = get_calendar_data()
+    try:
+        allowed = Authorization(calendar_data=calendar_data).can_access(username=username, calendar_id=calendar_id)
+    except FileNotFoundError:
+        abort(404)
+    if not allowed:
+        abort(403)
+
+    current_day, current_month, current_year = GregorianCalendar.current_date()
+    start, end = export_range(date(current_year, current_month, current_day), current_app.config["MONTHS_TO_EXPORT"])
+    feed_key = (
+        "ics",
+        current_app.config["STORAGE_BACKEND"],
+        current_app.config["DATA_FOLDER"],
+        calendar_id,
+        start,
+        end,
+        calendar_data.first_weekday,
+        current_app.config["TIMEZONE"],
     )
+    feed_version = calendar_data.calendar_version(calendar_id, start, end)
+    feed = page_cache.get(feed_key, feed_version)
+
+    if feed is None:
+        chunks = ics_chunks(
+            calendar_id,
+            calendar_data.load_calendar_between(calendar_id, start, end),
+            start,
+            end,
+            calendar_data.first_weekday,
+            current_app.config["TIMEZONE"],
+            datetime.now(timezone.utc),
+        )
+
+        def stream() -> Iterator[bytes]:
+            body = []  # type: List[bytes]
+            for chunk in chunks:
+                body.append(chunk.encode("utf-8"))
+                yield body[-1]
+            page_cache.set(feed_key, feed_version, b"".join(body))
+
+        response = Response(stream(), content_type=CONTENT_TYPE)
+    else:
+        response = make_response(feed.body)
+        response.content_type = CONTENT_TYPE
+        response.set_etag(feed.etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @authenticated
 @authorized
 def new_task_action(calendar_id: str, year: int, month: int) -> Response:
-    GregorianCalendar.setfirstweekday(current_app.config["WEEK_STARTING_DAY"])
-
     current_day, current_month, current_year = GregorianCalendar.current_date()
     year = max(min(int(year), current_app.config["MAX_YEAR"]), current_app.config["MIN_YEAR"])
     month = max(min(int(month), 12), 1)
@@ -179,13 +350,14 @@ def new_task_action(calendar_id: str, year: int, month: int) -> Response:
 @authorized
 def edit_task_action(calendar_id: str, year: int, month: int, day: int, task_id: int) -> Response:
     month_names = GregorianCalendar.MONTH_NAMES
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
+    data = get_request_calendar(calendar_id)
 
     repeats = request.args.get("repeats") == "1"
     try:
         if repeats:
             task = calendar_data.repetitive_task_from_calendar(
-                calendar_id=calendar_id, year=year, month=month, task_id=int(task_id)
+                calendar_id=calendar_id, year=year, month=month, task_id=int(task_id), data=data
             )
         else:
             task = calendar_data.task_from_calendar(
@@ -194,8 +366,9 @@ def edit_task_action(calendar_id: str, year: int, month: int, day: int, task_id:
                 month=month,
                 day=day,
                 task_id=int(task_id),
+                data=data,
             )
-    except (FileNotFoundError, IndexError):
+    except (FileNotFoundError, IndexError, ValueError):
         abort(404)
 
     if task["details"] == "&nbsp;":
@@ -228,11 +401,9 @@ def edit_task_action(calendar_id: str, year: int, month: int, day: int, task_id:
 @authenticated
 @authorized
 def update_task_action(calendar_id: str, year: str, month: str, day: str, task_id: str) -> Response:
-    # Logic is same as save + delete, could refactor but can wait until need to change any save/delete logic
-
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
 
-    # For creation of "updated" task use only form data
+    # Old task is located with url data, its new contents use only form data
     title = request.form["title"].strip()
     start_date = request.form.get("date", "")
     if len(start_date) > 0:
@@ -252,11 +423,15 @@ def update_task_action(calendar_id: str, year: str, month: str, day: str, task_i
     repetition_subtype = request.form.get("repetition_subtype", "")
     repetition_value = int(request.form["repetition_value"])  # type: int
 
-    calendar_data.create_task(
+    calendar_data.update_task(
         calendar_id=calendar_id,
-        year=updated_year,
-        month=updated_month,
-        day=updated_day,
+        year_str=year,
+        month_str=month,
+        day_str=day,
+        task_id=int(task_id),
+        new_year=updated_year,
+        new_month=updated_month,
+        new_day=updated_day,
         title=title,
         is_all_day=is_all_day,
         start_time=start_time,
@@ -268,14 +443,6 @@ def update_task_action(calendar_id: str, year: str, month: str, day: str, task_i
         repetition_subtype=repetition_subtype,
         repetition_value=repetition_value,
     )
-    # For deletion of old task data use only url data
-    calendar_data.delete_task(
-        calendar_id=calendar_id,
-        year_str=year,
-        month_str=month,
-        day_str=day,
-        task_id=int(task_id),
-    )
 
     if updated_year is None:
         return redirect("{}/{}/".format(current_app.config["BASE_URL"], calendar_id), code=302)
@@ -310,7 +477,7 @@ def save_task_action(calendar_id: str) -> Response:
     repetition_subtype = request.form.get("repetition_subtype")
     repetition_value = int(request.form["repetition_value"])
 
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
 
     dates_to_create = []  # type: List[Tuple[Optional[int], Optional[int], Optional[int]]]
 
@@ -332,24 +499,20 @@ def save_task_action(calendar_id: str) -> Response:
     else:
         dates_to_create.append((year, month, day))
 
-    for date_tuple in dates_to_create:
-        year, month, day = date_tuple
-        calendar_data.create_task(
-            calendar_id=calendar_id,
-            year=year,
-            month=month,
-            day=day,
-            title=title,
-            is_all_day=is_all_day,
-            start_time=start_time,
-            end_time=end_time,
-            details=details,
-            color=color,
-            has_repetition=has_repetition,
-            repetition_type=repetition_type,
-            repetition_subtype=repetition_subtype,
-            repetition_value=repetition_value,
-        )
+    calendar_data.create_tasks(
+        calendar_id=calendar_id,
+        dates=dates_to_create,
+        title=title,
+        is_all_day=is_all_day,
+        start_time=start_time,
+        end_time=end_time,
+        details=details,
+        color=color,
+        has_repetition=has_repetition,
+        repetition_type=repetition_type,
+        repetition_subtype=repetition_subtype,
+        repetition_value=repetition_value,
+    )
 
     if year is None:
         return redirect("{}/{}/".format(current_app.config["BASE_URL"], calendar_id), code=302)
@@ -363,7 +526,7 @@ def save_task_action(calendar_id: str) -> Response:
 @authenticated
 @authorized
 def delete_task_action(calendar_id: str, year: str, month: str, day: str, task_id: str) -> Response:
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
     calendar_data.delete_task(
         calendar_id=calendar_id,
         year_str=year,
@@ -375,12 +538,21 @@ def delete_task_action(calendar_id: str, year: str, month: str, day: str, task_i
     return cast(Response, jsonify({}))
 
 
+@authenticated
+@authorized
+def delete_task_by_id_action(calendar_id: str, task_id: str) -> Response:
+    calendar_data = get_calendar_data()
+    calendar_data.delete_task_by_id(calendar_id=calendar_id, task_id=int(task_id))
+
+    return cast(Response, jsonify({}))
+
+
 @authenticated
 @authorized
 def update_task_day_action(calendar_id: str, year: str, month: str, day: str, task_id: str) -> Response:
     new_day = request.data.decode("utf-8")
 
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
     calendar_data.update_task_day(
         calendar_id=calendar_id,
         year_str=year,
@@ -396,7 +568,7 @@ def update_task_day_action(calendar_id: str, year: str, month: str, day: str, ta
 @authenticated
 @authorized
 def hide_repetition_task_instance_action(calendar_id: str, year: str, month: str, day: str, task_id: str) -> Response:
-    calendar_data = CalendarData(current_app.config["DATA_FOLDER"], current_app.config["WEEK_STARTING_DAY"])
+    calendar_data = get_calendar_data()
     calendar_data.hide_repetition_task_instance(
         calendar_id=calendar_id,
         year_str=year,
@@ -8,10 +8,13 @@ from flask import Flask, Response, send_from_directory
 
 import config  # noqa: F401
 from flask_calendar.actions import (
+    api_tasks_action,
     delete_task_action,
+    delete_task_by_id_action,
     do_login_action,
     edit_task_action,
     hide_repetition_task_instance_action,
+    ics_export_action,
     index_action,
     login_action,
     main_calendar_action,
@@ -21,6 +24,8 @@ from flask_calendar.actions import (
     update_task_day_action,
 )
 from flask_calendar.app_utils import task_details_for_markup
+from flask_calendar.calendar_data import calendar_cache
+from flask_calendar.page_cache import page_cache
 
 
 def create_app(config_overrides: Optional[Dict] = None) -> Flask:
@@ -36,6 +41,9 @@ def create_app(config_overrides: Optional[Dict] = None) -> Flask:
         except locale.Error as e:
             app.logger.warning("{} ({})".format(str(e), app.config["LOCALE"]))
 
+    calendar_cache.resize(app.config["CALENDAR_CACHE_SIZE"])
+    page_cache.resize(app.config["RENDERED_PAGE_CACHE_SIZE"])
+
     # To avoid main_calendar_action below shallowing favicon requests and generating error logs
     @app.route("/favicon.ico")
     def favicon() -> Response:
@@ -49,6 +57,8 @@ def create_app(config_overrides: Optional[Dict] = None) -> Flask:
     app.add_url_rule("/login", "login_action", login_action, methods=["GET"])
     app.add_url_rule("/do_login", "do_login_action", do_login_action, methods=["POST"])
     app.add_url_rule("/<calendar_id>/", "main_calendar_action", main_calendar_action, methods=["GET"])
+    app.add_url_rule("/<calendar_id>/api/tasks", "api_tasks_action", api_tasks_action, methods=["GET"])
+    app.add_url_rule("/<calendar_id>/ics/<ics_key>", "ics_export_action", ics_export_action, methods=["GET"])
     app.add_url_rule(
         "/<calendar_id>/<year>/<month>/new_task",
         "new_task_action",
@@ -79,6 +89,12 @@ def create_app(config_overrides: Optional[Dict] = None) -> Flask:
         delete_task_action,
         methods=["DELETE"],
     )
+    app.add_url_rule(
+        "/<calendar_id>/task/<task_id>/",
+        "delete_task_by_id_action",
+        delete_task_by_id_action,
+        methods=["DELETE"],
+    )
     app.add_url_rule(
         "/<calendar_id>/<year>/<month>/<day>/<task_id>/",
         "update_task_day_action",
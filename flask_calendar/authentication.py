@@ -1,70 +1,159 @@
 import hashlib
-import json
+import math
 import os
-import time
-from typing import Dict, cast
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple, cast  # noqa: F401
 
-from cachelib.simple import SimpleCache
+import flask_calendar.serializer as serializer
+from flask_calendar.file_utils import file_lock, write_atomically
+from flask_calendar.session_store import MemorySessionStore, SessionStore
 
-cache = SimpleCache()
+# failed logins of instances without a shared store, still kept for the whole process
+local_session_store = MemorySessionStore("")
+
+_users = {}  # type: Dict[str, Tuple[Tuple[int, int, int], Dict]]
+_users_lock = threading.Lock()
+# path -> (users file contents, {ics key: username}) of the last users file an ICS key was looked up in
+_ics_keys = {}  # type: Dict[str, Tuple[Dict, Dict[str, Optional[str]]]]
+# the same for every user before keys were random, so it identifies no one
+PLACEHOLDER_ICS_KEY = "an_ics_key"
+# failed logins of a username from any address before they get throttled too, so attackers changing addresses are still
+# slowed down but the user is not locked out by a few mistyped passwords
+USERNAME_FREE_FAILED_LOGINS = 10
+
+
+# Parsed users file, shared by every `Authentication` of the process and only read again when the file version
+# (modification time, size and inode) changes. Shared contents are never modified, changes replace them whole.
+def load_users(path: str) -> Dict:
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    with _users_lock:
+        entry = _users.get(path)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+    contents = serializer.load(path)
+    with _users_lock:
+        _users[path] = (version, contents)
+    return cast(Dict, contents)
 
 
 class Authentication:
 
     USERS_FILENAME = "users.json"
+    # held while changing users, so processes (e.g. the app and the users command) never overwrite each other's changes
+    LOCK_FILENAME = ".users.lock"
 
-    def __init__(self, data_folder: str, password_salt: str, failed_login_delay_base: int) -> None:
-        self.contents = {}  # type: Dict
-        with open(os.path.join(".", data_folder, self.USERS_FILENAME)) as file:
-            self.contents = json.load(file)
+    def __init__(
+        self,
+        data_folder: str,
+        password_salt: str,
+        failed_login_delay_base: int,
+        file_format: str = serializer.FORMAT_JSON,
+        session_store: Optional[SessionStore] = None,
+    ) -> None:
+        self.path = os.path.join(".", data_folder, self.USERS_FILENAME)
+        self.lock_path = os.path.join(".", data_folder, self.LOCK_FILENAME)
+        self.contents = load_users(self.path)
         self.password_salt = password_salt
         self.failed_login_delay_base = failed_login_delay_base
         self.data_folder = data_folder
+        self.file_format = file_format
+        self.session_store = session_store if session_store is not None else local_session_store
 
-    def is_valid(self, username: str, password: str) -> bool:
+    # Failed logins are throttled per username and client address: instead of waiting, attempts are rejected until
+    # (base ^ previous failed attempts) seconds after the last failed one. Those of the username from any address are
+    # throttled the same way once over USERNAME_FREE_FAILED_LOGINS, and clients wait for whichever ends later.
+    def retry_after(self, username: str, client_address: str = "") -> int:
+        return math.ceil(
+            max(
+                self.session_store.login_retry_after(self._attempts_key(username, client_address)),
+                self.session_store.login_retry_after(self._username_attempts_key(username)),
+            )
+        )
+
+    def is_valid(self, username: str, password: str, client_address: str = "") -> bool:
         if username not in self.contents:
-            self._failed_attempt(username)
+            self._failed_attempt(username, client_address)
             return False
         if self._hash_password(password) != self.contents[username]["password"]:
-            self._failed_attempt(username)
+            self._failed_attempt(username, client_address)
             return False
+        self.session_store.clear_failed_logins(self._attempts_key(username, client_address))
+        self.session_store.clear_failed_logins(self._username_attempts_key(username))
         return True
 
     def user_data(self, username: str) -> Dict:
         return cast(Dict, self.contents[username])
 
+    # Owner of an ICS key (which authenticates calendar feed requests), if any. Keys shared by several users (like the
+    # placeholder one) don't identify any of them.
+    def ics_key_username(self, ics_key: str) -> Optional[str]:
+        with _users_lock:
+            entry = _ics_keys.get(self.path)
+            if entry is None or entry[0] is not self.contents:
+                ics_keys = {}  # type: Dict[str, Optional[str]]
+                for username, user in self.contents.items():
+                    key = user.get("ics_key")
+                    if key and key != PLACEHOLDER_ICS_KEY:
+                        ics_keys[key] = None if key in ics_keys else username
+                entry = _ics_keys[self.path] = (self.contents, ics_keys)
+        return entry[1].get(ics_key)
+
     def add_user(self, username: str, plaintext_password: str, default_calendar: str) -> None:
-        if username in self.contents:
-            raise ValueError("Username {} already exists".format(username))
-        hashed_password = self._hash_password(plaintext_password)
-        self.contents[username] = {
-            "username": username,
-            "password": hashed_password,
-            "default_calendar": default_calendar,
-            "ics_key": "an_ics_key",
-        }
-        self._save()
+        self.add_users([(username, plaintext_password, default_calendar)])
+
+    # Adds all (username, plaintext password, default calendar) users with a single save, or none if any exists already
+    def add_users(self, users: List[Tuple[str, str, str]]) -> None:
+        with file_lock(self.lock_path):
+            contents = dict(load_users(self.path))
+            for username, plaintext_password, default_calendar in users:
+                if username in contents:
+                    raise ValueError("Username {} already exists".format(username))
+                hashed_password = self._hash_password(plaintext_password)
+                contents[username] = {
+                    "username": username,
+                    "password": hashed_password,
+                    "default_calendar": default_calendar,
+                    "ics_key": uuid.uuid4().hex,
+                }
+            self._save(contents)
 
     def delete_user(self, username: str) -> None:
-        self.contents.pop(username)
-        self._save()
+        self.delete_users([username])
+
+    # Deletes all users (repeated ones once) with a single save, or none if any doesn't exist
+    def delete_users(self, usernames: List[str]) -> None:
+        with file_lock(self.lock_path):
+            contents = dict(load_users(self.path))
+            for username in dict.fromkeys(usernames):
+                contents.pop(username)
+            self._save(contents)
 
     def _hash_password(self, plaintext_password: str) -> str:
         hash_algoritm = hashlib.new("sha256")
         hash_algoritm.update((plaintext_password + self.password_salt).encode("UTF-8"))
         return hash_algoritm.hexdigest()
 
-    def _save(self) -> None:
-        with open(os.path.join(".", self.data_folder, self.USERS_FILENAME), "w") as file:
-            json.dump(self.contents, file)
-
-    def _failed_attempt(self, username: str) -> None:
-        key = "LF_{}".format(username)
-        attempts = cache.get(key)
-        if attempts is None:
-            attempts = 0
-        else:
-            attempts = int(attempts) + 1
-        wait = self.failed_login_delay_base ** attempts
-        cache.set(key, attempts, timeout=7200)  # Keep for 2h
-        time.sleep(wait)
+    # Callers must hold the users lock
+    def _save(self, contents: Dict) -> None:
+        write_atomically(self.path, serializer.dumps(contents, self.file_format))
+        stat = os.stat(self.path)
+        with _users_lock:
+            _users[self.path] = ((stat.st_mtime_ns, stat.st_size, stat.st_ino), contents)
+        self.contents = contents
+
+    def _failed_attempt(self, username: str, client_address: str) -> None:
+        self.session_store.add_failed_login(self._attempts_key(username, client_address), self.failed_login_delay_base)
+        self.session_store.add_failed_login(
+            self._username_attempts_key(username), self.failed_login_delay_base, USERNAME_FREE_FAILED_LOGINS
+        )
+
+    # Keys start differently, so no username and address match the key of another username
+    @staticmethod
+    def _attempts_key(username: str, client_address: str) -> str:
+        return "address|{}|{}".format(client_address, username)
+
+    @staticmethod
+    def _username_attempts_key(username: str) -> str:
+        return "username|{}".format(username)
@@ -11,4 +11,4 @@ class Authorization:
         if calendar_id is None:
             return username in self.calendar_data.users_list(data=data)
         else:
-            return username in self.calendar_data.users_list(calendar_id=calendar_id)
+            return username in self.calendar_data.calendar_users(calendar_id=calendar_id)
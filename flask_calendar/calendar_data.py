@@ -1,14 +1,23 @@
-import json
+import calendar
+import glob
+import mmap
 import os
 import random
+import threading
 import time
-from datetime import datetime
-from typing import Dict, List, Optional, cast
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple, cast  # noqa: F401
 
-from flask import current_app
+from flask import current_app, has_app_context
 
 import flask_calendar.constants as constants
+import flask_calendar.serializer as serializer
+from flask_calendar.file_utils import file_lock, write_atomically
 from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.membership_index import membership_index
 
 KEY_TASKS = "tasks"
 KEY_USERS = "users"
@@ -16,6 +25,204 @@ KEY_NORMAL_TASK = "normal"
 KEY_REPETITIVE_TASK = "repetition"
 KEY_REPETITIVE_HIDDEN_TASK = "hidden_repetition"
 
+# Mutations are expressed as operations (dicts with a "type" and its fields), so each storage can apply them its own way
+OPERATION_CREATE_TASK = "create"
+OPERATION_DELETE_TASK = "delete"
+OPERATION_MOVE_TASK = "move"
+OPERATION_HIDE_REPETITION = "hide"
+OPERATION_UPDATE_TASK = "update"
+
+DEFAULT_CALENDAR_CACHE_SIZE = 32
+
+
+# Per-process LRU of parsed calendars, keyed by file path and only valid while the file version (modification time,
+# size and inode) matches the one the entry was parsed from. Cached calendars are shared, so treat them as read-only.
+# Each entry also holds structures derived from its calendar, which live and die with it.
+class CalendarCache:
+    def __init__(self, max_size: int = DEFAULT_CALENDAR_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def get(self, key: str, version: Tuple) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return cast(Dict, entry[1])
+
+    def derived(self, data: Dict) -> Optional[Dict]:
+        # None means `data` is not a cached calendar (e.g. a private copy being modified), so nothing can be kept for it
+        with self._lock:
+            for _, cached_data, derived in self._entries.values():
+                if cached_data is data:
+                    return cast(Dict, derived)
+        return None
+
+    def set(self, key: str, version: Tuple, data: Dict) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, data, {})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def resize(self, max_size: int) -> None:
+        with self._lock:
+            self.max_size = max_size
+            while len(self._entries) > max(max_size, 0):
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+calendar_cache = CalendarCache()
+
+
+# Repetitive tasks of a calendar bucketed by when they happen, so expanding a month only visits its occurrences.
+# Weekly and monthly by weekday values are week columns (depend on the first weekday), monthly by day ones day numbers.
+class RepetitionRules:
+    def __init__(self, data: Dict) -> None:
+        self.weekly = {}  # type: Dict[int, List[Tuple[int, Dict]]]
+        self.monthly_by_weekday = {}  # type: Dict[int, List[Tuple[int, Dict]]]
+        self.monthly_by_day = {}  # type: Dict[int, List[Tuple[int, Dict]]]
+
+        # tasks keep their position so occurrences of a day follow the calendar order
+        for position, task in enumerate(data[KEY_TASKS][KEY_REPETITIVE_TASK]):
+            if task["repetition_type"] == CalendarData.REPETITION_TYPE_WEEKLY:
+                bucket = self.weekly
+            elif task["repetition_type"] == CalendarData.REPETITION_TYPE_MONTHLY:
+                if task["repetition_subtype"] == CalendarData.REPETITION_SUBTYPE_WEEK_DAY:
+                    bucket = self.monthly_by_weekday
+                else:
+                    bucket = self.monthly_by_day
+            else:
+                continue
+            bucket.setdefault(task["repetition_value"], []).append((position, task))
+
+        # weekly ocurrences are hidden per day, monthly ones whenever their month has any hidden day
+        self.hidden_days = set()  # type: Set[Tuple[str, str, str, str]]
+        self.hidden_months = set()  # type: Set[Tuple[str, str, str]]
+        for id_str, years in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK].items():
+            for year_str, months in years.items():
+                for month_str, days in months.items():
+                    self.hidden_months.add((id_str, year_str, month_str))
+                    for day_str in days:
+                        self.hidden_days.add((id_str, year_str, month_str, day_str))
+
+    def occurrences(
+        self, year: int, month: int, first_weekday: int, first_day: int = 1, last_day: Optional[int] = None
+    ) -> Dict:
+        year_str = str(year)
+        month_str = str(month)
+        month_first_weekday, days_in_month = calendar.monthrange(year, month)
+        if last_day is None or last_day > days_in_month:
+            last_day = days_in_month
+        tasks = {}  # type: Dict
+
+        for day in range(first_day, last_day + 1):
+            week_column = (month_first_weekday + day - 1 - first_weekday) % 7
+            day_str = str(day)
+            day_tasks = [
+                (position, task)
+                for position, task in self.weekly.get(week_column, [])
+                if (str(task["id"]), year_str, month_str, day_str) not in self.hidden_days
+            ]
+            monthly_tasks = self.monthly_by_day.get(day, [])
+            # first week of the month holds the first ocurrence of each weekday
+            if day <= 7:
+                monthly_tasks = monthly_tasks + self.monthly_by_weekday.get(week_column, [])
+            day_tasks.extend(
+                (position, task)
+                for position, task in monthly_tasks
+                if (str(task["id"]), year_str, month_str) not in self.hidden_months
+            )
+            if day_tasks:
+                day_tasks.sort(key=lambda position_and_task: position_and_task[0])
+                tasks[day_str] = [task for _, task in day_tasks]
+
+        return tasks
+
+
+# Where each task id is found in a calendar: the (year, month, day, position) of its normal tasks (several for legacy
+# multi-day tasks, which shared the id) and the position of its repetitive task.
+class TaskIndex:
+    def __init__(self, data: Dict) -> None:
+        self.normal = {}  # type: Dict[int, List[Tuple[str, str, str, int]]]
+        self.repetitive = {}  # type: Dict[int, int]
+
+        for year_str, months in data[KEY_TASKS][KEY_NORMAL_TASK].items():
+            for month_str, days in months.items():
+                for day_str, day_tasks in days.items():
+                    for position, task in enumerate(day_tasks):
+                        self.normal.setdefault(task["id"], []).append((year_str, month_str, day_str, position))
+        for position, task in enumerate(data[KEY_TASKS][KEY_REPETITIVE_TASK]):
+            self.repetitive.setdefault(task["id"], position)
+
+    # Normal task locations of the id, only those of the given (year_str, month_str, day_str) day if any
+    def normal_locations(
+        self, task_id: int, day: Optional[Tuple[str, str, str]] = None
+    ) -> List[Tuple[str, str, str, int]]:
+        locations = self.normal.get(task_id, [])
+        if day is None:
+            return list(locations)
+        return [location for location in locations if location[:3] == day]
+
+    # Helpers below change the calendar and the index together, so one index serves a whole batch of operations. Only
+    # later tasks of the same list shift, so they never walk other days.
+    def add_normal(self, day_tasks: List[Dict], year_str: str, month_str: str, day_str: str, task: Dict) -> None:
+        day_tasks.append(task)
+        self.normal.setdefault(task["id"], []).append((year_str, month_str, day_str, len(day_tasks) - 1))
+
+    def remove_normal(self, day_tasks: List[Dict], year_str: str, month_str: str, day_str: str, position: int) -> Dict:
+        task = day_tasks.pop(position)
+        self._move_normal(task["id"], (year_str, month_str, day_str, position), None)
+        for later_position in range(position, len(day_tasks)):
+            self._move_normal(
+                day_tasks[later_position]["id"],
+                (year_str, month_str, day_str, later_position + 1),
+                (year_str, month_str, day_str, later_position),
+            )
+        return task
+
+    def add_repetitive(self, repetitive_tasks: List[Dict], task: Dict) -> None:
+        repetitive_tasks.append(task)
+        self.repetitive.setdefault(task["id"], len(repetitive_tasks) - 1)
+
+    def remove_repetitive(self, repetitive_tasks: List[Dict], position: int) -> Dict:
+        task = repetitive_tasks.pop(position)
+        del self.repetitive[task["id"]]
+        for later_position in range(position, len(repetitive_tasks)):
+            task_id = repetitive_tasks[later_position]["id"]
+            # first of the later tasks sharing the removed id (legacy calendars) becomes the indexed one
+            if self.repetitive.get(task_id, later_position + 1) == later_position + 1:
+                self.repetitive[task_id] = later_position
+        return task
+
+    def _move_normal(
+        self, task_id: int, location: Tuple[str, str, str, int], new_location: Optional[Tuple[str, str, str, int]]
+    ) -> None:
+        locations = self.normal[task_id]
+        locations.remove(location)
+        if new_location is not None:
+            locations.append(new_location)
+        elif not locations:
+            del self.normal[task_id]
+
 
 class CalendarData:
 
@@ -27,15 +234,23 @@ class CalendarData:
     def __init__(self, data_folder: str, first_weekday: int = constants.WEEK_START_DAY_MONDAY) -> None:
         self.data_folder = data_folder
         self.gregorian_calendar = GregorianCalendar
-        self.gregorian_calendar.setfirstweekday(first_weekday)
+        self.first_weekday = first_weekday
 
+    # Returned calendar is shared through the process-wide cache: callers must not modify it, mutations read their own
+    # copy and anyone needing a modifiable one should use `load_calendar_for_update`.
     def load_calendar(self, filename: str) -> Dict:
-        with open(os.path.join(".", self.data_folder, "{}.json".format(filename))) as file:
-            contents = json.load(file)
-        if type(contents) is not dict:
-            raise ValueError("Error loading calendar from file '{}'".format(filename))
+        path = self._calendar_path(filename)
+        version = self._stored_version(filename)
+        contents = calendar_cache.get(path, version)
+        if contents is None:
+            contents = self._load_stored_calendar(filename)
+            calendar_cache.set(path, version, contents)
         return contents
 
+    # Always parses a private copy from disk, so in-progress changes never leak into the shared cache
+    def load_calendar_for_update(self, filename: str) -> Dict:
+        return self._load_stored_calendar(filename)
+
     def users_list(self, data: Optional[Dict] = None, calendar_id: Optional[str] = None) -> List:
         if data is None:
             if calendar_id is None:
@@ -47,6 +262,52 @@ class CalendarData:
 
         return cast(List, data[KEY_USERS])
 
+    # Answered from the membership index while the calendar file is unchanged, so no need to parse the calendar
+    def calendar_users(self, calendar_id: str) -> FrozenSet[str]:
+        version = self._stored_version(calendar_id)
+        index = membership_index(self.data_folder)
+        users = index.users(calendar_id, version)
+        if users is None:
+            users = frozenset(self.users_list(data=self.load_calendar(calendar_id), calendar_id=calendar_id))
+            index.set(calendar_id, version, users)
+        return users
+
+    def user_calendars(self, username: str) -> List[str]:
+        index = membership_index(self.data_folder)
+        if not index.complete:
+            self.rebuild_membership_index()
+            return index.user_calendars(username)
+        # calendars added or edited since the index was built (e.g. by another process) get re-read
+        for calendar_id in self._calendar_ids():
+            if index.users(calendar_id, self._stored_version(calendar_id)) is None:
+                try:
+                    self.calendar_users(calendar_id)
+                except ValueError:
+                    # not a calendar
+                    continue
+        return index.user_calendars(username)
+
+    def rebuild_membership_index(self) -> None:
+        entries = {}  # type: Dict
+        for calendar_id in self._calendar_ids():
+            version = self._stored_version(calendar_id)
+            try:
+                users = self.users_list(data=self.load_calendar(calendar_id), calendar_id=calendar_id)
+            except ValueError:
+                # not a calendar
+                continue
+            entries[calendar_id] = (version, users)
+        membership_index(self.data_folder).replace_all(entries)
+
+    # Adds and removes users of the calendar with a single save
+    def update_calendar_users(
+        self, calendar_id: str, added_users: Iterable[str] = (), removed_users: Iterable[str] = ()
+    ) -> None:
+        with self._calendar_lock(calendar_id):
+            data = self._read_journaled_calendar(calendar_id)
+            if self._update_users_list(data, added_users, removed_users):
+                self._save_calendar(data, calendar_id)
+
     def user_details(
         self,
         username: str,
@@ -73,16 +334,7 @@ class CalendarData:
         return False
 
     def tasks_from_calendar(self, year: int, month: int, data: Dict) -> Dict:
-        if not data or KEY_TASKS not in data:
-            raise ValueError("Incomplete data for calendar")
-        if not all(
-            [
-                KEY_NORMAL_TASK in data[KEY_TASKS],
-                KEY_REPETITIVE_TASK in data[KEY_TASKS],
-                KEY_REPETITIVE_HIDDEN_TASK in data[KEY_TASKS],
-            ]
-        ):
-            raise ValueError("Incomplete data for calendar")
+        self._check_tasks_data(data)
 
         tasks = {}  # type: Dict
 
@@ -92,7 +344,7 @@ class CalendarData:
             current_year,
         ) = self.gregorian_calendar.current_date()
 
-        for day in self.gregorian_calendar.month_days(year, month):
+        for day in self.gregorian_calendar.month_days(year, month, self.first_weekday):
             month_str = str(day.month)
             year_str = str(day.year)
             if (
@@ -100,10 +352,101 @@ class CalendarData:
                 and month_str in data[KEY_TASKS][KEY_NORMAL_TASK][year_str]
                 and month_str not in tasks
             ):
-                tasks[month_str] = data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str]
+                # copy day lists, as callers append repetitive tasks and empty past days over the result
+                tasks[month_str] = {
+                    day_str: list(day_tasks)
+                    for day_str, day_tasks in data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str].items()
+                }
+
+        return tasks
 
+    # Calendar with at least the normal tasks between both dates (plus users and repetitive tasks). The whole calendar
+    # is a valid answer, storages able to read only some months override it.
+    # Changes whenever the calendar changes, at least in what it holds between both dates (e.g. to tell whether a month
+    # view rendered from it is outdated)
+    def calendar_version(self, filename: str, start: date, end: date) -> Tuple:
+        return self._stored_version(filename)
+
+    # Calendar with at least the normal tasks of the months between both dates (storages might include more). Read from
+    # the month offsets saved along the calendar file when possible, so other months are not even parsed. Shared like
+    # `load_calendar` ones: do not modify it.
+    def load_calendar_between(self, filename: str, start: date, end: date) -> Dict:
+        path = self._calendar_path(filename)
+        version = self._stored_version(filename)
+        contents = calendar_cache.get(path, version)
+        if contents is not None:
+            return contents
+        key = "{}#{}#{}".format(path, start.isoformat(), end.isoformat())
+        contents = calendar_cache.get(key, version)
+        if contents is None:
+            partial_contents = self._load_stored_months(filename, set(self._months_between(start, end)))
+            if partial_contents is None:
+                return self.load_calendar(filename)
+            contents = partial_contents
+            calendar_cache.set(key, version, contents)
+        return contents
+
+    # First and last day shown in the month view
+    def month_view_range(self, year: int, month: int) -> Tuple[date, date]:
+        month_days = self.gregorian_calendar.month_days(year, month, self.first_weekday)
+        return month_days[0], month_days[-1]
+
+    # Normal and repetitive task ocurrences of the days shown in a month view, as {month_str: {day_str: [task, ...]}}
+    def month_tasks(self, year: int, month: int, data: Dict) -> Dict:
+        self._check_tasks_data(data)
+
+        start, end = self.month_view_range(year, month)
+        tasks = {}  # type: Dict
+        for day, task in self.tasks_between(start, end, data):
+            tasks.setdefault(str(day.month), {}).setdefault(str(day.day), []).append(task)
         return tasks
 
+    # Yields (date, task) ocurrences between both dates (included) in date order. Within a day normal tasks go first,
+    # then repetitive ones, each in calendar order.
+    def tasks_between(self, start: date, end: date, data: Dict) -> Iterator[Tuple[date, Dict]]:
+        rules = self._repetition_rules(data)
+        normal_tasks = data[KEY_TASKS][KEY_NORMAL_TASK]
+        year, month = start.year, start.month
+
+        while (year, month) <= (end.year, end.month):
+            first_day = start.day if (year, month) == (start.year, start.month) else 1
+            last_day = end.day if (year, month) == (end.year, end.month) else calendar.monthrange(year, month)[1]
+
+            days = {}  # type: Dict[int, List[Dict]]
+            for day_str, day_tasks in normal_tasks.get(str(year), {}).get(str(month), {}).items():
+                day = int(day_str)
+                if first_day <= day <= last_day and day_tasks:
+                    days.setdefault(day, []).extend(day_tasks)
+            for day_str, day_tasks in rules.occurrences(year, month, self.first_weekday, first_day, last_day).items():
+                days.setdefault(int(day_str), []).extend(day_tasks)
+
+            for day in sorted(days):
+                task_date = date(year, month, day)
+                for task in days[day]:
+                    yield task_date, task
+
+            month, year = self.gregorian_calendar.next_month_and_year(year, month)
+
+    # Task ocurrences between both dates (included) as flat dicts, in `tasks_between` order. Each has its ISO date and
+    # whether it comes from a repetitive task, so clients don't need to know about the calendar layout.
+    def task_occurrences(self, start: date, end: date, data: Dict) -> List[Dict]:
+        self._check_tasks_data(data)
+
+        return [
+            {
+                "date": day.isoformat(),
+                "id": task["id"],
+                "title": task["title"],
+                "details": task["details"],
+                "color": task["color"],
+                "is_all_day": task["is_all_day"],
+                "start_time": task["start_time"],
+                "end_time": task.get("end_time", task["start_time"]),
+                "repeats": "repetition_type" in task,
+            }
+            for day, task in self.tasks_between(start, end, data)
+        ]
+
     def hide_past_tasks(self, year: int, month: int, tasks: Dict) -> None:
         (
             current_day,
@@ -111,7 +454,7 @@ class CalendarData:
             current_year,
         ) = self.gregorian_calendar.current_date()
 
-        for day in self.gregorian_calendar.month_days(year, month):
+        for day in self.gregorian_calendar.month_days(year, month, self.first_weekday):
             month_str = str(day.month)
 
             # empty past months and be careful of future dates, which might not have tasks
@@ -122,24 +465,31 @@ class CalendarData:
                 if day.month == current_month and int(task_day_number) < current_day:
                     tasks[month_str][task_day_number] = []
 
-    def task_from_calendar(self, calendar_id: str, year: int, month: int, day: int, task_id: int) -> Dict:
-        data = self.load_calendar(calendar_id)
-
-        year_str = str(year)
-        month_str = str(month)
-        day_str = str(day)
+    def task_from_calendar(
+        self, calendar_id: str, year: int, month: int, day: int, task_id: int, data: Optional[Dict] = None
+    ) -> Dict:
+        if data is None:
+            data = self.load_calendar(calendar_id)
 
-        for index, task in enumerate(data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str]):
-            if task["id"] == task_id:
+        task_date = (str(year), str(month), str(day))
+        for year_str, month_str, day_str, position in self._task_index(data).normal.get(task_id, []):
+            if (year_str, month_str, day_str) == task_date:
+                task = dict(data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str][position])  # type: Dict
                 task["repeats"] = False
                 task["date"] = self.date_for_frontend(year, month, day)
-                return cast(Dict, task)
+                return task
         raise ValueError("Task id '{}' not found".format(task_id))
 
-    def repetitive_task_from_calendar(self, calendar_id: str, year: int, month: int, task_id: int) -> Dict:
-        data = self.load_calendar(calendar_id)
+    def repetitive_task_from_calendar(
+        self, calendar_id: str, year: int, month: int, task_id: int, data: Optional[Dict] = None
+    ) -> Dict:
+        if data is None:
+            data = self.load_calendar(calendar_id)
 
-        task = [task for task in data[KEY_TASKS][KEY_REPETITIVE_TASK] if task["id"] == task_id][0]  # type: Dict
+        position = self._task_index(data).repetitive.get(task_id)
+        if position is None:
+            raise IndexError("Repetitive task id '{}' not found".format(task_id))
+        task = dict(data[KEY_TASKS][KEY_REPETITIVE_TASK][position])  # type: Dict
         task["repeats"] = True
         task["date"] = self.date_for_frontend(year, month, 1)
         return task
@@ -177,27 +527,19 @@ class CalendarData:
         day_str: str,
         task_id: int,
     ) -> None:
-        deleted = False
-        data = self.load_calendar(calendar_id)
-
-        if (
-            year_str in data[KEY_TASKS][KEY_NORMAL_TASK]
-            and month_str in data[KEY_TASKS][KEY_NORMAL_TASK][year_str]
-            and day_str in data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str]
-        ):
-            for index, task in enumerate(data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str]):
-                if task["id"] == task_id:
-                    data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str].pop(index)
-                    deleted = True
-
-        if not deleted:
-            for index, task in enumerate(data[KEY_TASKS][KEY_REPETITIVE_TASK]):
-                if task["id"] == task_id:
-                    data[KEY_TASKS][KEY_REPETITIVE_TASK].pop(index)
-                    if str(task_id) in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]:
-                        del data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][str(task_id)]
+        operation = {
+            "type": OPERATION_DELETE_TASK,
+            "year": year_str,
+            "month": month_str,
+            "day": day_str,
+            "id": task_id,
+        }
+        self._apply_operations(calendar_id, [operation])
 
-        self._save_calendar(data, filename=calendar_id)
+    # Deletes the normal tasks with that id, whatever their day, else the repetitive one
+    def delete_task_by_id(self, calendar_id: str, task_id: int) -> None:
+        operation = {"type": OPERATION_DELETE_TASK, "year": None, "month": None, "day": None, "id": task_id}
+        self._apply_operations(calendar_id, [operation])
 
     def update_task_day(
         self,
@@ -208,21 +550,15 @@ class CalendarData:
         task_id: int,
         new_day_str: str,
     ) -> None:
-        data = self.load_calendar(calendar_id)
-
-        task_to_update = None
-        for index, task in enumerate(data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str]):
-            if task["id"] == task_id:
-                task_to_update = data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str].pop(index)
-
-        if task_to_update is None:
-            return
-
-        if new_day_str not in data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str]:
-            data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][new_day_str] = []
-        data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][new_day_str].append(task_to_update)
-
-        self._save_calendar(data, filename=calendar_id)
+        operation = {
+            "type": OPERATION_MOVE_TASK,
+            "year": year_str,
+            "month": month_str,
+            "day": day_str,
+            "id": task_id,
+            "new_day": new_day_str,
+        }
+        self._apply_operations(calendar_id, [operation])
 
     def create_task(
         self,
@@ -241,40 +577,127 @@ class CalendarData:
         repetition_value: int,
         end_time: Optional[str] = None,
     ) -> bool:
-        details = details if len(details) > 0 else "&nbsp;"
-        data = self.load_calendar(calendar_id)
+        return self.create_tasks(
+            calendar_id=calendar_id,
+            dates=[(year, month, day)],
+            title=title,
+            is_all_day=is_all_day,
+            start_time=start_time,
+            details=details,
+            color=color,
+            has_repetition=has_repetition,
+            repetition_type=repetition_type,
+            repetition_subtype=repetition_subtype,
+            repetition_value=repetition_value,
+            end_time=end_time,
+        )
 
-        new_task = {
-            "id": int(time.time()),
-            "color": color,
-            "start_time": start_time,
-            "end_time": end_time if end_time else start_time,
-            "is_all_day": is_all_day,
-            "title": title,
-            "details": details,
-        }
+    # Creates the same task on each (year, month, day) date, with a single load and save of the calendar. Repetitive
+    # tasks are created once, ignoring dates.
+    def create_tasks(
+        self,
+        calendar_id: str,
+        dates: List[Tuple[Optional[int], Optional[int], Optional[int]]],
+        title: str,
+        is_all_day: bool,
+        start_time: str,
+        details: str,
+        color: str,
+        has_repetition: bool,
+        repetition_type: Optional[str],
+        repetition_subtype: Optional[str],
+        repetition_value: int,
+        end_time: Optional[str] = None,
+    ) -> bool:
         if has_repetition:
             if repetition_type == self.REPETITION_SUBTYPE_MONTH_DAY and repetition_value == 0:
                 return False
-            new_task["repetition_type"] = repetition_type
-            new_task["repetition_subtype"] = repetition_subtype
-            new_task["repetition_value"] = repetition_value
-            data[KEY_TASKS][KEY_REPETITIVE_TASK].append(new_task)
-        else:
-            if year is None or month is None or day is None:
+            dates = [(None, None, None)]
+        elif len(dates) == 0 or any(None in date_tuple for date_tuple in dates):
+            return False
+
+        operations = []
+        for task_id, (year, month, day) in zip(self._new_task_ids(calendar_id, len(dates)), dates):
+            new_task = self._new_task(
+                task_id=task_id,
+                title=title,
+                is_all_day=is_all_day,
+                start_time=start_time,
+                end_time=end_time,
+                details=details,
+                color=color,
+                has_repetition=has_repetition,
+                repetition_type=repetition_type,
+                repetition_subtype=repetition_subtype,
+                repetition_value=repetition_value,
+            )
+            operations.append(
+                {
+                    "type": OPERATION_CREATE_TASK,
+                    "year": None if has_repetition else str(year),
+                    "month": None if has_repetition else str(month),
+                    "day": None if has_repetition else str(day),
+                    "task": new_task,
+                }
+            )
+
+        self._apply_operations(calendar_id, operations)
+        return True
+
+    # Replaces the task (normal one of the given day, else repetitive) keeping its id, and moves it if its new date
+    # differs (None means repetitive). All in a single change, so no one ever sees both versions or none.
+    def update_task(
+        self,
+        calendar_id: str,
+        year_str: str,
+        month_str: str,
+        day_str: str,
+        task_id: int,
+        new_year: Optional[int],
+        new_month: Optional[int],
+        new_day: Optional[int],
+        title: str,
+        is_all_day: bool,
+        start_time: str,
+        details: str,
+        color: str,
+        has_repetition: bool,
+        repetition_type: Optional[str],
+        repetition_subtype: Optional[str],
+        repetition_value: int,
+        end_time: Optional[str] = None,
+    ) -> bool:
+        if has_repetition:
+            if repetition_type == self.REPETITION_SUBTYPE_MONTH_DAY and repetition_value == 0:
                 return False
-            year_str = str(year)
-            month_str = str(month)
-            day_str = str(day)
-            if year_str not in data[KEY_TASKS][KEY_NORMAL_TASK]:
-                data[KEY_TASKS][KEY_NORMAL_TASK][year_str] = {}
-            if month_str not in data[KEY_TASKS][KEY_NORMAL_TASK][year_str]:
-                data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str] = {}
-            if day_str not in data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str]:
-                data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str] = []
-            data[KEY_TASKS][KEY_NORMAL_TASK][year_str][month_str][day_str].append(new_task)
-
-        self._save_calendar(data, filename=calendar_id)
+        elif new_year is None or new_month is None or new_day is None:
+            return False
+
+        updated_task = self._new_task(
+            task_id=task_id,
+            title=title,
+            is_all_day=is_all_day,
+            start_time=start_time,
+            end_time=end_time,
+            details=details,
+            color=color,
+            has_repetition=has_repetition,
+            repetition_type=repetition_type,
+            repetition_subtype=repetition_subtype,
+            repetition_value=repetition_value,
+        )
+        operation = {
+            "type": OPERATION_UPDATE_TASK,
+            "year": year_str,
+            "month": month_str,
+            "day": day_str,
+            "id": task_id,
+            "new_year": None if has_repetition else str(new_year),
+            "new_month": None if has_repetition else str(new_month),
+            "new_day": None if has_repetition else str(new_day),
+            "task": updated_task,
+        }
+        self._apply_operations(calendar_id, [operation])
         return True
 
     def hide_repetition_task_instance(
@@ -285,17 +708,68 @@ class CalendarData:
         day_str: str,
         task_id_str: str,
     ) -> None:
-        data = self.load_calendar(calendar_id)
+        operation = {
+            "type": OPERATION_HIDE_REPETITION,
+            "year": year_str,
+            "month": month_str,
+            "day": day_str,
+            "id": task_id_str,
+        }
+        self._apply_operations(calendar_id, [operation])
+
+    # Task ids are creation timestamps in microseconds, kept strictly increasing for each calendar so that tasks created
+    # together (e.g. a multi-day task, or by several workers at once) still get unique ids. The last id given is kept
+    # next to the calendar, and only read and updated holding its lock.
+    def _new_task_ids(self, calendar_id: str, count: int) -> List[int]:
+        path = os.path.join(".", self.data_folder, ".{}.last_task_id".format(calendar_id))
+        with self._calendar_lock(calendar_id):
+            try:
+                with open(path) as file:
+                    last_id = int(file.read())
+            except (FileNotFoundError, ValueError):
+                # timestamps alone are still unique unless created within the same microsecond
+                last_id = 0
+            first_id = max(time.time_ns() // 1000, last_id + 1)
+            with open(path, "w") as file:
+                file.write(str(first_id + count - 1))
+        return list(range(first_id, first_id + count))
 
-        if task_id_str not in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]:
-            data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str] = {}
-        if year_str not in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str]:
-            data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str][year_str] = {}
-        if month_str not in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str][year_str]:
-            data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str][year_str][month_str] = {}
-        data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][task_id_str][year_str][month_str][day_str] = True
+    @staticmethod
+    def _new_task(
+        task_id: int,
+        title: str,
+        is_all_day: bool,
+        start_time: str,
+        end_time: Optional[str],
+        details: str,
+        color: str,
+        has_repetition: bool,
+        repetition_type: Optional[str],
+        repetition_subtype: Optional[str],
+        repetition_value: int,
+    ) -> Dict:
+        task = {
+            "id": task_id,
+            "color": color,
+            "start_time": start_time,
+            "end_time": end_time if end_time else start_time,
+            "is_all_day": is_all_day,
+            "title": title,
+            "details": details if len(details) > 0 else "&nbsp;",
+        }  # type: Dict
+        if has_repetition:
+            task["repetition_type"] = repetition_type
+            task["repetition_subtype"] = repetition_subtype
+            task["repetition_value"] = repetition_value
+        return task
 
-        self._save_calendar(data, filename=calendar_id)
+    # Hidden instances of a repetitive task only make sense while it keeps repeating the same way
+    @staticmethod
+    def _repetition_changed(previous_task: Dict, task: Dict) -> bool:
+        return any(
+            previous_task.get(key) != task.get(key)
+            for key in ["repetition_type", "repetition_subtype", "repetition_value"]
+        )
 
     @staticmethod
     def add_task_to_list(tasks: Dict, day_str: str, month_str: str, new_task: Dict) -> None:
@@ -303,77 +777,401 @@ class CalendarData:
             tasks[month_str][day_str] = []
         tasks[month_str][day_str].append(new_task)
 
+    # Returns whether users changed. Existing users keep their order, new ones go last.
+    @staticmethod
+    def _update_users_list(data: Dict, added_users: Iterable[str], removed_users: Iterable[str]) -> bool:
+        previous_users = data[KEY_USERS]
+        removed = set(removed_users)
+        users = [username for username in previous_users if username not in removed]
+        existing = set(users)
+        for username in added_users:
+            if username not in existing and username not in removed:
+                users.append(username)
+                existing.add(username)
+        data[KEY_USERS] = users
+        return bool(users != previous_users)
+
+    @staticmethod
+    def _check_tasks_data(data: Dict) -> None:
+        if not data or KEY_TASKS not in data:
+            raise ValueError("Incomplete data for calendar")
+        if not all(
+            [
+                KEY_NORMAL_TASK in data[KEY_TASKS],
+                KEY_REPETITIVE_TASK in data[KEY_TASKS],
+                KEY_REPETITIVE_HIDDEN_TASK in data[KEY_TASKS],
+            ]
+        ):
+            raise ValueError("Incomplete data for calendar")
+
     def _repetitive_tasks_from_calendar(self, year: int, month: int, data: Dict) -> Dict:
         if KEY_TASKS not in data:
             ValueError("Incomplete data for calendar")
         if KEY_REPETITIVE_TASK not in data[KEY_TASKS]:
             ValueError("Incomplete data for calendar")
 
+        rules = self._repetition_rules(data)
         repetitive_tasks = {}  # type: Dict
-        year_and_months = set(
-            [(source_day.year, source_day.month) for source_day in self.gregorian_calendar.month_days(year, month)]
-        )
+        month_days = self.gregorian_calendar.month_days(year, month, self.first_weekday)
+        year_and_months = set([(source_day.year, source_day.month) for source_day in month_days])
 
         for source_year, source_month in year_and_months:
-            month_str = str(source_month)
-            year_str = str(source_year)
-            repetitive_tasks[month_str] = {}
-
-            for task in data[KEY_TASKS][KEY_REPETITIVE_TASK]:
-                id_str = str(task["id"])
-                monthly_task_assigned = False
-                for week in self.gregorian_calendar.month_days_with_weekday(source_year, source_month):
-                    for weekday, day in enumerate(week):
-                        if day == 0:
-                            continue
-                        day_str = str(day)
-                        if (
-                            task["repetition_type"] == self.REPETITION_TYPE_WEEKLY
-                            and not self._is_repetition_hidden_for_day(data, id_str, year_str, month_str, str(day))
-                            and task["repetition_value"] == weekday
-                        ):
-                            self.add_task_to_list(repetitive_tasks, day_str, month_str, task)
-                        elif task["repetition_type"] == self.REPETITION_TYPE_MONTHLY and not self._is_repetition_hidden(
-                            data, id_str, year_str, month_str
-                        ):
-                            if task["repetition_subtype"] == self.REPETITION_SUBTYPE_WEEK_DAY:
-                                if task["repetition_value"] == weekday and not monthly_task_assigned:
-                                    monthly_task_assigned = True
-                                    self.add_task_to_list(repetitive_tasks, day_str, month_str, task)
-                            else:
-                                if task["repetition_value"] == day:
-                                    self.add_task_to_list(repetitive_tasks, day_str, month_str, task)
+            repetitive_tasks[str(source_month)] = rules.occurrences(source_year, source_month, self.first_weekday)
 
         return repetitive_tasks
 
     @staticmethod
-    def _is_repetition_hidden_for_day(data: Dict, id_str: str, year_str: str, month_str: str, day_str: str) -> bool:
-        if id_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]:
-            if (
-                year_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str]
-                and month_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str][year_str]
-                and day_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str][year_str][month_str]
-            ):
-                return True
-        return False
+    def _task_index(data: Dict) -> TaskIndex:
+        # same lifecycle as repetition rules: cached calendars are never modified, so their index never gets outdated
+        derived = calendar_cache.derived(data)
+        if derived is None:
+            return TaskIndex(data)
+        if "task_index" not in derived:
+            derived["task_index"] = TaskIndex(data)
+        return cast(TaskIndex, derived["task_index"])
 
     @staticmethod
-    def _is_repetition_hidden(data: Dict, id_str: str, year_str: str, month_str: str) -> bool:
-        if id_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]:
-            if (
-                year_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str]
-                and month_str in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK][id_str][year_str]
-            ):
+    def _repetition_rules(data: Dict) -> RepetitionRules:
+        # compiled once per cached calendar version, private copies (which might change) get compiled on each call
+        derived = calendar_cache.derived(data)
+        if derived is None:
+            return RepetitionRules(data)
+        if "repetition_rules" not in derived:
+            derived["repetition_rules"] = RepetitionRules(data)
+        return cast(RepetitionRules, derived["repetition_rules"])
+
+    # Storage hook for every mutation: applies the operations to the stored calendar. Other storages override it to
+    # persist operations their own way.
+    # The whole read-modify-write happens holding the calendar lock and over a fresh read, so concurrent workers never
+    # overwrite each other's changes.
+    # While the journal has room operations are only appended to it, else it gets compacted into a new snapshot.
+    def _apply_operations(self, calendar_id: str, operations: List[Dict]) -> None:
+        with self._calendar_lock(calendar_id):
+            journal_operations = self._check_journal(calendar_id)
+            if journal_operations + len(operations) <= self._journal_max_operations():
+                self._append_to_journal(calendar_id, operations)
+            else:
+                current_data = self._read_calendar(self._calendar_path(calendar_id), calendar_id)
+                changed = self._apply_operations_to(current_data, self._journaled_operations(calendar_id) + operations)
+                if changed or journal_operations > 0:
+                    self._save_calendar(current_data, filename=calendar_id)
+
+    # Applies the operations in order, returning whether any changed the calendar. Tasks are found through a task index
+    # built once for all of them (and kept up to date by each), so no operation needs to walk the whole calendar.
+    @staticmethod
+    def _apply_operations_to(data: Dict, operations: List[Dict]) -> bool:
+        if not operations:
+            return False
+        task_index = TaskIndex(data)
+        changed = False
+        for operation in operations:
+            changed = CalendarData._apply_operation(data, operation, task_index) or changed
+        return changed
+
+    @staticmethod
+    def _apply_operation(data: Dict, operation: Dict, task_index: TaskIndex) -> bool:
+        normal_tasks = data[KEY_TASKS][KEY_NORMAL_TASK]
+        repetitive_tasks = data[KEY_TASKS][KEY_REPETITIVE_TASK]
+        hidden_tasks = data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]
+        operation_type = operation["type"]
+
+        if operation_type == OPERATION_CREATE_TASK:
+            if operation["year"] is None:
+                task_index.add_repetitive(repetitive_tasks, operation["task"])
+            else:
+                month_tasks = normal_tasks.setdefault(operation["year"], {}).setdefault(operation["month"], {})
+                day_tasks = month_tasks.setdefault(operation["day"], [])
+                task_index.add_normal(
+                    day_tasks, operation["year"], operation["month"], operation["day"], operation["task"]
+                )
+            return True
+
+        if operation_type == OPERATION_DELETE_TASK:
+            day = None if operation["year"] is None else (operation["year"], operation["month"], operation["day"])
+            locations = task_index.normal_locations(operation["id"], day)
+            # last ones first, so the positions of the others stay valid
+            for year_str, month_str, day_str, position in sorted(locations, key=lambda location: -location[3]):
+                task_index.remove_normal(
+                    normal_tasks[year_str][month_str][day_str], year_str, month_str, day_str, position
+                )
+            if locations:
                 return True
-        return False
+            # not a normal task of that day, so try with repetitive ones
+            repetitive_position = task_index.repetitive.get(operation["id"])
+            if repetitive_position is None:
+                return False
+            task_index.remove_repetitive(repetitive_tasks, repetitive_position)
+            hidden_tasks.pop(str(operation["id"]), None)
+            return True
+
+        if operation_type == OPERATION_MOVE_TASK:
+            locations = task_index.normal_locations(
+                operation["id"], (operation["year"], operation["month"], operation["day"])
+            )
+            if not locations:
+                return False
+            month_tasks = normal_tasks[operation["year"]][operation["month"]]
+            position = min(location[3] for location in locations)
+            task = task_index.remove_normal(
+                month_tasks[operation["day"]], operation["year"], operation["month"], operation["day"], position
+            )
+            new_day_tasks = month_tasks.setdefault(operation["new_day"], [])
+            task_index.add_normal(new_day_tasks, operation["year"], operation["month"], operation["new_day"], task)
+            return True
+
+        if operation_type == OPERATION_UPDATE_TASK:
+            CalendarData._apply_update_operation(data, operation, task_index)
+            return True
+
+        if operation_type == OPERATION_HIDE_REPETITION:
+            hidden_months = hidden_tasks.setdefault(operation["id"], {}).setdefault(operation["year"], {})
+            hidden_months.setdefault(operation["month"], {})[operation["day"]] = True
+            return True
+
+        raise ValueError("Unknown operation '{}'".format(operation_type))
+
+    @staticmethod
+    def _apply_update_operation(data: Dict, operation: Dict, task_index: TaskIndex) -> None:
+        normal_tasks = data[KEY_TASKS][KEY_NORMAL_TASK]
+        repetitive_tasks = data[KEY_TASKS][KEY_REPETITIVE_TASK]
+        task = operation["task"]
+        old_date = (operation["year"], operation["month"], operation["day"])
+        new_date = (operation["new_year"], operation["new_month"], operation["new_day"])
+
+        locations = task_index.normal_locations(operation["id"], old_date)
+        repetitive_position = task_index.repetitive.get(operation["id"])
+        if locations:
+            day_tasks = normal_tasks[operation["year"]][operation["month"]][operation["day"]]
+            position = min(location[3] for location in locations)
+            if new_date == old_date:
+                day_tasks[position] = task
+                return
+            task_index.remove_normal(day_tasks, operation["year"], operation["month"], operation["day"], position)
+        elif repetitive_position is not None:
+            if CalendarData._repetition_changed(repetitive_tasks[repetitive_position], task):
+                data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK].pop(str(operation["id"]), None)
+            if operation["new_year"] is None:
+                repetitive_tasks[repetitive_position] = task
+                return
+            task_index.remove_repetitive(repetitive_tasks, repetitive_position)
+
+        # moved to another day or bucket (or not found anymore, then the edit is kept as a new task)
+        if operation["new_year"] is None:
+            task_index.add_repetitive(repetitive_tasks, task)
+        else:
+            month_tasks = normal_tasks.setdefault(operation["new_year"], {}).setdefault(operation["new_month"], {})
+            day_tasks = month_tasks.setdefault(operation["new_day"], [])
+            task_index.add_normal(day_tasks, operation["new_year"], operation["new_month"], operation["new_day"], task)
 
     def _save_calendar(self, data: Dict, filename: str) -> None:
         if random.randint(0, 99) < current_app.config.get("GC_ON_SAVE_CHANCE", 100):
             self._clear_empty_entries(data)
             self._clear_past_hidden_entries(data)
 
-        with open(os.path.join(".", self.data_folder, "{}.json".format(filename)), "w+") as file:
-            json.dump(data, file)
+        path = self._calendar_path(filename)
+        if self._file_format() == serializer.FORMAT_JSON:
+            contents, offsets = self._serialize_calendar(data)
+            self._write_bytes(path, contents)
+            offsets["version"] = self._file_version(path)
+            self._write_file(self._offsets_path(filename), offsets)
+        else:
+            # compressed months can't be read alone
+            self._write_file(path, data)
+            if os.path.exists(self._offsets_path(filename)):
+                os.remove(self._offsets_path(filename))
+        # the snapshot now includes every journaled operation
+        if os.path.exists(self._journal_path(filename)):
+            os.remove(self._journal_path(filename))
+        # callers may keep working over data (e.g. several mutations in a request), so it cannot become the cached copy
+        calendar_cache.invalidate(path)
+        membership_index(self.data_folder).set(filename, self._stored_version(filename), self.users_list(data=data))
+
+    @staticmethod
+    def _write_file(path: str, contents: Dict) -> None:
+        CalendarData._write_bytes(path, serializer.dumps(contents, CalendarData._file_format()))
+
+    @staticmethod
+    def _write_bytes(path: str, contents: bytes) -> None:
+        write_atomically(path, contents)
+
+    # Calendar JSON, plus the byte offsets of its normal tasks object and of each month object in it ("year-month" keys)
+    @staticmethod
+    def _serialize_calendar(data: Dict) -> Tuple[bytes, Dict]:
+        placeholder = uuid.uuid4().hex
+        root = dict(data)
+        root[KEY_TASKS] = dict(data[KEY_TASKS])
+        root[KEY_TASKS][KEY_NORMAL_TASK] = placeholder
+        head, tail = serializer.dumps(root).split(serializer.dumps(placeholder), 1)
+
+        pieces = [head, b"{"]
+        length = len(head) + 1
+        months_offsets = {}
+        for year_index, (year_str, months) in enumerate(data[KEY_TASKS][KEY_NORMAL_TASK].items()):
+            pieces.append((b"," if year_index > 0 else b"") + serializer.dumps(year_str) + b":{")
+            length += len(pieces[-1])
+            for month_index, (month_str, days) in enumerate(months.items()):
+                pieces.append((b"," if month_index > 0 else b"") + serializer.dumps(month_str) + b":")
+                length += len(pieces[-1])
+                pieces.append(serializer.dumps(days))
+                months_offsets["{}-{}".format(year_str, month_str)] = (length, length + len(pieces[-1]))
+                length += len(pieces[-1])
+            pieces.append(b"}")
+            length += 1
+        pieces.extend([b"}", tail])
+
+        return b"".join(pieces), {"normal": (len(head), length + 1), "months": months_offsets}
+
+    def _append_to_journal(self, calendar_id: str, operations: List[Dict]) -> None:
+        previous_version = self._stored_version(calendar_id)
+        with open(self._journal_path(calendar_id), "ab") as journal:
+            journal.write(b"".join(serializer.dumps(operation) + b"\n" for operation in operations))
+            journal.flush()
+            os.fsync(journal.fileno())
+        calendar_cache.invalidate(self._calendar_path(calendar_id))
+        # operations never change calendar users, so a still valid membership entry only needs the new version
+        index = membership_index(self.data_folder)
+        users = index.users(calendar_id, previous_version)
+        if users is not None:
+            index.set(calendar_id, self._stored_version(calendar_id), users)
+
+    @staticmethod
+    def _journal_max_operations() -> int:
+        # outside of the app (e.g. scripts) calendars are always saved whole
+        if not has_app_context():
+            return 0
+        return cast(int, current_app.config.get("CALENDAR_JOURNAL_MAX_OPERATIONS", 0))
+
+    @staticmethod
+    def _file_format() -> str:
+        if not has_app_context():
+            return serializer.FORMAT_JSON
+        return cast(str, current_app.config.get("DATA_FILE_FORMAT", serializer.FORMAT_JSON))
+
+    # Number of journaled operations. Also drops any interrupted append, so the next one starts on its own line.
+    # Callers must hold the calendar lock.
+    def _check_journal(self, calendar_id: str) -> int:
+        try:
+            with open(self._journal_path(calendar_id), "r+b") as journal:
+                contents = journal.read()
+                if not contents.endswith(b"\n"):
+                    journal.truncate(contents.rfind(b"\n") + 1)
+                return contents.count(b"\n")
+        except FileNotFoundError:
+            return 0
+
+    def _load_stored_calendar(self, filename: str) -> Dict:
+        if not os.path.exists(self._journal_path(filename)):
+            # snapshots are replaced atomically, so reading one alone is always consistent
+            return self._read_calendar(self._calendar_path(filename), filename)
+        # a compaction in between could otherwise replay the journal over a snapshot that already includes it
+        with self._calendar_lock(filename, shared=True):
+            return self._read_journaled_calendar(filename)
+
+    # Last snapshot plus the journaled operations. Callers must hold the calendar lock.
+    def _read_journaled_calendar(self, filename: str) -> Dict:
+        data = self._read_calendar(self._calendar_path(filename), filename)
+        self._apply_operations_to(data, self._journaled_operations(filename))
+        return data
+
+    def _journaled_operations(self, filename: str) -> List[Dict]:
+        try:
+            with open(self._journal_path(filename), "rb") as journal:
+                # an unfinished line is an interrupted append, not an operation
+                return [serializer.loads(line) for line in journal if line.endswith(b"\n")]
+        except FileNotFoundError:
+            return []
+
+    # Calendar with only the normal tasks of the given (year, month) months (plus those needed to replay the journal),
+    # or None if the saved month offsets don't match the calendar file (e.g. never saved with them, or edited by hand)
+    def _load_stored_months(self, filename: str, months: Set[Tuple[int, int]]) -> Optional[Dict]:
+        if not os.path.exists(self._journal_path(filename)):
+            return self._read_months(filename, months)
+        with self._calendar_lock(filename, shared=True):
+            operations = self._journaled_operations(filename)
+            months = set(months)
+            for operation in operations:
+                if operation["type"] in [OPERATION_DELETE_TASK, OPERATION_MOVE_TASK, OPERATION_UPDATE_TASK]:
+                    # what these do depends on the tasks of their month
+                    if operation["year"] is None:
+                        return None
+                    months.add((int(operation["year"]), int(operation["month"])))
+            data = self._read_months(filename, months)
+            if data is None:
+                return None
+            self._apply_operations_to(data, operations)
+            return data
+
+    def _read_months(self, filename: str, months: Set[Tuple[int, int]]) -> Optional[Dict]:
+        try:
+            offsets = serializer.load(self._offsets_path(filename))
+        except FileNotFoundError:
+            return None
+        with open(self._calendar_path(filename), "rb") as file:
+            stat = os.fstat(file.fileno())
+            if [stat.st_mtime_ns, stat.st_size, stat.st_ino] != offsets["version"]:
+                return None
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+                normal_start, normal_end = offsets["normal"]
+                data = serializer.loads(contents[:normal_start] + b"{}" + contents[normal_end:])
+                normal_tasks = data[KEY_TASKS][KEY_NORMAL_TASK]
+                for year, month in months:
+                    month_offsets = offsets["months"].get("{}-{}".format(year, month))
+                    if month_offsets is not None:
+                        month_start, month_end = month_offsets
+                        month_tasks = serializer.loads(contents[month_start:month_end])
+                        normal_tasks.setdefault(str(year), {})[str(month)] = month_tasks
+        return cast(Dict, data)
+
+    # Snapshot file version, followed by the journal file version if there is one
+    def _stored_version(self, filename: str) -> Tuple[int, ...]:
+        version = self._file_version(self._calendar_path(filename))
+        try:
+            return version + self._file_version(self._journal_path(filename))
+        except FileNotFoundError:
+            return version
+
+    # Excludes other processes and threads working on the calendar (shared for readers, exclusive for writers)
+    @contextmanager
+    def _calendar_lock(self, filename: str, shared: bool = False) -> Iterator[None]:
+        with file_lock(os.path.join(".", self.data_folder, ".{}.lock".format(filename)), shared):
+            yield
+
+    # Ids of the stored calendars (might include other JSON files of the data folder)
+    def _calendar_ids(self) -> List[str]:
+        return [
+            os.path.splitext(os.path.basename(path))[0]
+            for path in glob.glob(os.path.join(".", self.data_folder, "*.json"))
+        ]
+
+    def _calendar_path(self, filename: str) -> str:
+        return os.path.join(".", self.data_folder, "{}.json".format(filename))
+
+    def _offsets_path(self, filename: str) -> str:
+        return os.path.join(".", self.data_folder, ".{}.offsets".format(filename))
+
+    @staticmethod
+    def _months_between(start: date, end: date) -> List[Tuple[int, int]]:
+        months = []
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return months
+
+    def _journal_path(self, filename: str) -> str:
+        return os.path.join(".", self.data_folder, "{}.journal".format(filename))
+
+    @staticmethod
+    def _file_version(path: str) -> Tuple[int, int, int]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    @staticmethod
+    def _read_calendar(path: str, filename: str) -> Dict:
+        contents = serializer.load(path)
+        if type(contents) is not dict:
+            raise ValueError("Error loading calendar from file '{}'".format(filename))
+        return contents
 
     @staticmethod
     def _clear_empty_entries(data: Dict) -> None:
@@ -0,0 +1,27 @@
+import fcntl
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+
+# Written aside and atomically renamed, so readers (of any process) see either the previous or the new file, never a
+# partial one
+def write_atomically(path: str, contents: bytes) -> None:
+    temporary_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary_path, "wb") as file:
+        file.write(contents)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+# flock() locks belong to the open file, so they exclude both other processes and other threads of this one. Files
+# replaced on save would lose them, hence locking a separate file.
+@contextmanager
+def file_lock(lock_path: str, shared: bool = False) -> Iterator[None]:
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
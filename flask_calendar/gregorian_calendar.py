@@ -1,6 +1,22 @@
 import calendar
 from datetime import date, datetime, timedelta
-from typing import Iterable, List, Tuple
+from functools import lru_cache
+from typing import Tuple
+
+# a few years of months for each first weekday
+MONTH_GRID_CACHE_SIZE = 512
+
+MonthGrid = Tuple[Tuple[date, ...], Tuple[Tuple[int, ...], ...]]
+
+
+# Days shown by a month view (whole weeks, so including days of adjacent months), and its weeks as rows of days of the
+# month (0 for days of other months). Grids never change, so they are computed once and shared by all callers.
+@lru_cache(maxsize=MONTH_GRID_CACHE_SIZE)
+def month_grid(year: int, month: int, first_weekday: int) -> MonthGrid:
+    month_calendar = calendar.Calendar(first_weekday)
+    days = tuple(month_calendar.itermonthdates(year, month))
+    weeks = tuple(tuple(week) for week in month_calendar.monthdayscalendar(year, month))
+    return days, weeks
 
 
 class GregorianCalendar:
@@ -20,10 +36,6 @@ class GregorianCalendar:
         "December",
     ]
 
-    @staticmethod
-    def setfirstweekday(weekday: int) -> None:
-        calendar.setfirstweekday(weekday)
-
     @staticmethod
     def previous_month_and_year(year: int, month: int) -> Tuple[int, int]:
         previous_month_date = date(year, month, 1) - timedelta(days=2)
@@ -40,10 +52,11 @@ class GregorianCalendar:
         today_date = datetime.date(datetime.now())
         return today_date.day, today_date.month, today_date.year
 
+    # Week start is always explicit (instead of the `calendar` module global setting), so threads can use different ones
     @staticmethod
-    def month_days(year: int, month: int) -> Iterable[date]:
-        return calendar.Calendar(calendar.firstweekday()).itermonthdates(year, month)
+    def month_days(year: int, month: int, first_weekday: int) -> Tuple[date, ...]:
+        return month_grid(year, month, first_weekday)[0]
 
     @staticmethod
-    def month_days_with_weekday(year: int, month: int) -> List[List[int]]:
-        return calendar.Calendar(calendar.firstweekday()).monthdayscalendar(year, month)
+    def month_days_with_weekday(year: int, month: int, first_weekday: int) -> Tuple[Tuple[int, ...], ...]:
+        return month_grid(year, month, first_weekday)[1]
@@ -0,0 +1,276 @@
+import calendar
+from datetime import date, datetime, time, timedelta
+from datetime import timezone as datetime_timezone
+from datetime import tzinfo
+from typing import Dict, Iterator, List, Optional, Set, Tuple  # noqa: F401
+
+from flask_calendar.calendar_data import (
+    KEY_NORMAL_TASK,
+    KEY_REPETITIVE_HIDDEN_TASK,
+    KEY_REPETITIVE_TASK,
+    KEY_TASKS,
+    CalendarData,
+)
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover
+    ZoneInfo = None  # type: ignore
+
+PRODUCT_ID = "-//flask-calendar//ICS export//EN"
+CONTENT_TYPE = "text/calendar; charset=utf-8"
+# by `date.weekday()`
+WEEKDAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+# in bytes, longer content lines get folded
+MAX_LINE_LENGTH = 75
+# details of tasks created without any
+EMPTY_DETAILS = "&nbsp;"
+UTC = datetime_timezone.utc
+
+
+# First and last day of the exported months, starting with the one of the given day
+def export_range(today: date, months: int) -> Tuple[date, date]:
+    year, month = today.year, today.month + max(months, 1) - 1
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return today.replace(day=1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+# ICS feed of the calendar between both dates, as chunks of CRLF terminated lines (an event each) so it can be streamed.
+# Normal tasks are single events, repetitive ones a recurring event each (from its first ocurrence in the range) with
+# their hidden ocurrences as exception dates. Timed events are in the given timezone, defined in the feed itself as
+# clients only know the ones they are given (or, without zoneinfo to define it, in the local time of each client).
+# Weekdays of repetitive tasks are week columns of the month view, so the same first weekday must be used for them to
+# fall on the same days.
+def ics_chunks(
+    calendar_id: str,
+    data: Dict,
+    start: date,
+    end: date,
+    first_weekday: int,
+    timezone: str,
+    timestamp: datetime,
+) -> Iterator[str]:
+    zone = _zone(timezone)
+    timezone_lines = [] if zone is None else _timezone_lines(timezone, zone, start, end)
+    tzid = None if zone is None else timezone
+    yield _chunk(
+        [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:{}".format(PRODUCT_ID),
+            "CALSCALE:GREGORIAN",
+            "X-WR-CALNAME:{}".format(_escape(calendar_id)),
+            "X-WR-TIMEZONE:{}".format(timezone),
+        ]
+        + timezone_lines
+    )
+    dtstamp = "DTSTAMP:{}".format(timestamp.strftime("%Y%m%dT%H%M%SZ"))
+
+    normal_tasks = data[KEY_TASKS][KEY_NORMAL_TASK]
+    for year_str, months in sorted(normal_tasks.items(), key=lambda item: int(item[0])):
+        for month_str, days in sorted(months.items(), key=lambda item: int(item[0])):
+            for day_str, day_tasks in sorted(days.items(), key=lambda item: int(item[0])):
+                task_date = date(int(year_str), int(month_str), int(day_str))
+                if not start <= task_date <= end:
+                    continue
+                for task in day_tasks:
+                    uid = "{}-{}-{}@flask-calendar".format(calendar_id, task["id"], task_date.strftime("%Y%m%d"))
+                    yield _chunk(_event_lines(task, task_date, uid, dtstamp, tzid))
+
+    hidden_tasks = data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK]
+    for task in data[KEY_TASKS][KEY_REPETITIVE_TASK]:
+        first_date = _first_ocurrence(task, start, end, first_weekday)
+        if first_date is None:
+            continue
+        if task["repetition_type"] == CalendarData.REPETITION_TYPE_WEEKLY:
+            rule = "FREQ=WEEKLY;BYDAY={}".format(WEEKDAY_CODES[first_date.weekday()])
+        elif task["repetition_subtype"] == CalendarData.REPETITION_SUBTYPE_WEEK_DAY:
+            rule = "FREQ=MONTHLY;BYDAY=1{}".format(WEEKDAY_CODES[first_date.weekday()])
+        else:
+            rule = "FREQ=MONTHLY;BYMONTHDAY={}".format(first_date.day)
+        uid = "{}-repetition-{}@flask-calendar".format(calendar_id, task["id"])
+        lines = _event_lines(task, first_date, uid, dtstamp, tzid)
+        # like the start, a date for all day events and a date time for the rest, in UTC unless the start is local time
+        if task["is_all_day"]:
+            until = end.strftime("%Y%m%d")
+        elif zone is None:
+            until = end.strftime("%Y%m%dT235959")
+        else:
+            until = datetime.combine(end, time(23, 59, 59), zone).astimezone(UTC).strftime("%Y%m%dT%H%M%SZ")
+        lines.insert(-1, "RRULE:{};UNTIL={}".format(rule, until))
+        for hidden_date in _hidden_ocurrences(task, hidden_tasks.get(str(task["id"]), {}), start, end, first_weekday):
+            lines.insert(-1, _exception_date(task, hidden_date, tzid))
+        yield _chunk(lines)
+
+    yield _chunk(["END:VCALENDAR"])
+
+
+def _event_lines(task: Dict, task_date: date, uid: str, dtstamp: str, tzid: Optional[str]) -> List[str]:
+    lines = ["BEGIN:VEVENT", "UID:{}".format(uid), dtstamp]
+    if task["is_all_day"]:
+        lines.append("DTSTART;VALUE=DATE:{}".format(task_date.strftime("%Y%m%d")))
+        lines.append("DTEND;VALUE=DATE:{}".format((task_date + timedelta(days=1)).strftime("%Y%m%d")))
+    else:
+        lines.append(_date_time("DTSTART", task_date, task["start_time"], tzid))
+        end_time = task.get("end_time", task["start_time"])
+        # tasks without an end time have it equal to the start one, so events without duration
+        if end_time > task["start_time"]:
+            lines.append(_date_time("DTEND", task_date, end_time, tzid))
+    lines.append("SUMMARY:{}".format(_escape(task["title"])))
+    if task["details"] and task["details"] != EMPTY_DETAILS:
+        lines.append("DESCRIPTION:{}".format(_escape(task["details"])))
+    lines.append("END:VEVENT")
+    return lines
+
+
+def _exception_date(task: Dict, hidden_date: date, tzid: Optional[str]) -> str:
+    if task["is_all_day"]:
+        return "EXDATE;VALUE=DATE:{}".format(hidden_date.strftime("%Y%m%d"))
+    return _date_time("EXDATE", hidden_date, task["start_time"], tzid)
+
+
+# Zone of that name, unless zoneinfo (Python 3.9+) or its time zone data are missing
+def _zone(timezone: str) -> Optional[tzinfo]:
+    if ZoneInfo is None:
+        return None
+    try:
+        return ZoneInfo(timezone)
+    except (KeyError, ValueError):  # ZoneInfoNotFoundError is a KeyError
+        return None
+
+
+# VTIMEZONE with the offset in effect when the range starts and each change of it until the range ends, found day by
+# day and then to the second. Enough for events and their recurrences, all of which are in the range.
+def _timezone_lines(timezone: str, zone: tzinfo, start: date, end: date) -> List[str]:
+    def offset(seconds: int) -> Optional[timedelta]:
+        return datetime.fromtimestamp(seconds, zone).utcoffset()
+
+    first = int(datetime.combine(start - timedelta(days=1), time(), UTC).timestamp())
+    last = int(datetime.combine(end + timedelta(days=2), time(), UTC).timestamp())
+    lines = ["BEGIN:VTIMEZONE", "TZID:{}".format(timezone)] + _observance_lines(zone, first, offset(first))
+    for day_start in range(first, last, 86400):
+        before, after = day_start, day_start + 86400
+        if offset(before) == offset(after):
+            continue
+        while after - before > 1:
+            middle = (before + after) // 2
+            if offset(middle) == offset(before):
+                before = middle
+            else:
+                after = middle
+        lines += _observance_lines(zone, after, offset(before))
+    lines.append("END:VTIMEZONE")
+    return lines
+
+
+# Observance starting at that moment, with its start in the local time before it
+def _observance_lines(zone: tzinfo, seconds: int, offset_from: Optional[timedelta]) -> List[str]:
+    local = datetime.fromtimestamp(seconds, zone)
+    local_before = datetime.fromtimestamp(seconds, UTC) + (offset_from or timedelta())
+    kind = "DAYLIGHT" if local.dst() else "STANDARD"
+    return [
+        "BEGIN:{}".format(kind),
+        "DTSTART:{}".format(local_before.strftime("%Y%m%dT%H%M%S")),
+        "TZOFFSETFROM:{}".format(_utc_offset(offset_from)),
+        "TZOFFSETTO:{}".format(_utc_offset(local.utcoffset())),
+        "TZNAME:{}".format(local.tzname()),
+        "END:{}".format(kind),
+    ]
+
+
+def _utc_offset(offset: Optional[timedelta]) -> str:
+    seconds = int((offset or timedelta()).total_seconds())
+    hours, seconds = divmod(abs(seconds), 3600)
+    return "{}{:02d}{:02d}".format("-" if offset and offset < timedelta() else "+", hours, seconds // 60)
+
+
+# Ocurrence of a monthly repetitive task in the given month, if it has any
+def _monthly_ocurrence(task: Dict, year: int, month: int, first_weekday: int) -> Optional[date]:
+    month_first_weekday, days_in_month = calendar.monthrange(year, month)
+    if task["repetition_subtype"] == CalendarData.REPETITION_SUBTYPE_WEEK_DAY:
+        weekday = (first_weekday + task["repetition_value"]) % 7
+        return date(year, month, 1 + (weekday - month_first_weekday) % 7)
+    if 1 <= task["repetition_value"] <= days_in_month:
+        return date(year, month, task["repetition_value"])
+    return None
+
+
+def _first_ocurrence(task: Dict, start: date, end: date, first_weekday: int) -> Optional[date]:
+    if task["repetition_type"] == CalendarData.REPETITION_TYPE_WEEKLY:
+        weekday = (first_weekday + task["repetition_value"]) % 7
+        first_date = start + timedelta(days=(weekday - start.weekday()) % 7)  # type: Optional[date]
+    elif task["repetition_type"] == CalendarData.REPETITION_TYPE_MONTHLY:
+        first_date = None
+        year, month = start.year, start.month
+        while first_date is None and (year, month) <= (end.year, end.month):
+            first_date = _monthly_ocurrence(task, year, month, first_weekday)
+            if first_date is not None and first_date < start:
+                first_date = None
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    else:
+        # other repetitions never show in month views either
+        return None
+    if first_date is None or first_date > end:
+        return None
+    return first_date
+
+
+# Weekly ocurrences are hidden per day, monthly ones whenever their month has any hidden day
+def _hidden_ocurrences(task: Dict, hidden: Dict, start: date, end: date, first_weekday: int) -> List[date]:
+    hidden_dates = set()  # type: Set[date]
+    for year_str, months in hidden.items():
+        for month_str, days in months.items():
+            year, month = int(year_str), int(month_str)
+            if task["repetition_type"] == CalendarData.REPETITION_TYPE_WEEKLY:
+                hidden_dates.update(date(year, month, int(day_str)) for day_str in days)
+            else:
+                ocurrence = _monthly_ocurrence(task, year, month, first_weekday)
+                if ocurrence is not None:
+                    hidden_dates.add(ocurrence)
+    return sorted(hidden_date for hidden_date in hidden_dates if start <= hidden_date <= end)
+
+
+# Date time property in that time zone, or local time of each client without any
+def _date_time(name: str, task_date: date, time_str: str, tzid: Optional[str]) -> str:
+    parameters = "" if tzid is None else ";TZID={}".format(tzid)
+    return "{}{}:{}".format(name, parameters, _local_time(task_date, time_str))
+
+
+def _local_time(task_date: date, time_str: str) -> str:
+    hours, minutes = time_str.split(":")[:2]
+    return "{}T{:02d}{:02d}00".format(task_date.strftime("%Y%m%d"), int(hours), int(minutes))
+
+
+def _escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+        .replace("\r", "\\n")
+    )
+
+
+# Content lines of up to MAX_LINE_LENGTH bytes, continued on lines starting with a space, without splitting characters
+def _fold(line: str) -> str:
+    if len(line.encode("utf-8")) <= MAX_LINE_LENGTH:
+        return line
+    parts = []  # type: List[str]
+    part = ""
+    part_length = 0
+    for character in line:
+        character_length = len(character.encode("utf-8"))
+        # continuation lines start with a space, which counts towards their length
+        if part_length + character_length > MAX_LINE_LENGTH - (1 if parts else 0):
+            parts.append(part)
+            part = ""
+            part_length = 0
+        part += character
+        part_length += character_length
+    parts.append(part)
+    return "\r\n ".join(parts)
+
+
+def _chunk(lines: List[str]) -> str:
+    return "".join(_fold(line) + "\r\n" for line in lines)
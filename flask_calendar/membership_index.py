@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple  # noqa: F401
+
+from flask_calendar.file_utils import write_atomically
+
+
+# Calendar id -> allowed usernames (and username -> calendar ids) table, persisted as a sidecar file in the data folder.
+# Each entry remembers the calendar file version it was read from, so calendars edited by hand are detected and
+# re-read instead of trusting a stale entry. Entries get added as calendars are checked, so the index only has every
+# calendar (is complete) once rebuilt from all of them.
+class MembershipIndex:
+
+    FILENAME = ".memberships.json"
+
+    def __init__(self, data_folder: str) -> None:
+        self.path = os.path.join(".", data_folder, self.FILENAME)
+        self.complete = False
+        self._calendars = {}  # type: Dict[str, Tuple[Tuple, FrozenSet[str]]]
+        self._user_calendars = {}  # type: Dict[str, Set[str]]
+        self._lock = threading.Lock()
+        self._load()
+
+    def users(self, calendar_id: str, version: Tuple) -> Optional[FrozenSet[str]]:
+        entry = self._calendars.get(calendar_id)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def user_calendars(self, username: str) -> List[str]:
+        with self._lock:
+            return sorted(self._user_calendars.get(username, set()))
+
+    def set(self, calendar_id: str, version: Tuple, users: Iterable[str]) -> None:
+        users_set = frozenset(users)
+        with self._lock:
+            previous_entry = self._calendars.get(calendar_id)
+            self._set_entry(calendar_id, version, users_set)
+            # only membership changes are persisted, version-only changes are cheap to recheck after a restart
+            if previous_entry is None or previous_entry[1] != users_set:
+                self._save()
+
+    def replace_all(self, entries: Dict[str, Tuple[Tuple, Iterable[str]]]) -> None:
+        with self._lock:
+            self._calendars = {}
+            self._user_calendars = {}
+            for calendar_id, (version, users) in entries.items():
+                self._set_entry(calendar_id, version, frozenset(users))
+            self.complete = True
+            self._save()
+
+    def _set_entry(self, calendar_id: str, version: Tuple, users: FrozenSet[str]) -> None:
+        previous_entry = self._calendars.get(calendar_id)
+        if previous_entry is not None:
+            for username in previous_entry[1] - users:
+                self._user_calendars[username].discard(calendar_id)
+        for username in users:
+            self._user_calendars.setdefault(username, set()).add(calendar_id)
+        self._calendars[calendar_id] = (version, users)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as file:
+            contents = json.load(file)
+        for calendar_id, entry in contents["calendars"].items():
+            self._set_entry(calendar_id, tuple(entry["version"]), frozenset(entry["users"]))
+        self.complete = contents.get("complete", False)
+
+    def _save(self) -> None:
+        contents = {
+            "complete": self.complete,
+            "calendars": {
+                calendar_id: {"version": list(version), "users": sorted(users)}
+                for calendar_id, (version, users) in self._calendars.items()
+            },
+        }
+        write_atomically(self.path, json.dumps(contents).encode("utf-8"))
+
+
+_indexes = {}  # type: Dict[str, MembershipIndex]
+_indexes_lock = threading.Lock()
+
+
+def membership_index(data_folder: str) -> MembershipIndex:
+    with _indexes_lock:
+        if data_folder not in _indexes:
+            _indexes[data_folder] = MembershipIndex(data_folder)
+        return _indexes[data_folder]
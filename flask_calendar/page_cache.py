@@ -0,0 +1,77 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple, cast  # noqa: F401
+
+DEFAULT_PAGE_CACHE_SIZE = 8 * 1024 * 1024
+
+
+# A rendered page and its strong ETag (a hash of its bytes)
+class RenderedPage:
+    def __init__(self, body: bytes) -> None:
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+
+
+# Per-process LRU of rendered pages, bounded by the total size in bytes of their bodies. Like `CalendarCache` entries,
+# pages are only valid while the version of the calendar they were rendered from matches the one they were stored with.
+class RenderedPageCache:
+    def __init__(self, max_size: int = DEFAULT_PAGE_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Tuple) -> Optional[RenderedPage]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cast(RenderedPage, entry[1])
+
+    def set(self, key: Hashable, version: Tuple, body: bytes) -> RenderedPage:
+        page = RenderedPage(body)
+        if len(body) > self.max_size:
+            return page
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, page)
+            self.size += len(body)
+            self._evict()
+        return page
+
+    def resize(self, max_size: int) -> None:
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "pages": len(self._entries), "size": self.size}
+
+    def _remove(self, key: Hashable) -> None:
+        _, page = self._entries.pop(key)
+        self.size -= len(page.body)
+
+    def _evict(self) -> None:
+        while self._entries and self.size > self.max_size:
+            _, (_, page) = self._entries.popitem(last=False)
+            self.size -= len(page.body)
+
+
+page_cache = RenderedPageCache()
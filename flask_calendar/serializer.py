@@ -0,0 +1,43 @@
+import json
+import zlib
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+FORMAT_JSON = "json"
+FORMAT_COMPRESSED = "compressed"
+FILE_FORMATS = [FORMAT_JSON, FORMAT_COMPRESSED]
+
+# Compressed files start with this header, followed by the zlib compressed JSON. JSON files never start with it, so
+# both can be read without knowing which format they were written with.
+COMPRESSED_HEADER = b"FCZ1"
+
+
+# Calendar and users files contents, in the given format. JSON is encoded with orjson when installed, as it's several
+# times faster than the standard library; both write the same data, so files remain interchangeable.
+def dumps(contents: Any, file_format: str = FORMAT_JSON) -> bytes:
+    if file_format not in FILE_FORMATS:
+        raise ValueError("Unknown file format '{}'".format(file_format))
+    if orjson is not None:
+        encoded = orjson.dumps(contents, option=orjson.OPT_NON_STR_KEYS)  # type: bytes
+    else:
+        encoded = json.dumps(contents).encode("utf-8")
+    if file_format == FORMAT_COMPRESSED:
+        return COMPRESSED_HEADER + zlib.compress(encoded)
+    return encoded
+
+
+def loads(contents: bytes) -> Any:
+    if contents.startswith(COMPRESSED_HEADER):
+        contents = zlib.decompress(contents.split(COMPRESSED_HEADER, 1)[1])
+    if orjson is not None:
+        return orjson.loads(contents)
+    return json.loads(contents)
+
+
+def load(path: str) -> Any:
+    with open(path, "rb") as file:
+        return loads(file.read())
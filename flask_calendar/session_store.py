@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple  # noqa: F401
+
+from cachelib.simple import SimpleCache
+
+from flask_calendar.sqlite_utils import thread_connection
+
+SESSION_LIFETIME = 2678400  # 1 month
+# failed logins are forgotten this many seconds after the last one, which also caps the delay between attempts
+FAILED_LOGINS_LIFETIME = 7200
+DEFAULT_SESSION_CACHE_SIZE = 1024
+# expired sessions are deleted all at once, at most every this many seconds
+SWEEP_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    -- seconds since epoch
+    expires INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);
+CREATE TABLE IF NOT EXISTS failed_logins (
+    key TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL,
+    -- seconds since epoch
+    next_attempt REAL NOT NULL,
+    expires INTEGER NOT NULL
+);
+"""
+
+
+# Seconds to wait after the given number of failed logins (base ^ (attempts - 1), so 1 second after the first one). The
+# first free attempts are not delayed at all.
+def failed_login_delay(attempts: int, delay_base: int, free_attempts: int = 0) -> float:
+    attempts -= free_attempts
+    if delay_base <= 0 or attempts <= 0:
+        return 0
+    return float(min(delay_base ** (attempts - 1), FAILED_LOGINS_LIFETIME))
+
+
+# Session id -> username of the logged in user, for SESSION_LIFETIME seconds. Also keeps track of failed logins (by any
+# key, e.g. username and address), so throttling them works across workers like sessions do.
+class SessionStore(ABC):
+    def __init__(self, data_folder: str, cache_size: int = DEFAULT_SESSION_CACHE_SIZE) -> None:
+        self.data_folder = data_folder
+        self.cache_size = cache_size
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set(self, session_id: str, username: str) -> None:
+        pass
+
+    # Seconds until another login attempt is allowed (0 if it already is)
+    @abstractmethod
+    def login_retry_after(self, key: str) -> float:
+        pass
+
+    @abstractmethod
+    def add_failed_login(self, key: str, delay_base: int, free_attempts: int = 0) -> None:
+        pass
+
+    @abstractmethod
+    def clear_failed_logins(self, key: str) -> None:
+        pass
+
+
+# Only known to the process that created the session (sessions are lost on restarts and other worker processes don't
+# see them). Suitable for single process deployments.
+class MemorySessionStore(SessionStore):
+    def __init__(self, data_folder: str, cache_size: int = DEFAULT_SESSION_CACHE_SIZE) -> None:
+        super().__init__(data_folder, cache_size)
+        self._cache = SimpleCache(threshold=cache_size, default_timeout=SESSION_LIFETIME)
+        self._failed_logins = SimpleCache(threshold=cache_size, default_timeout=FAILED_LOGINS_LIFETIME)
+        self._failed_logins_lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[str]:
+        username = self._cache.get(session_id)
+        return None if username is None else str(username)
+
+    def set(self, session_id: str, username: str) -> None:
+        self._cache.set(session_id, username)
+
+    def login_retry_after(self, key: str) -> float:
+        now = time.time()
+        entry = self._failed_logins.get(key)
+        if entry is None or entry[2] <= now:
+            return 0
+        return max(float(entry[1]) - now, 0)
+
+    def add_failed_login(self, key: str, delay_base: int, free_attempts: int = 0) -> None:
+        now = time.time()
+        with self._failed_logins_lock:
+            entry = self._failed_logins.get(key)
+            attempts = 1 if entry is None or entry[2] <= now else int(entry[0]) + 1
+            next_attempt = now + failed_login_delay(attempts, delay_base, free_attempts)
+            self._failed_logins.set(key, (attempts, next_attempt, now + FAILED_LOGINS_LIFETIME))
+
+    def clear_failed_logins(self, key: str) -> None:
+        self._failed_logins.delete(key)
+
+
+# Sessions kept in a SQLite database inside the given folder, shared by all worker processes and surviving restarts.
+# Found sessions are also kept in a small per-process LRU until they expire, so most checks don't query the database.
+class SqliteSessionStore(SessionStore):
+
+    DATABASE_FILENAME = "sessions.sqlite3"
+
+    def __init__(self, data_folder: str, cache_size: int = DEFAULT_SESSION_CACHE_SIZE) -> None:
+        super().__init__(data_folder, cache_size)
+        self.database_path = os.path.join(".", data_folder, self.DATABASE_FILENAME)
+        self._cache = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def get(self, session_id: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(session_id)  # type: Optional[Tuple[str, int]]
+            if entry is not None and entry[1] > now:
+                self._cache.move_to_end(session_id)
+                return entry[0]
+        row = (
+            self._connection()
+            .execute("SELECT username, expires FROM sessions WHERE id = ? AND expires > ?", (session_id, now))
+            .fetchone()
+        )
+        if row is None:
+            # not cached, so sessions created meanwhile by other processes are found right away
+            return None
+        self._cache_session(session_id, row[0], row[1])
+        return str(row[0])
+
+    def set(self, session_id: str, username: str) -> None:
+        now = time.time()
+        expires = int(now) + SESSION_LIFETIME
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (id, username, expires) VALUES (?, ?, ?)",
+                (session_id, username, expires),
+            )
+            if now - self._last_sweep > SWEEP_INTERVAL:
+                self._last_sweep = now
+                connection.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+                connection.execute("DELETE FROM failed_logins WHERE expires <= ?", (now,))
+        self._cache_session(session_id, username, expires)
+
+    def login_retry_after(self, key: str) -> float:
+        now = time.time()
+        row = (
+            self._connection()
+            .execute("SELECT next_attempt FROM failed_logins WHERE key = ? AND expires > ?", (key, now))
+            .fetchone()
+        )
+        if row is None:
+            return 0
+        return max(float(row[0]) - now, 0)
+
+    def add_failed_login(self, key: str, delay_base: int, free_attempts: int = 0) -> None:
+        now = time.time()
+        connection = self._connection()
+        # other workers could be counting failed logins of the same key meanwhile
+        connection.execute("BEGIN IMMEDIATE")
+        with connection:
+            row = connection.execute(
+                "SELECT attempts FROM failed_logins WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            attempts = 1 if row is None else int(row[0]) + 1
+            connection.execute(
+                "INSERT OR REPLACE INTO failed_logins (key, attempts, next_attempt, expires) VALUES (?, ?, ?, ?)",
+                (
+                    key,
+                    attempts,
+                    now + failed_login_delay(attempts, delay_base, free_attempts),
+                    int(now) + FAILED_LOGINS_LIFETIME,
+                ),
+            )
+
+    def clear_failed_logins(self, key: str) -> None:
+        with self._connection() as connection:
+            connection.execute("DELETE FROM failed_logins WHERE key = ?", (key,))
+
+    def _cache_session(self, session_id: str, username: str, expires: int) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[session_id] = (username, expires)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _connection(self) -> sqlite3.Connection:
+        return thread_connection(self.database_path, SCHEMA)
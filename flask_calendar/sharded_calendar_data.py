@@ -0,0 +1,231 @@
+import argparse
+import os
+import random
+import re
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple  # noqa: F401
+
+from flask import current_app
+
+import flask_calendar.serializer as serializer
+from flask_calendar.calendar_data import (
+    KEY_NORMAL_TASK,
+    KEY_TASKS,
+    KEY_USERS,
+    OPERATION_DELETE_TASK,
+    OPERATION_HIDE_REPETITION,
+    CalendarData,
+    calendar_cache,
+)
+from flask_calendar.membership_index import membership_index
+
+SHARD_FILENAME_REGEX = re.compile(r"^(\d+)-(\d+)\.json$")
+
+
+# Calendars stored as a folder per calendar inside the data folder: a root file with everything but normal tasks (users,
+# repetitive tasks, hidden repetitions...) plus a shard file per month with its normal tasks, as {day_str: [task, ...]}.
+# Month views only read the root and the shards of the months they show, and writes only rewrite the files they change.
+class ShardedCalendarData(CalendarData):
+
+    ROOT_FILENAME = "calendar.json"
+
+    def load_calendar(self, filename: str) -> Dict:
+        path = self._calendar_path(filename)
+        months = self._stored_months(filename)
+        version = self._shards_version(filename, months)
+        contents = calendar_cache.get(path, version)
+        if contents is None:
+            with self._calendar_lock(filename, shared=True):
+                contents = self._read_shards(filename, self._stored_months(filename))
+            calendar_cache.set(path, version, contents)
+        return contents
+
+    def load_calendar_for_update(self, filename: str) -> Dict:
+        self._stored_version(filename)
+        with self._calendar_lock(filename, shared=True):
+            return self._read_shards(filename, self._stored_months(filename))
+
+    def load_calendar_between(self, filename: str, start: date, end: date) -> Dict:
+        months = self._months_between(start, end)
+        key = "{}#{}#{}".format(self._calendar_path(filename), start.isoformat(), end.isoformat())
+        version = self._shards_version(filename, months)
+        contents = calendar_cache.get(key, version)
+        if contents is None:
+            with self._calendar_lock(filename, shared=True):
+                contents = self._read_shards(filename, months)
+            calendar_cache.set(key, version, contents)
+        return contents
+
+    # Other shards may change without affecting the given dates
+    def calendar_version(self, filename: str, start: date, end: date) -> Tuple:
+        return self._shards_version(filename, self._months_between(start, end))
+
+    def import_json_calendars(self, json_data_folder: Optional[str] = None) -> List[str]:
+        json_calendar_data = CalendarData(json_data_folder or self.data_folder)
+        imported = []
+        for calendar_id in sorted(json_calendar_data._calendar_ids()):
+            data = json_calendar_data.load_calendar_for_update(calendar_id)
+            if KEY_USERS not in data or KEY_TASKS not in data:
+                continue
+            self.save_calendar(data, calendar_id)
+            imported.append(calendar_id)
+        return imported
+
+    def export_json_calendars(self, json_data_folder: Optional[str] = None) -> List[str]:
+        json_calendar_data = CalendarData(json_data_folder or self.data_folder)
+        exported = []
+        for calendar_id in sorted(self._calendar_ids()):
+            self._write_file(json_calendar_data._calendar_path(calendar_id), self.load_calendar_for_update(calendar_id))
+            # it would be replayed over a calendar that already has its operations
+            if os.path.exists(json_calendar_data._journal_path(calendar_id)):
+                os.remove(json_calendar_data._journal_path(calendar_id))
+            exported.append(calendar_id)
+        return exported
+
+    # Users live in the root file alone
+    def update_calendar_users(
+        self, calendar_id: str, added_users: Iterable[str] = (), removed_users: Iterable[str] = ()
+    ) -> None:
+        with self._calendar_lock(calendar_id):
+            root = self._read_calendar(self._calendar_path(calendar_id), calendar_id)
+            if not self._update_users_list(root, added_users, removed_users):
+                return
+            self._write_file(self._calendar_path(calendar_id), root)
+        calendar_cache.invalidate(self._calendar_path(calendar_id))
+        membership_index(self.data_folder).set(calendar_id, self._stored_version(calendar_id), root[KEY_USERS])
+
+    # Replaces the whole calendar, only meant for conversions
+    def save_calendar(self, data: Dict, calendar_id: str) -> None:
+        os.makedirs(self._calendar_folder(calendar_id), exist_ok=True)
+        with self._calendar_lock(calendar_id):
+            for year, month in self._stored_months(calendar_id):
+                os.remove(self._shard_path(calendar_id, year, month))
+            for year_str, months in data[KEY_TASKS][KEY_NORMAL_TASK].items():
+                for month_str, days in months.items():
+                    days = {day_str: day_tasks for day_str, day_tasks in days.items() if day_tasks}
+                    if days:
+                        self._write_file(self._shard_path(calendar_id, int(year_str), int(month_str)), days)
+            self._write_file(self._calendar_path(calendar_id), self._root(data))
+        calendar_cache.invalidate(self._calendar_path(calendar_id))
+
+    # Only reads and writes the root and the shards of the months the operations refer to
+    def _apply_operations(self, calendar_id: str, operations: List[Dict]) -> None:
+        with self._calendar_lock(calendar_id):
+            previous_version = self._stored_version(calendar_id)
+            months = set()  # type: Set[Tuple[int, int]]
+            for operation in operations:
+                if operation["type"] == OPERATION_HIDE_REPETITION:
+                    continue
+                if operation["type"] == OPERATION_DELETE_TASK and operation["year"] is None:
+                    months.update(self._stored_months(calendar_id))
+                for year_key, month_key in [("year", "month"), ("new_year", "new_month")]:
+                    if operation.get(year_key) is not None:
+                        months.add((int(operation[year_key]), int(operation[month_key])))
+
+            current_data = self._read_shards(calendar_id, sorted(months))
+            # operations modify repetitive tasks and hidden repetitions in place, hence comparing the serialized root
+            previous_root = serializer.dumps(self._root(current_data))
+            previous_shards = {month: self._shard(current_data, *month) for month in months}
+
+            if self._apply_operations_to(current_data, operations):
+                if random.randint(0, 99) < current_app.config.get("GC_ON_SAVE_CHANCE", 100):
+                    self._clear_past_hidden_entries(current_data)
+                for year, month in sorted(months):
+                    shard = self._shard(current_data, year, month)
+                    if shard == previous_shards[(year, month)]:
+                        continue
+                    if shard:
+                        self._write_file(self._shard_path(calendar_id, year, month), shard)
+                    elif os.path.exists(self._shard_path(calendar_id, year, month)):
+                        os.remove(self._shard_path(calendar_id, year, month))
+                root = self._root(current_data)
+                if serializer.dumps(root) != previous_root:
+                    self._write_file(self._calendar_path(calendar_id), root)
+                calendar_cache.invalidate(self._calendar_path(calendar_id))
+                # operations never change calendar users, so a still valid membership entry only needs the new version
+                index = membership_index(self.data_folder)
+                users = index.users(calendar_id, previous_version)
+                if users is not None:
+                    index.set(calendar_id, self._stored_version(calendar_id), users)
+
+    def _read_shards(self, calendar_id: str, months: List[Tuple[int, int]]) -> Dict:
+        data = self._read_calendar(self._calendar_path(calendar_id), calendar_id)
+        normal_tasks = {}  # type: Dict
+        for year, month in months:
+            try:
+                normal_tasks.setdefault(str(year), {})[str(month)] = serializer.load(
+                    self._shard_path(calendar_id, year, month)
+                )
+            except FileNotFoundError:
+                continue
+        data[KEY_TASKS][KEY_NORMAL_TASK] = normal_tasks
+        return data
+
+    # Root file contents: the calendar without its normal tasks
+    @staticmethod
+    def _root(data: Dict) -> Dict:
+        root = dict(data)
+        root[KEY_TASKS] = dict(data[KEY_TASKS])
+        root[KEY_TASKS][KEY_NORMAL_TASK] = {}
+        return root
+
+    # Shard file contents: normal tasks of the month, without empty days
+    @staticmethod
+    def _shard(data: Dict, year: int, month: int) -> Dict:
+        days = data[KEY_TASKS][KEY_NORMAL_TASK].get(str(year), {}).get(str(month), {})
+        return {day_str: list(day_tasks) for day_str, day_tasks in days.items() if day_tasks}
+
+    # Root file version, followed by the (year, month, file version) of each of the given shards
+    def _shards_version(self, calendar_id: str, months: List[Tuple[int, int]]) -> Tuple:
+        shard_versions = []
+        for year, month in months:
+            try:
+                shard_versions.append((year, month) + self._file_version(self._shard_path(calendar_id, year, month)))
+            except FileNotFoundError:
+                continue
+        return self._stored_version(calendar_id) + tuple(shard_versions)
+
+    # Normal tasks live in shards, so the root file version is enough for memberships
+    def _stored_version(self, filename: str) -> Tuple[int, ...]:
+        return self._file_version(self._calendar_path(filename))
+
+    def _stored_months(self, calendar_id: str) -> List[Tuple[int, int]]:
+        months = []
+        for filename in os.listdir(self._calendar_folder(calendar_id)):
+            match = SHARD_FILENAME_REGEX.match(filename)
+            if match is not None:
+                months.append((int(match.group(1)), int(match.group(2))))
+        return sorted(months)
+
+    def _calendar_ids(self) -> List[str]:
+        return [
+            filename
+            for filename in os.listdir(os.path.join(".", self.data_folder))
+            if os.path.exists(os.path.join(self._calendar_folder(filename), self.ROOT_FILENAME))
+        ]
+
+    def _calendar_folder(self, calendar_id: str) -> str:
+        return os.path.join(".", self.data_folder, calendar_id)
+
+    def _calendar_path(self, filename: str) -> str:
+        return os.path.join(self._calendar_folder(filename), self.ROOT_FILENAME)
+
+    def _shard_path(self, calendar_id: str, year: int, month: int) -> str:
+        return os.path.join(self._calendar_folder(calendar_id), "{}-{}.json".format(year, month))
+
+
+if __name__ == "__main__":
+    # Converts the calendars of the configured data folder between the single file and the sharded layouts
+    import config
+
+    parser = argparse.ArgumentParser(description="Convert calendars between single file and sharded layouts")
+    parser.add_argument("--to-json", action="store_true", help="convert sharded calendars back to single files")
+    arguments = parser.parse_args()
+
+    sharded_calendar_data = ShardedCalendarData(config.DATA_FOLDER)
+    if arguments.to_json:
+        for calendar_id in sharded_calendar_data.export_json_calendars():
+            print("Exported calendar '{}'".format(calendar_id))
+    else:
+        for calendar_id in sharded_calendar_data.import_json_calendars():
+            print("Sharded calendar '{}'".format(calendar_id))
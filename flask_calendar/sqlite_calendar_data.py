@@ -0,0 +1,409 @@
+import glob
+import json
+import os
+import random
+import sqlite3
+from datetime import date, datetime
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from flask import current_app
+
+import flask_calendar.constants as constants
+from flask_calendar.calendar_data import (
+    KEY_NORMAL_TASK,
+    KEY_REPETITIVE_HIDDEN_TASK,
+    KEY_REPETITIVE_TASK,
+    KEY_TASKS,
+    KEY_USERS,
+    OPERATION_CREATE_TASK,
+    OPERATION_DELETE_TASK,
+    OPERATION_HIDE_REPETITION,
+    OPERATION_MOVE_TASK,
+    OPERATION_UPDATE_TASK,
+    CalendarData,
+    calendar_cache,
+)
+from flask_calendar.sqlite_utils import thread_connection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendars (
+    id TEXT PRIMARY KEY,
+    -- any other calendar top-level keys (like "name"), as JSON
+    extra TEXT NOT NULL,
+    -- increased on every write, validates cached calendars
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS calendar_users (
+    calendar_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (calendar_id, username)
+);
+CREATE INDEX IF NOT EXISTS calendar_users_username ON calendar_users (username);
+-- normal tasks have a date, repetitive ones don't. seq keeps the order of tasks within a day (or repetitive list)
+CREATE TABLE IF NOT EXISTS tasks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    calendar_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    year INTEGER,
+    month INTEGER,
+    day INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_date ON tasks (calendar_id, year, month, day);
+CREATE INDEX IF NOT EXISTS tasks_id ON tasks (calendar_id, id);
+CREATE TABLE IF NOT EXISTS hidden_repetitions (
+    calendar_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    year TEXT NOT NULL,
+    month TEXT NOT NULL,
+    day TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, task_id, year, month, day)
+);
+"""
+
+
+# Calendars stored in a SQLite database inside the data folder instead of one JSON file each. Loaded calendars have the
+# same shape as JSON ones, but writes only touch the affected rows and month views only read the months they show.
+class SqliteCalendarData(CalendarData):
+
+    DATABASE_FILENAME = "calendars.sqlite3"
+
+    def __init__(self, data_folder: str, first_weekday: int = constants.WEEK_START_DAY_MONDAY) -> None:
+        super().__init__(data_folder=data_folder, first_weekday=first_weekday)
+        self.database_path = os.path.join(".", data_folder, self.DATABASE_FILENAME)
+
+    def load_calendar(self, filename: str) -> Dict:
+        cache_key = "{}#{}".format(self.database_path, filename)
+        version = (self._calendar_version(filename),)
+        contents = calendar_cache.get(cache_key, version)
+        if contents is None:
+            contents = self._read_calendar_rows(filename)
+            calendar_cache.set(cache_key, version, contents)
+        return contents
+
+    def load_calendar_for_update(self, filename: str) -> Dict:
+        return self._read_calendar_rows(filename)
+
+    def load_calendar_between(self, filename: str, start: date, end: date) -> Dict:
+        return self._read_calendar_rows(filename, start=start, end=end)
+
+    def calendar_version(self, filename: str, start: date, end: date) -> Tuple:
+        return (self._calendar_version(filename),)
+
+    def calendar_users(self, calendar_id: str) -> FrozenSet[str]:
+        # raises FileNotFoundError for unknown calendars, like JSON ones
+        self._calendar_version(calendar_id)
+        rows = (
+            self._connection()
+            .execute("SELECT username FROM calendar_users WHERE calendar_id = ?", (calendar_id,))
+            .fetchall()
+        )
+        return frozenset(row[0] for row in rows)
+
+    def user_calendars(self, username: str) -> List[str]:
+        rows = (
+            self._connection()
+            .execute("SELECT calendar_id FROM calendar_users WHERE username = ? ORDER BY calendar_id", (username,))
+            .fetchall()
+        )
+        return [row[0] for row in rows]
+
+    def rebuild_membership_index(self) -> None:
+        # memberships are a table already
+        pass
+
+    def update_calendar_users(
+        self, calendar_id: str, added_users: Iterable[str] = (), removed_users: Iterable[str] = ()
+    ) -> None:
+        self._calendar_version(calendar_id)
+        connection = self._connection()
+        # users of the calendar are read and written back, others could be adding or removing some meanwhile
+        connection.execute("BEGIN IMMEDIATE")
+        with connection:
+            rows = connection.execute(
+                "SELECT username FROM calendar_users WHERE calendar_id = ? ORDER BY position", (calendar_id,)
+            ).fetchall()
+            data = {KEY_USERS: [row[0] for row in rows]}
+            if not self._update_users_list(data, added_users, removed_users):
+                return
+            connection.execute("DELETE FROM calendar_users WHERE calendar_id = ?", (calendar_id,))
+            connection.executemany(
+                "INSERT INTO calendar_users (calendar_id, username, position) VALUES (?, ?, ?)",
+                [(calendar_id, username, position) for position, username in enumerate(data[KEY_USERS])],
+            )
+            connection.execute("UPDATE calendars SET version = version + 1 WHERE id = ?", (calendar_id,))
+
+    def import_json_calendars(self, json_data_folder: Optional[str] = None) -> List[str]:
+        json_calendar_data = CalendarData(json_data_folder or self.data_folder)
+        imported = []
+        for path in sorted(glob.glob(os.path.join(".", json_calendar_data.data_folder, "*.json"))):
+            calendar_id = os.path.splitext(os.path.basename(path))[0]
+            data = json_calendar_data.load_calendar_for_update(calendar_id)
+            if KEY_USERS not in data or KEY_TASKS not in data:
+                continue
+            self.save_calendar(data, calendar_id)
+            imported.append(calendar_id)
+        return imported
+
+    # Replaces the whole calendar, only meant for imports
+    def save_calendar(self, data: Dict, calendar_id: str) -> None:
+        extra = {key: value for key, value in data.items() if key not in [KEY_USERS, KEY_TASKS]}
+        with self._connection() as connection:
+            connection.execute("DELETE FROM calendar_users WHERE calendar_id = ?", (calendar_id,))
+            connection.execute("DELETE FROM tasks WHERE calendar_id = ?", (calendar_id,))
+            connection.execute("DELETE FROM hidden_repetitions WHERE calendar_id = ?", (calendar_id,))
+            connection.execute(
+                "INSERT INTO calendars (id, extra, version) VALUES (?, ?, 0) "
+                "ON CONFLICT (id) DO UPDATE SET extra = excluded.extra, version = version + 1",
+                (calendar_id, json.dumps(extra)),
+            )
+            connection.executemany(
+                "INSERT INTO calendar_users (calendar_id, username, position) VALUES (?, ?, ?)",
+                [(calendar_id, username, position) for position, username in enumerate(data[KEY_USERS])],
+            )
+            for year_str, months in data[KEY_TASKS][KEY_NORMAL_TASK].items():
+                for month_str, days in months.items():
+                    for day_str, day_tasks in days.items():
+                        for task in day_tasks:
+                            self._insert_task(connection, calendar_id, task, year_str, month_str, day_str)
+            for task in data[KEY_TASKS][KEY_REPETITIVE_TASK]:
+                self._insert_task(connection, calendar_id, task)
+            connection.executemany(
+                "INSERT INTO hidden_repetitions (calendar_id, task_id, year, month, day) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (calendar_id, task_id, year_str, month_str, day_str)
+                    for task_id, years in data[KEY_TASKS][KEY_REPETITIVE_HIDDEN_TASK].items()
+                    for year_str, months in years.items()
+                    for month_str, days in months.items()
+                    for day_str in days
+                ],
+            )
+
+    def _apply_operations(self, calendar_id: str, operations: List[Dict]) -> None:
+        self._calendar_version(calendar_id)
+        connection = self._connection()
+        # operations read the rows they change, which other workers could be changing meanwhile
+        connection.execute("BEGIN IMMEDIATE")
+        with connection:
+            changed = False
+            for operation in operations:
+                changed = self._execute_operation(connection, calendar_id, operation) or changed
+            if changed:
+                connection.execute("UPDATE calendars SET version = version + 1 WHERE id = ?", (calendar_id,))
+                if random.randint(0, 99) < current_app.config.get("GC_ON_SAVE_CHANCE", 100):
+                    self._delete_past_hidden_repetitions(connection, calendar_id)
+
+    def _execute_operation(self, connection: sqlite3.Connection, calendar_id: str, operation: Dict) -> bool:
+        operation_type = operation["type"]
+
+        if operation_type == OPERATION_CREATE_TASK:
+            self._insert_task(
+                connection, calendar_id, operation["task"], operation["year"], operation["month"], operation["day"]
+            )
+            return True
+
+        if operation_type == OPERATION_DELETE_TASK:
+            if operation["year"] is None:
+                cursor = connection.execute(
+                    "DELETE FROM tasks WHERE calendar_id = ? AND id = ? AND year IS NOT NULL",
+                    (calendar_id, operation["id"]),
+                )
+            else:
+                cursor = connection.execute(
+                    "DELETE FROM tasks WHERE calendar_id = ? AND year = ? AND month = ? AND day = ? AND id = ?",
+                    (
+                        calendar_id,
+                        int(operation["year"]),
+                        int(operation["month"]),
+                        int(operation["day"]),
+                        operation["id"],
+                    ),
+                )
+            if cursor.rowcount > 0:
+                return True
+            # not a normal task of that day, so try with repetitive ones
+            cursor = connection.execute(
+                "DELETE FROM tasks WHERE seq = "
+                "(SELECT MIN(seq) FROM tasks WHERE calendar_id = ? AND id = ? AND year IS NULL)",
+                (calendar_id, operation["id"]),
+            )
+            if cursor.rowcount == 0:
+                return False
+            connection.execute(
+                "DELETE FROM hidden_repetitions WHERE calendar_id = ? AND task_id = ?",
+                (calendar_id, str(operation["id"])),
+            )
+            return True
+
+        if operation_type == OPERATION_MOVE_TASK:
+            year, month = int(operation["year"]), int(operation["month"])
+            row = connection.execute(
+                "SELECT seq, data FROM tasks WHERE calendar_id = ? AND year = ? AND month = ? AND day = ? AND id = ? "
+                "ORDER BY seq LIMIT 1",
+                (calendar_id, year, month, int(operation["day"]), operation["id"]),
+            ).fetchone()
+            if row is None:
+                return False
+            # re-inserted so it goes last in its new day, like in JSON calendars
+            connection.execute("DELETE FROM tasks WHERE seq = ?", (row[0],))
+            self._insert_task(
+                connection, calendar_id, json.loads(row[1]), operation["year"], operation["month"], operation["new_day"]
+            )
+            return True
+
+        if operation_type == OPERATION_UPDATE_TASK:
+            self._update_task(connection, calendar_id, operation)
+            return True
+
+        if operation_type == OPERATION_HIDE_REPETITION:
+            connection.execute(
+                "INSERT OR IGNORE INTO hidden_repetitions (calendar_id, task_id, year, month, day) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (calendar_id, operation["id"], operation["year"], operation["month"], operation["day"]),
+            )
+            return True
+
+        raise ValueError("Unknown operation '{}'".format(operation_type))
+
+    # Same outcome as CalendarData._apply_update_operation, touching only the rows of the task. Must run holding the
+    # write lock (see _apply_operations), else a concurrent change could move the row after reading it.
+    def _update_task(self, connection: sqlite3.Connection, calendar_id: str, operation: Dict) -> None:
+        task = operation["task"]
+        row = connection.execute(
+            "SELECT seq FROM tasks WHERE calendar_id = ? AND year = ? AND month = ? AND day = ? AND id = ? "
+            "ORDER BY seq LIMIT 1",
+            (calendar_id, int(operation["year"]), int(operation["month"]), int(operation["day"]), operation["id"]),
+        ).fetchone()
+        if row is not None:
+            if (operation["new_year"], operation["new_month"], operation["new_day"]) == (
+                operation["year"],
+                operation["month"],
+                operation["day"],
+            ):
+                connection.execute("UPDATE tasks SET data = ? WHERE seq = ?", (json.dumps(task), row[0]))
+                return
+            connection.execute("DELETE FROM tasks WHERE seq = ?", (row[0],))
+        else:
+            row = connection.execute(
+                "SELECT seq, data FROM tasks WHERE calendar_id = ? AND id = ? AND year IS NULL ORDER BY seq LIMIT 1",
+                (calendar_id, operation["id"]),
+            ).fetchone()
+            if row is not None:
+                if self._repetition_changed(json.loads(row[1]), task):
+                    connection.execute(
+                        "DELETE FROM hidden_repetitions WHERE calendar_id = ? AND task_id = ?",
+                        (calendar_id, str(operation["id"])),
+                    )
+                if operation["new_year"] is None:
+                    connection.execute("UPDATE tasks SET data = ? WHERE seq = ?", (json.dumps(task), row[0]))
+                    return
+                connection.execute("DELETE FROM tasks WHERE seq = ?", (row[0],))
+        self._insert_task(
+            connection, calendar_id, task, operation["new_year"], operation["new_month"], operation["new_day"]
+        )
+
+    def _read_calendar_rows(self, calendar_id: str, start: Optional[date] = None, end: Optional[date] = None) -> Dict:
+        connection = self._connection()
+        row = connection.execute("SELECT extra FROM calendars WHERE id = ?", (calendar_id,)).fetchone()
+        if row is None:
+            raise FileNotFoundError("Calendar '{}' not found".format(calendar_id))
+        data = json.loads(row[0])  # type: Dict
+        data[KEY_USERS] = [
+            user_row[0]
+            for user_row in connection.execute(
+                "SELECT username FROM calendar_users WHERE calendar_id = ? ORDER BY position", (calendar_id,)
+            )
+        ]
+
+        normal_tasks = {}  # type: Dict
+        if start is None or end is None:
+            task_rows = connection.execute(
+                "SELECT year, month, day, data FROM tasks WHERE calendar_id = ? AND year IS NOT NULL ORDER BY seq",
+                (calendar_id,),
+            )
+        else:
+            task_rows = connection.execute(
+                "SELECT year, month, day, data FROM tasks WHERE calendar_id = ? AND year BETWEEN ? AND ? ORDER BY seq",
+                (calendar_id, start.year, end.year),
+            )
+        for year, month, day, task in task_rows:
+            if start is not None and end is not None:
+                if (year, month) < (start.year, start.month) or (year, month) > (end.year, end.month):
+                    continue
+            month_tasks = normal_tasks.setdefault(str(year), {}).setdefault(str(month), {})
+            month_tasks.setdefault(str(day), []).append(json.loads(task))
+
+        hidden_tasks = {}  # type: Dict
+        for task_id, year_str, month_str, day_str in connection.execute(
+            "SELECT task_id, year, month, day FROM hidden_repetitions WHERE calendar_id = ?", (calendar_id,)
+        ):
+            hidden_tasks.setdefault(task_id, {}).setdefault(year_str, {}).setdefault(month_str, {})[day_str] = True
+
+        data[KEY_TASKS] = {
+            KEY_NORMAL_TASK: normal_tasks,
+            KEY_REPETITIVE_TASK: [
+                json.loads(task_row[0])
+                for task_row in connection.execute(
+                    "SELECT data FROM tasks WHERE calendar_id = ? AND year IS NULL ORDER BY seq", (calendar_id,)
+                )
+            ],
+            KEY_REPETITIVE_HIDDEN_TASK: hidden_tasks,
+        }
+        return data
+
+    def _calendar_version(self, calendar_id: str) -> int:
+        row = self._connection().execute("SELECT version FROM calendars WHERE id = ?", (calendar_id,)).fetchone()
+        if row is None:
+            raise FileNotFoundError("Calendar '{}' not found".format(calendar_id))
+        return int(row[0])
+
+    @staticmethod
+    def _insert_task(
+        connection: sqlite3.Connection,
+        calendar_id: str,
+        task: Dict,
+        year_str: Optional[str] = None,
+        month_str: Optional[str] = None,
+        day_str: Optional[str] = None,
+    ) -> None:
+        connection.execute(
+            "INSERT INTO tasks (calendar_id, id, year, month, day, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                calendar_id,
+                task["id"],
+                None if year_str is None else int(year_str),
+                None if month_str is None else int(month_str),
+                None if day_str is None else int(day_str),
+                json.dumps(task),
+            ),
+        )
+
+    def _delete_past_hidden_repetitions(self, connection: sqlite3.Connection, calendar_id: str) -> None:
+        _, current_month, current_year = self.gregorian_calendar.current_date()
+        # normalize to 1st day of month
+        current_date = datetime(current_year, current_month, 1, 0, 0)
+        rows = connection.execute(
+            "SELECT DISTINCT task_id, year, month FROM hidden_repetitions WHERE calendar_id = ?", (calendar_id,)
+        ).fetchall()
+        connection.executemany(
+            "DELETE FROM hidden_repetitions WHERE calendar_id = ? AND task_id = ? AND year = ? AND month = ?",
+            [
+                (calendar_id, task_id, year_str, month_str)
+                for task_id, year_str, month_str in rows
+                if (current_date - datetime(int(year_str), int(month_str), 1, 0, 0)).days
+                > current_app.config["DAYS_PAST_TO_KEEP_HIDDEN_TASKS"]
+            ],
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        return thread_connection(self.database_path, SCHEMA)
+
+
+if __name__ == "__main__":
+    # One-shot migration of the JSON calendars of the configured data folder into its SQLite database
+    import config
+
+    sqlite_calendar_data = SqliteCalendarData(config.DATA_FOLDER)
+    for imported_calendar_id in sqlite_calendar_data.import_json_calendars():
+        print("Imported calendar '{}'".format(imported_calendar_id))
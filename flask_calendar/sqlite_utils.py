@@ -0,0 +1,20 @@
+import sqlite3
+import threading
+from typing import Dict, Optional  # noqa: F401
+
+_connections = threading.local()
+
+
+# Connection of the current thread to the database at that path (sqlite3 connections can't be shared between threads),
+# opened on first use creating whatever the schema creates. WAL mode lets readers go on while another process writes.
+def thread_connection(database_path: str, schema: str) -> sqlite3.Connection:
+    connections = getattr(_connections, "by_path", None)  # type: Optional[Dict[str, sqlite3.Connection]]
+    if connections is None:
+        connections = _connections.by_path = {}
+    if database_path not in connections:
+        connection = sqlite3.connect(database_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(schema)
+        connections[database_path] = connection
+    return connections[database_path]
@@ -0,0 +1,133 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Tuple  # noqa: F401
+
+from flask_calendar.actions import get_authentication
+from flask_calendar.app import create_app
+from flask_calendar.app_utils import get_calendar_data
+from flask_calendar.authentication import Authentication
+from flask_calendar.calendar_data import CalendarData
+
+CSV_CALENDARS_SEPARATOR = " "
+
+
+# Users of a CSV file (with "username", "password", "default_calendar" and optionally "calendars" columns, calendars
+# separated by spaces) or a JSON file (a list of objects with the same keys, calendars as a list). Users are members of
+# their default calendar plus any other calendars listed.
+def read_users(path: str) -> List[Dict]:
+    with open(path, newline="") as file:
+        if os.path.splitext(path)[1].lower() == ".json":
+            rows = json.load(file)
+        else:
+            rows = list(csv.DictReader(file))
+    users = []
+    for row in rows:
+        calendars = row.get("calendars") or []
+        if isinstance(calendars, str):
+            calendars = calendars.split(CSV_CALENDARS_SEPARATOR)
+        users.append(
+            {
+                "username": row["username"],
+                "password": row["password"],
+                "default_calendar": row["default_calendar"],
+                "calendars": [calendar_id for calendar_id in calendars if calendar_id],
+            }
+        )
+    return users
+
+
+# Adds the users and their calendar memberships, with a single write of the users file and of each calendar. Returns
+# the calendar ids that don't exist (so had no users added).
+def import_users(authentication: Authentication, calendar_data: CalendarData, users: List[Dict]) -> List[str]:
+    usernames = [user["username"] for user in users]
+    if len(set(usernames)) != len(usernames):
+        raise ValueError("Repeated usernames")
+    authentication.add_users([(user["username"], user["password"], user["default_calendar"]) for user in users])
+
+    calendar_members = {}  # type: Dict[str, List[str]]
+    for user in users:
+        # keeps the order of the file, without repeating the default calendar if listed again
+        for calendar_id in dict.fromkeys([user["default_calendar"]] + user["calendars"]):
+            calendar_members.setdefault(calendar_id, []).append(user["username"])
+    return _update_calendars(calendar_data, calendar_members, added=True)
+
+
+# Deletes the users (each once, even if repeated) and removes them from the calendars they are members of. Returns those
+# calendar ids that don't exist anymore.
+def delete_users(authentication: Authentication, calendar_data: CalendarData, usernames: List[str]) -> List[str]:
+    usernames = list(dict.fromkeys(usernames))
+    unknown_usernames = [username for username in usernames if username not in authentication.contents]
+    if unknown_usernames:
+        raise ValueError("Unknown usernames: {}".format(", ".join(unknown_usernames)))
+    authentication.delete_users(usernames)
+
+    calendar_members = {}  # type: Dict[str, List[str]]
+    for username in usernames:
+        for calendar_id in calendar_data.user_calendars(username):
+            calendar_members.setdefault(calendar_id, []).append(username)
+    return _update_calendars(calendar_data, calendar_members, added=False)
+
+
+# (username, default calendar, calendars the user is member of) of every user
+def list_users(authentication: Authentication, calendar_data: CalendarData) -> List[Tuple[str, str, List[str]]]:
+    return [
+        (username, user["default_calendar"], calendar_data.user_calendars(username))
+        for username, user in sorted(authentication.contents.items())
+    ]
+
+
+def _update_calendars(calendar_data: CalendarData, calendar_members: Dict[str, List[str]], added: bool) -> List[str]:
+    missing_calendars = []
+    for calendar_id, members in sorted(calendar_members.items()):
+        try:
+            if added:
+                calendar_data.update_calendar_users(calendar_id, added_users=members)
+            else:
+                calendar_data.update_calendar_users(calendar_id, removed_users=members)
+        except FileNotFoundError:
+            missing_calendars.append(calendar_id)
+    return missing_calendars
+
+
+def main(arguments: Optional[List[str]] = None, config_overrides: Optional[Dict] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage users of the configured users and data folders")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="add the users of a CSV or JSON file")
+    import_parser.add_argument("path")
+    delete_parser = subparsers.add_parser("delete", help="delete users")
+    delete_parser.add_argument("usernames", nargs="*")
+    delete_parser.add_argument("--file", help="also delete the users of this CSV or JSON file")
+    subparsers.add_parser("list", help="list users and the calendars they are member of")
+    parsed_arguments = parser.parse_args(arguments)
+
+    app = create_app(config_overrides)
+    with app.app_context():
+        authentication = get_authentication()
+        calendar_data = get_calendar_data()
+        try:
+            if parsed_arguments.command == "import":
+                users = read_users(parsed_arguments.path)
+                missing_calendars = import_users(authentication, calendar_data, users)
+                print("Imported {} users".format(len(users)))
+            elif parsed_arguments.command == "delete":
+                usernames = list(parsed_arguments.usernames)
+                if parsed_arguments.file:
+                    usernames += [user["username"] for user in read_users(parsed_arguments.file)]
+                usernames = list(dict.fromkeys(usernames))
+                missing_calendars = delete_users(authentication, calendar_data, usernames)
+                print("Deleted {} users".format(len(usernames)))
+            else:
+                missing_calendars = []
+                for username, default_calendar, calendars in list_users(authentication, calendar_data):
+                    print("{}\t{}\t{}".format(username, default_calendar, " ".join(calendars)))
+        except ValueError as e:
+            sys.exit(str(e))
+        for calendar_id in missing_calendars:
+            print("Calendar '{}' not found, its users were not updated".format(calendar_id), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
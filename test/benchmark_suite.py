@@ -0,0 +1,467 @@
+# Times reading, month view building, rendering and requests, and every mutation of a synthetic calendar, with each
+# storage backend, plus encoding and decoding it with each serializer and decorating the links in task details. Also
+# records the peak memory of each. Results can be saved as JSON and compared against a previously saved baseline,
+# exiting with an error status if anything got slower than allowed. "Today" is fixed in the middle of the calendar so
+# runs are comparable any day.
+# Run it with `python -m test.benchmark_suite [--size large] [--output results.json] [--baseline baseline.json]`
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple  # noqa: F401
+from unittest.mock import patch
+
+from flask import Flask, render_template
+from flask.testing import FlaskClient
+
+import flask_calendar.constants as constants
+from flask_calendar.app import create_app
+from flask_calendar import serializer
+from flask_calendar.app_utils import (
+    STORAGE_BACKENDS,
+    decorated_task_details,
+    next_month_link,
+    previous_month_link,
+    task_details_for_markup,
+)
+from flask_calendar.calendar_data import CalendarData, calendar_cache
+from flask_calendar.gregorian_calendar import GregorianCalendar
+from flask_calendar.sharded_calendar_data import ShardedCalendarData
+from flask_calendar.sqlite_calendar_data import SqliteCalendarData
+from test.synthetic_calendar import FIRST_YEAR, synthetic_calendar
+
+CALENDAR_ID = "benchmark"
+# synthetic_calendar arguments
+SIZES = {
+    "small": {"years": 2, "tasks_per_day": 2, "repetitive_tasks": 10, "hidden_instances": 50, "multi_day_spans": 20},
+    "medium": {
+        "years": 10,
+        "tasks_per_day": 3,
+        "repetitive_tasks": 50,
+        "hidden_instances": 500,
+        "multi_day_spans": 200,
+    },
+    "large": {
+        "years": 30,
+        "tasks_per_day": 5,
+        "repetitive_tasks": 200,
+        "hidden_instances": 5000,
+        "multi_day_spans": 2000,
+    },
+}
+RUNS = 20
+# times the whole suite runs, each in a new process and over a new copy of the calendar, as timings of the same code
+# differ between processes (by up to twice as much) and drift while they run
+REPEATS = 5
+# relative slowdown of the fastest run flagged as a regression
+REGRESSION_THRESHOLD = 0.2
+# slowdowns of less milliseconds than this are noise, whatever their ratio
+NOISE_MS = 0.2
+# of the tasks whose details get decorated, with links as the synthetic calendar has none
+DETAILS_FORMAT = "Meeting notes at https://notes.test/{0}/?id={0} and the call at https://call.test/room-{0}"
+
+Benchmark = Callable[[int], object]
+
+
+# Milliseconds of calling the function with each run number, and peak MB allocated by one more run (traced apart, as
+# tracing slows it down). Without garbage collections, which would land on whichever run happens to trigger them (like
+# `timeit` does)
+def measure(function: Benchmark, runs: int) -> Tuple[List[float], float]:
+    timings = []
+    gc.collect()
+    gc.disable()
+    try:
+        for run in range(runs):
+            start = time.perf_counter()
+            function(run)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        gc.enable()
+    tracemalloc.start()
+    try:
+        function(runs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return timings, peak / 1024 / 1024
+
+
+def benchmarks(
+    calendar_data: CalendarData, client: FlaskClient, data: Dict, year: int, month: int
+) -> List[Tuple[str, Benchmark]]:
+    start, end = calendar_data.month_view_range(year, month)
+    month_str = str(month)
+    # tasks of the generated calendar to mutate, a different one each run
+    day_tasks = data["tasks"]["normal"][str(year)][month_str]
+    weekly_tasks = [
+        task for task in data["tasks"]["repetition"] if task["repetition_type"] == CalendarData.REPETITION_TYPE_WEEKLY
+    ]
+
+    def load_calendar(_: int) -> object:
+        calendar_cache.clear()
+        return calendar_data.load_calendar(CALENDAR_ID)
+
+    def load_calendar_between(_: int) -> object:
+        calendar_cache.clear()
+        return calendar_data.load_calendar_between(CALENDAR_ID, start, end)
+
+    def month_tasks_legacy(_: int) -> object:
+        view_data = calendar_data.load_calendar_between(CALENDAR_ID, start, end)
+        tasks = calendar_data.tasks_from_calendar(year, month, view_data)
+        return calendar_data.add_repetitive_tasks_from_calendar(year, month, view_data, tasks)
+
+    def month_tasks(_: int) -> object:
+        return calendar_data.month_tasks(year, month, calendar_data.load_calendar_between(CALENDAR_ID, start, end))
+
+    view_tasks = calendar_data.month_tasks(year, month, calendar_data.load_calendar_between(CALENDAR_ID, start, end))
+
+    def hide_past_tasks(_: int) -> None:
+        # replaces day lists and months, so copying the days is enough to start over each run
+        tasks = {month_str: dict(days) for month_str, days in view_tasks.items()}
+        calendar_data.hide_past_tasks(year, month, tasks)
+
+    def render_calendar_template(_: int) -> object:
+        tasks = calendar_data.month_tasks(year, month, calendar_data.load_calendar_between(CALENDAR_ID, start, end))
+        return render_template(
+            "calendar.html",
+            calendar_id=CALENDAR_ID,
+            year=year,
+            month=month,
+            month_name=GregorianCalendar.MONTH_NAMES[month - 1],
+            current_year=year,
+            current_month=month,
+            current_day=15,
+            month_days=GregorianCalendar.month_days(year, month, calendar_data.first_weekday),
+            previous_month_link=previous_month_link(year, month),
+            next_month_link=next_month_link(year, month),
+            base_url="",
+            tasks=tasks,
+            display_view_past_button=True,
+            weekdays_headers=["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"],
+        )
+
+    # whole request of a logged in user, with rendered pages not cached and the calendar read again
+    def month_view_request(_: int) -> None:
+        calendar_cache.clear()
+        assert client.get("/{}/?y={}&m={}".format(CALENDAR_ID, year, month)).status_code == 200
+
+    def create_task(run: int) -> None:
+        calendar_data.create_task(
+            calendar_id=CALENDAR_ID,
+            year=year,
+            month=month,
+            day=run % 28 + 1,
+            title="a new task",
+            is_all_day=True,
+            start_time="00:00",
+            details="",
+            color="#F0F0F0",
+            has_repetition=False,
+            repetition_type="",
+            repetition_subtype="",
+            repetition_value=0,
+        )
+
+    def create_multi_day_task(run: int) -> None:
+        calendar_data.create_tasks(
+            calendar_id=CALENDAR_ID,
+            dates=[(year, month, day) for day in range(run % 14 + 1, run % 14 + 8)],
+            title="a new multi-day task",
+            is_all_day=True,
+            start_time="00:00",
+            details="",
+            color="#F0F0F0",
+            has_repetition=False,
+            repetition_type="",
+            repetition_subtype="",
+            repetition_value=0,
+        )
+
+    # the same days as `create_multi_day_task`, saving each
+    def create_multi_day_task_day_by_day(run: int) -> None:
+        for day in range(run % 14 + 1, run % 14 + 8):
+            calendar_data.create_task(
+                calendar_id=CALENDAR_ID,
+                year=year,
+                month=month,
+                day=day,
+                title="a new multi-day task",
+                is_all_day=True,
+                start_time="00:00",
+                details="",
+                color="#F0F0F0",
+                has_repetition=False,
+                repetition_type="",
+                repetition_subtype="",
+                repetition_value=0,
+            )
+
+    def update_task(run: int) -> None:
+        task = day_tasks["1"][run % len(day_tasks["1"])]
+        calendar_data.update_task(
+            calendar_id=CALENDAR_ID,
+            year_str=str(year),
+            month_str=month_str,
+            day_str="1",
+            task_id=task["id"],
+            new_year=year,
+            new_month=month,
+            new_day=1,
+            title="updated {}".format(run),
+            is_all_day=True,
+            start_time="00:00",
+            details="",
+            color=task["color"],
+            has_repetition=False,
+            repetition_type="",
+            repetition_subtype="",
+            repetition_value=0,
+        )
+
+    # moves the first task of a day to the next one, and back on the following run
+    def update_task_day(run: int) -> None:
+        day = 3 + run // 2 * 2 % 20
+        from_day, to_day = (day, day + 1) if run % 2 == 0 else (day + 1, day)
+        calendar_data.update_task_day(
+            CALENDAR_ID, str(year), month_str, str(from_day), day_tasks[str(day)][0]["id"], str(to_day)
+        )
+
+    def delete_task(run: int) -> None:
+        day_str = str(run % 28 + 1)
+        calendar_data.delete_task(CALENDAR_ID, str(year), month_str, day_str, day_tasks[day_str][-1 - run // 28]["id"])
+
+    def delete_task_by_id(run: int) -> None:
+        next_month = data["tasks"]["normal"][str(year)][str(month % 12 + 1)]
+        calendar_data.delete_task_by_id(CALENDAR_ID, next_month[str(run % 28 + 1)][-1 - run // 28]["id"])
+
+    def hide_repetition_task_instance(run: int) -> None:
+        task = weekly_tasks[run % len(weekly_tasks)]
+        calendar_data.hide_repetition_task_instance(
+            CALENDAR_ID, str(year), month_str, str(run % 28 + 1), str(task["id"])
+        )
+
+    named_benchmarks = [
+        ("load_calendar", load_calendar),
+        ("load_calendar_between", load_calendar_between),
+        ("tasks_from_calendar+add_repetitive_tasks", month_tasks_legacy),
+        ("month_tasks", month_tasks),
+        ("hide_past_tasks", hide_past_tasks),
+        ("render_calendar_template", render_calendar_template),
+        ("month_view_request", month_view_request),
+        ("create_task", create_task),
+        ("create_multi_day_task", create_multi_day_task),
+        ("create_multi_day_task_day_by_day", create_multi_day_task_day_by_day),
+        ("update_task", update_task),
+        ("update_task_day", update_task_day),
+        ("delete_task", delete_task),
+        ("delete_task_by_id", delete_task_by_id),
+    ]  # type: List[Tuple[str, Benchmark]]
+    if weekly_tasks:
+        named_benchmarks.append(("hide_repetition_task_instance", hide_repetition_task_instance))
+    return named_benchmarks
+
+
+# Of whatever the storage backend, as "<group>.<benchmark>": encoding and decoding the whole calendar with each codec
+# calendar files can be written with, and decorating the details of the tasks of a month (with links) on every render
+# versus once. Needs an app context.
+def shared_benchmarks(data: Dict, year: int, month: int) -> List[Tuple[str, Benchmark]]:
+    codecs = [
+        ("json", lambda contents: json.dumps(contents).encode("utf-8"), json.loads),
+    ]  # type: List[Tuple[str, Callable[[Any], bytes], Callable[[bytes], Any]]]
+    if serializer.orjson is not None:
+        codecs.append(("orjson", serializer.orjson.dumps, serializer.orjson.loads))
+    codecs.append(
+        ("compressed", lambda contents: serializer.dumps(contents, serializer.FORMAT_COMPRESSED), serializer.loads)
+    )
+    named_benchmarks = []  # type: List[Tuple[str, Benchmark]]
+    for name, dumps, loads in codecs:
+        named_benchmarks += codec_benchmarks(name, dumps, loads, data)
+
+    details = [
+        DETAILS_FORMAT.format(task["id"])
+        for day_tasks in data["tasks"]["normal"][str(year)][str(month)].values()
+        for task in day_tasks
+    ]
+
+    def decorate_task_details(_: int) -> None:
+        decorated_task_details.cache_clear()
+        for task_details in details:
+            task_details_for_markup(task_details)
+
+    def decorated_task_details_again(_: int) -> None:
+        for task_details in details:
+            task_details_for_markup(task_details)
+
+    named_benchmarks.append(("markup.decorate_task_details", decorate_task_details))
+    named_benchmarks.append(("markup.decorated_task_details", decorated_task_details_again))
+    return named_benchmarks
+
+
+def codec_benchmarks(
+    name: str, dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any], data: Dict
+) -> List[Tuple[str, Benchmark]]:
+    encoded = dumps(data)
+    assert loads(encoded) == data
+    return [
+        ("serializer.{}_dumps".format(name), lambda _: dumps(data)),
+        ("serializer.{}_loads".format(name), lambda _: loads(encoded)),
+    ]
+
+
+# {"<name>": {"min_ms": ..., "median_ms": ..., "spread_ms": ..., "peak_mb": ...}} of each benchmark of each backend
+# and the shared ones, over the runs of every repeat. The spread is how far apart the fastest runs of the repeats are,
+# i.e. the noise between processes.
+def run_suite(
+    size: Dict, backends: List[str], runs: int, seed: int, repeats: int = REPEATS
+) -> Dict[str, Dict[str, float]]:
+    timings = {}  # type: Dict[str, List[List[float]]]
+    peaks = {}  # type: Dict[str, List[float]]
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        for repeat_results in pool.starmap(run_repeat, [(size, backends, runs, seed)] * repeats, chunksize=1):
+            for name, (runs_ms, peak_mb) in repeat_results.items():
+                timings.setdefault(name, []).append(runs_ms)
+                peaks.setdefault(name, []).append(peak_mb)
+    results = {}
+    for name, repeats_ms in timings.items():
+        fastest_runs_ms = [min(runs_ms) for runs_ms in repeats_ms]
+        results[name] = {
+            "min_ms": round(min(fastest_runs_ms), 4),
+            "median_ms": round(statistics.median(ms for runs_ms in repeats_ms for ms in runs_ms), 4),
+            "spread_ms": round(max(fastest_runs_ms) - min(fastest_runs_ms), 4),
+            "peak_mb": round(max(peaks[name]), 4),
+        }
+    return results
+
+
+def benchmark_app(data_folder: str, backend: str) -> Flask:
+    shutil.copy(os.path.join("users", "users.json"), data_folder)
+    return create_app(
+        {
+            "TESTING": True,
+            "DATA_FOLDER": data_folder,
+            "USERS_DATA_FOLDER": data_folder,
+            "STORAGE_BACKEND": backend,
+            "GC_ON_SAVE_CHANCE": 0,
+            "RENDERED_PAGE_CACHE_SIZE": 0,
+        }
+    )
+
+
+# {"<name>": ([ms of each run], peak MB)} of each benchmark of each backend, as "<backend>.<benchmark>", and the shared
+# ones
+def run_repeat(size: Dict, backends: List[str], runs: int, seed: int) -> Dict[str, Tuple[List[float], float]]:
+    data = synthetic_calendar(seed=seed, **size)
+    # "today" is the middle of the calendar, as is the month viewed and mutated
+    year, month = FIRST_YEAR + size["years"] // 2, 6
+    results = {}  # type: Dict[str, Tuple[List[float], float]]
+    with patch.object(GregorianCalendar, "current_date", return_value=(15, month, year)):
+        for backend in backends:
+            with tempfile.TemporaryDirectory() as data_folder:
+                app = benchmark_app(data_folder, backend)
+                client = app.test_client()
+                client.post("/do_login", data=dict(username="a_username", password="a_password"))
+                with app.test_request_context():
+                    # also writes the month offsets of JSON calendars, which the other backends import from
+                    CalendarData(data_folder)._save_calendar(data, CALENDAR_ID)
+                    calendar_data = STORAGE_BACKENDS[backend](data_folder, constants.WEEK_START_DAY_MONDAY)
+                    if isinstance(calendar_data, (ShardedCalendarData, SqliteCalendarData)):
+                        calendar_data.import_json_calendars()
+                    for name, function in benchmarks(calendar_data, client, data, year, month):
+                        results["{}.{}".format(backend, name)] = measure(function, runs)
+                calendar_cache.clear()
+        with tempfile.TemporaryDirectory() as data_folder, benchmark_app(data_folder, "json").app_context():
+            for name, function in shared_benchmarks(data, year, month):
+                results[name] = measure(function, runs)
+    return results
+
+
+# (name, baseline ms, current ms, is regression) of the benchmarks in both, by their fastest run. Medians move with the
+# load of the machine, so only slowdowns of the fastest run are regressions, and only if they are larger than the noise
+# floor and than the spread of either run (disk writes of the sharded backend vary more between processes than that).
+def compare(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float
+) -> List[Tuple[str, float, float, bool]]:
+    comparison = []
+    for name in sorted(set(results) & set(baseline)):
+        previous, current = baseline[name], results[name]
+        noise_ms = max(NOISE_MS, previous.get("spread_ms", 0), current.get("spread_ms", 0))
+        regression = (
+            current["min_ms"] > previous["min_ms"] * (1 + threshold)
+            and current["min_ms"] - previous["min_ms"] > noise_ms
+        )
+        comparison.append((name, previous["min_ms"], current["min_ms"], regression))
+    return comparison
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark CalendarData over a synthetic calendar")
+    parser.add_argument("--size", choices=sorted(SIZES), default="medium")
+    parser.add_argument("--backends", nargs="+", choices=sorted(STORAGE_BACKENDS), default=sorted(STORAGE_BACKENDS))
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results with the ones saved in this JSON file")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    arguments = parser.parse_args()
+
+    parameters = dict(
+        SIZES[arguments.size], size=arguments.size, runs=arguments.runs, repeats=arguments.repeats, seed=arguments.seed
+    )
+    results = run_suite(SIZES[arguments.size], arguments.backends, arguments.runs, arguments.seed, arguments.repeats)
+    print("{:>50} {:>10} {:>10} {:>12}".format("", "min", "median", "peak memory"))
+    for name, timings in results.items():
+        print(
+            "{:>50} {:>8.2f}ms {:>8.2f}ms {:>10.2f}MB".format(
+                name, timings["min_ms"], timings["median_ms"], timings["peak_mb"]
+            )
+        )
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(
+                {
+                    "parameters": parameters,
+                    "environment": {
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "orjson": serializer.orjson is not None,
+                    },
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+        if baseline["parameters"] != parameters:
+            print("Baseline parameters differ: {}".format(baseline["parameters"]))
+        print("\n{:>50} {:>10} {:>10} {:>8}".format("", "baseline", "current", "change"))
+        regressions = 0
+        for name, previous, current, regression in compare(results, baseline["results"], arguments.threshold):
+            regressions += regression
+            print(
+                "{:>50} {:>8.2f}ms {:>8.2f}ms {:>+7.0f}%{}".format(
+                    name,
+                    previous,
+                    current,
+                    (current / previous - 1) * 100 if previous else 0,
+                    " SLOWER" if regression else "",
+                )
+            )
+        if regressions:
+            sys.exit("{} benchmarks slower than {:.0%} over the baseline".format(regressions, arguments.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,41 @@
+import os
+import shutil
+from typing import Dict
+
 import pytest
 from flask import Flask
 from flask.testing import FlaskClient
 from flask_calendar.app import create_app
 
 
+# Copies of the sample calendars and users, as requests leave sessions, locks and indexes next to them (and may change
+# them), which must neither touch the repository ones nor carry over between tests
+@pytest.fixture
+def app_config(tmp_path: str) -> Dict:
+    data_folder = os.path.join(tmp_path, "data")
+    users_folder = os.path.join(tmp_path, "users")
+    shutil.copytree("data", data_folder, ignore=shutil.ignore_patterns(".*"))
+    os.makedirs(users_folder)
+    shutil.copy(os.path.join("users", "users.json"), users_folder)
+    return {
+        "TESTING": True,
+        "FAILED_LOGIN_DELAY_BASE": 0,
+        "DATA_FOLDER": data_folder,
+        "USERS_DATA_FOLDER": users_folder,
+    }
+
+
+# Same for the calendar fixtures, as just reading them writes lock files and the membership index
+@pytest.fixture
+def fixtures_folder(tmp_path: str) -> str:
+    folder = os.path.join(tmp_path, "fixtures")
+    shutil.copytree(os.path.join("test", "fixtures"), folder, ignore=shutil.ignore_patterns(".*"))
+    return folder
+
+
 @pytest.fixture
-def app() -> Flask:
-    return create_app({"TESTING": True, "FAILED_LOGIN_DELAY_BASE": 0})
+def app(app_config: Dict) -> Flask:
+    return create_app(app_config)
 
 
 @pytest.fixture
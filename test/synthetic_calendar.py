@@ -0,0 +1,93 @@
+import random
+from datetime import date, timedelta
+from typing import Dict, List  # noqa: F401
+
+from flask_calendar.calendar_data import CalendarData
+
+FIRST_YEAR = 2000
+YEARS_OF_TASKS = 5
+TASKS_PER_DAY = 2
+COLORS = ["#F0F0F0", "#FF4848", "#3EB34F", "#2966B8"]
+# (min, max) days of multi-day spans
+SPAN_DAYS = (2, 14)
+
+
+# Calendar with `tasks_per_day` all day tasks on days 1 to 28 of each month of `years` years since `first_year`, plus
+# `repetitive_tasks` weekly and monthly ones, `hidden_instances` hidden ocurrences of them and `multi_day_spans` tasks
+# spanning several days (a task per day, as multi-day tasks are stored). Extra tasks are placed by a random generator
+# seeded with `seed`, so the same arguments always generate the same calendar.
+def synthetic_calendar(
+    years: int = YEARS_OF_TASKS,
+    tasks_per_day: int = TASKS_PER_DAY,
+    repetitive_tasks: int = 0,
+    hidden_instances: int = 0,
+    multi_day_spans: int = 0,
+    first_year: int = FIRST_YEAR,
+    seed: int = 0,
+) -> Dict:
+    generator = random.Random(seed)
+    normal_tasks = {}  # type: Dict
+    task_id = 0
+    for year in range(first_year, first_year + years):
+        for month in range(1, 13):
+            for day in range(1, 29):
+                day_tasks = normal_tasks.setdefault(str(year), {}).setdefault(str(month), {}).setdefault(str(day), [])
+                for _ in range(tasks_per_day):
+                    task_id += 1
+                    day_tasks.append(task(task_id, "task {}".format(task_id)))
+
+    first_day = date(first_year, 1, 1)
+    days = (date(first_year + years, 1, 1) - first_day).days
+    for span in range(multi_day_spans):
+        span_start = first_day + timedelta(days=generator.randrange(days))
+        color = generator.choice(COLORS)
+        for offset in range(generator.randint(*SPAN_DAYS)):
+            span_day = span_start + timedelta(days=offset)
+            task_id += 1
+            normal_tasks.setdefault(str(span_day.year), {}).setdefault(str(span_day.month), {}).setdefault(
+                str(span_day.day), []
+            ).append(task(task_id, "span {}".format(span), color=color))
+
+    repetitions = []  # type: List[Dict]
+    for _ in range(repetitive_tasks):
+        task_id += 1
+        repetition = task(task_id, "repetitive task {}".format(task_id), color=generator.choice(COLORS))
+        repetition_type, repetition_subtype = generator.choice(
+            [
+                (CalendarData.REPETITION_TYPE_WEEKLY, CalendarData.REPETITION_SUBTYPE_WEEK_DAY),
+                (CalendarData.REPETITION_TYPE_MONTHLY, CalendarData.REPETITION_SUBTYPE_WEEK_DAY),
+                (CalendarData.REPETITION_TYPE_MONTHLY, CalendarData.REPETITION_SUBTYPE_MONTH_DAY),
+            ]
+        )
+        repetition["repetition_type"] = repetition_type
+        repetition["repetition_subtype"] = repetition_subtype
+        if repetition_subtype == CalendarData.REPETITION_SUBTYPE_MONTH_DAY:
+            repetition["repetition_value"] = generator.randint(1, 28)
+        else:
+            repetition["repetition_value"] = generator.randrange(7)
+        repetitions.append(repetition)
+
+    hidden_repetitions = {}  # type: Dict
+    for _ in range(hidden_instances if repetitions else 0):
+        hidden_day = first_day + timedelta(days=generator.randrange(days))
+        hidden_repetitions.setdefault(str(generator.choice(repetitions)["id"]), {}).setdefault(
+            str(hidden_day.year), {}
+        ).setdefault(str(hidden_day.month), {})[str(hidden_day.day)] = True
+
+    return {
+        "users": ["a_username"],
+        "name": "Benchmark",
+        "tasks": {"normal": normal_tasks, "repetition": repetitions, "hidden_repetition": hidden_repetitions},
+    }
+
+
+def task(task_id: int, title: str, color: str = COLORS[0]) -> Dict:
+    return {
+        "id": task_id,
+        "color": color,
+        "start_time": "00:00",
+        "end_time": "00:00",
+        "is_all_day": True,
+        "title": title,
+        "details": "&nbsp;",
+    }
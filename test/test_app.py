@@ -1,7 +1,23 @@
+import gzip
+import re
+import threading
+import time
+from typing import Dict, List  # noqa: F401
+from unittest.mock import patch
+
 import pytest
+from flask import Flask
 from flask.testing import FlaskClient
 
-from flask_calendar.constants import SESSION_ID
+from flask_calendar import app_utils
+from flask_calendar.app import create_app
+from flask_calendar.authentication import PLACEHOLDER_ICS_KEY, USERNAME_FREE_FAILED_LOGINS
+from flask_calendar.calendar_data import CalendarData, calendar_cache
+from flask_calendar.constants import SESSION_ID, WEEK_START_DAY_MONDAY, WEEK_START_DAY_SUNDAY
+from flask_calendar.page_cache import page_cache
+
+# of the sample user
+ICS_KEY = "76a703efa94f4ab4878f97e454d1cd5f"
 
 
 @pytest.mark.parametrize(
@@ -50,3 +66,286 @@ def test_redirects_to_calendar_when_logged_in(client: FlaskClient) -> None:
     response = client.get("/")
     assert response.status_code == 302
     assert response.headers["Location"] in ["http://localhost/sample/", "/sample/"]
+
+
+@pytest.fixture
+def logged_in_client(client: FlaskClient) -> FlaskClient:
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    return client
+
+
+def test_calendar_is_parsed_at_most_once_per_request(logged_in_client: FlaskClient) -> None:
+    calendar_cache.clear()
+    read_calendar = CalendarData._read_calendar
+    with patch.object(CalendarData, "_read_calendar", side_effect=read_calendar) as read_mock:
+        response = logged_in_client.get("/sample/")
+    assert response.status_code == 200
+    assert read_mock.call_count == 1
+
+
+def test_modifying_request_journals_the_change_instead_of_rewriting_the_calendar(
+    logged_in_client: FlaskClient, app_config: Dict
+) -> None:
+    with patch.object(CalendarData, "_save_calendar") as save_mock:
+        response = logged_in_client.post("/sample/2017/12/1/0/hide/")
+    assert response.status_code == 200
+    save_mock.assert_not_called()
+    data = CalendarData(app_config["DATA_FOLDER"]).load_calendar("sample")
+    assert data["tasks"]["hidden_repetition"]["0"]["2017"]["12"]["1"] is True
+
+
+def test_unknown_calendar_is_not_found(logged_in_client: FlaskClient) -> None:
+    assert logged_in_client.get("/an_unknown_calendar/").status_code == 404
+
+
+def test_calendar_without_user_is_forbidden(logged_in_client: FlaskClient) -> None:
+    assert logged_in_client.get("/sample2/").status_code == 403
+
+
+def test_creates_a_task_on_every_day_of_the_range(logged_in_client: FlaskClient, app_config: Dict) -> None:
+    response = logged_in_client.post(
+        "/sample/new_task",
+        data=dict(
+            title="a vacation",
+            date="2018-01-30",
+            enddate="2018-02-02",
+            is_all_day="1",
+            start_time="00:00",
+            details="",
+            color="an_irrelevant_color",
+            repetition_value="0",
+        ),
+    )
+    assert response.status_code == 302
+
+    data = CalendarData(app_config["DATA_FOLDER"]).load_calendar("sample")
+    tasks = [
+        task
+        for month, day in [("1", "30"), ("1", "31"), ("2", "1"), ("2", "2")]
+        for task in data["tasks"]["normal"]["2018"][month][day]
+        if task["title"] == "a vacation"
+    ]
+    assert len(tasks) == 4
+    assert len(set(task["id"] for task in tasks)) == 4
+
+
+def test_deletes_task_without_its_date(logged_in_client: FlaskClient, app_config: Dict) -> None:
+    response = logged_in_client.delete("/sample/task/3/")
+    assert response.status_code == 200
+    data = CalendarData(app_config["DATA_FOLDER"]).load_calendar("sample")
+    assert [task["id"] for task in data["tasks"]["repetition"]] == [0, 1, 2]
+
+
+def test_threads_render_month_views_with_their_own_week_start(app_config: Dict) -> None:
+    # December 2017 view starts on Monday the 27th of November or on Sunday the 26th
+    expected_first_days = {WEEK_START_DAY_MONDAY: ("27", "MON"), WEEK_START_DAY_SUNDAY: ("26", "SUN")}
+    errors = []  # type: List[str]
+
+    def render_month_views(week_starting_day: int) -> None:
+        app = create_app({**app_config, "WEEK_STARTING_DAY": week_starting_day})
+        client = app.test_client()
+        client.post("/do_login", data=dict(username="a_username", password="a_password"))
+        for _ in range(25):
+            page = client.get("/sample/?y=2017&m=12").get_data(as_text=True)
+            first_day = re.search(r'id="calendar">\s*<li[^>]*data-day="(\d+)"', page)
+            first_header = re.search(r'class="weekday-header">(\w+)<', page)
+            if first_day is None or first_header is None:
+                errors.append("unexpected page")
+            elif (first_day.group(1), first_header.group(1)) != expected_first_days[week_starting_day]:
+                errors.append("{} starting week rendered as {}".format(week_starting_day, first_day.group(1)))
+
+    threads = [
+        threading.Thread(target=render_month_views, args=(week_starting_day,))
+        for week_starting_day in [WEEK_START_DAY_MONDAY, WEEK_START_DAY_SUNDAY] * 2
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_unchanged_month_view_is_not_modified(app: Flask, logged_in_client: FlaskClient, app_config: Dict) -> None:
+    response = logged_in_client.get("/sample/?y=2017&m=12")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    hits = page_cache.stats()["hits"]
+
+    response = logged_in_client.get("/sample/?y=2017&m=12", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert page_cache.stats()["hits"] == hits + 1
+    # other months of the view are other pages
+    assert logged_in_client.get("/sample/?y=2018&m=1", headers={"If-None-Match": etag}).status_code == 200
+
+    with app.app_context():
+        CalendarData(app_config["DATA_FOLDER"]).hide_repetition_task_instance("sample", "2017", "12", "4", "0")
+    response = logged_in_client.get("/sample/?y=2017&m=12", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.parametrize("session_backend, still_logged_in", [("sqlite", True), ("memory", False)])
+def test_sessions_survive_restarts_with_sqlite(app_config: Dict, session_backend: str, still_logged_in: bool) -> None:
+    config = {**app_config, "SESSION_BACKEND": session_backend}
+    client = create_app(config).test_client()
+    client.post("/do_login", data=dict(username="a_username", password="a_password"))
+    session_cookie = client.get_cookie(SESSION_ID)
+    assert session_cookie is not None
+
+    # a restarted (or another) worker process has none of the sessions in memory
+    with patch.dict(app_utils._session_stores, clear=True):
+        restarted_client = create_app(config).test_client()
+        restarted_client.set_cookie(SESSION_ID, session_cookie.value)
+        assert (restarted_client.get("/sample/").status_code == 200) is still_logged_in
+
+
+def test_failed_logins_are_rejected_without_holding_up_other_users(app_config: Dict) -> None:
+    app = create_app({**app_config, "FAILED_LOGIN_DELAY_BASE": 10})
+    statuses = []  # type: List[int]
+
+    def fail_logins() -> None:
+        client = app.test_client()
+        for _ in range(5):
+            response = client.post(
+                "/do_login",
+                data=dict(username="another_username", password="a_wrong_password"),
+                environ_base={"REMOTE_ADDR": "10.0.0.1"},
+            )
+            statuses.append(response.status_code)
+            if response.status_code == 429:
+                assert int(response.headers["Retry-After"]) > 0
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=fail_logins) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    # another user meanwhile
+    client = app.test_client()
+    assert client.post("/do_login", data=dict(username="a_username", password="a_password")).status_code == 302
+    for _ in range(5):
+        assert client.get("/sample/").status_code == 200
+    for thread in threads:
+        thread.join()
+
+    # a sleeping worker would have taken at least 1 + 10 + 100... seconds
+    assert time.perf_counter() - start < 5
+    assert statuses.count(429) >= 15
+    response = app.test_client().post(
+        "/do_login",
+        data=dict(username="another_username", password="a_password"),
+        environ_base={"REMOTE_ADDR": "10.0.0.1"},
+    )
+    assert response.status_code == 429
+
+
+def test_failed_logins_of_a_username_are_throttled_whatever_their_address(app_config: Dict) -> None:
+    app = create_app({**app_config, "FAILED_LOGIN_DELAY_BASE": 10})
+    client = app.test_client()
+
+    def login(password: str, address: str) -> int:
+        response = client.post(
+            "/do_login", data=dict(username="a_username", password=password), environ_base={"REMOTE_ADDR": address}
+        )
+        return int(response.status_code)
+
+    # a few mistyped passwords don't lock the user out of other addresses
+    assert login("a_wrong_password", "10.0.0.1") == 302
+    assert login("a_password", "10.0.0.2") == 302
+    for attempt in range(USERNAME_FREE_FAILED_LOGINS + 1):
+        assert login("a_wrong_password", "10.0.1.{}".format(attempt)) == 302
+    assert login("a_password", "10.0.2.1") == 429
+
+
+def test_api_returns_task_ocurrences_of_the_range(logged_in_client: FlaskClient) -> None:
+    logged_in_client.post(
+        "/sample/new_task",
+        data=dict(
+            title="a normal task",
+            date="2017-12-05",
+            enddate="2017-12-05",
+            is_all_day="1",
+            start_time="00:00",
+            details="",
+            color="an_irrelevant_color",
+            repetition_value="0",
+        ),
+    )
+
+    response = logged_in_client.get("/sample/api/tasks?from=2017-12-01&to=2017-12-31")
+    assert response.status_code == 200
+    assert response.mimetype == "application/json"
+    contents = response.get_json()
+    assert (contents["from"], contents["to"]) == ("2017-12-01", "2017-12-31")
+    tasks = contents["tasks"]
+    assert tasks
+    assert [task["date"] for task in tasks] == sorted(task["date"] for task in tasks)
+    assert all("2017-12-01" <= task["date"] <= "2017-12-31" for task in tasks)
+    assert {task["repeats"] for task in tasks} == {True, False}
+
+    response = logged_in_client.get("/sample/api/tasks?from=2017-12-01&to=2017-12-31&compact=1")
+    compact_tasks = response.get_json()["tasks"]
+    assert [(task["d"], task["i"], task["t"], task["r"]) for task in compact_tasks] == [
+        (task["date"], task["id"], task["title"], task["repeats"]) for task in tasks
+    ]
+
+
+@pytest.mark.parametrize(
+    "query", ["from=2017-12-01&to=a_date", "from=2017-12-31&to=2017-12-01", "from=2017-01-01&to=2018-12-31"]
+)
+def test_api_rejects_invalid_ranges(logged_in_client: FlaskClient, query: str) -> None:
+    assert logged_in_client.get("/sample/api/tasks?{}".format(query)).status_code == 400
+
+
+def test_api_requires_a_session(client: FlaskClient) -> None:
+    response = client.get("/sample/api/tasks", headers={"Accept": "application/json"})
+    assert response.status_code == 401
+
+
+def test_api_responses_are_compressed_and_revalidated(logged_in_client: FlaskClient) -> None:
+    url = "/sample/api/tasks?from=2017-01-01&to=2017-12-31"
+    body = logged_in_client.get(url).data
+
+    response = logged_in_client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == body
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+    response = logged_in_client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_ics_feed_requires_the_feature_and_an_ics_key_of_a_calendar_user(client: FlaskClient, app_config: Dict) -> None:
+    assert client.get("/sample/ics/{}".format(ICS_KEY)).status_code == 404
+
+    app = create_app({**app_config, "FEATURE_FLAG_ICAL_EXPORT": True})
+    client = app.test_client()
+    assert client.get("/sample/ics/an_unknown_ics_key").status_code == 404
+    assert client.get("/sample/ics/{}".format(PLACEHOLDER_ICS_KEY)).status_code == 404
+    assert client.get("/sample2/ics/{}".format(ICS_KEY)).status_code == 403
+    assert client.get("/an_unknown_calendar/ics/{}".format(ICS_KEY)).status_code == 404
+
+
+def test_ics_feed_is_streamed_and_then_cached(app_config: Dict) -> None:
+    app = create_app({**app_config, "FEATURE_FLAG_ICAL_EXPORT": True})
+    client = app.test_client()
+
+    response = client.get("/sample/ics/{}".format(ICS_KEY))
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert response.mimetype == "text/calendar"
+    feed = response.data
+    assert feed.startswith(b"BEGIN:VCALENDAR\r\n")
+    assert feed.endswith(b"END:VCALENDAR\r\n")
+    assert b"RRULE:" in feed
+
+    response = client.get("/sample/ics/{}".format(ICS_KEY))
+    assert response.data == feed
+    etag = response.headers["ETag"]
+    assert client.get("/sample/ics/{}".format(ICS_KEY), headers={"If-None-Match": etag}).status_code == 304
+
+    with app.app_context():
+        CalendarData(app_config["DATA_FOLDER"]).delete_task_by_id("sample", 0)
+    response = client.get("/sample/ics/{}".format(ICS_KEY), headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.data != feed
@@ -1,6 +1,6 @@
 import pytest
 from flask import Flask
-from flask_calendar.app_utils import task_details_for_markup
+from flask_calendar.app_utils import decorated_task_details, task_details_for_markup
 
 SOURCE_STRING_PLACEHOLDER = "pre {} post"
 EXPECTED_STRING_PLACEHOLDER = 'pre <a href="{}" target="_blank">{}</a> post'
@@ -43,3 +43,21 @@ def test_unsupported_task_details_for_markup(app: Flask, url: str, description:
         expected = EXPECTED_STRING_PLACEHOLDER.format(url, url)
         actual = task_details_for_markup(SOURCE_STRING_PLACEHOLDER.format(url))
         assert expected != actual
+
+
+def test_task_details_are_decorated_once_per_distinct_text(app: Flask) -> None:
+    decorated_task_details.cache_clear()
+    details = SOURCE_STRING_PLACEHOLDER.format("http://test.test")
+    with app.app_context():
+        for _ in range(3):
+            task_details_for_markup(details)
+            task_details_for_markup("without links")
+    assert decorated_task_details.cache_info().misses == 2
+    assert decorated_task_details.cache_info().hits == 4
+
+
+def test_task_details_are_not_decorated_when_disabled(app: Flask) -> None:
+    app.config["AUTO_DECORATE_TASK_DETAILS_HYPERLINK"] = False
+    details = SOURCE_STRING_PLACEHOLDER.format("http://test.test")
+    with app.app_context():
+        assert task_details_for_markup(details) == details
@@ -1,5 +1,12 @@
+import json
+import multiprocessing
+import os
+import shutil
+from unittest.mock import patch
+
 import pytest
-from flask_calendar.authentication import Authentication
+from flask_calendar import serializer
+from flask_calendar.authentication import PLACEHOLDER_ICS_KEY, Authentication
 
 EXISTING_USERNAME = "a_username"
 CORRECT_PASSWORD = "a_password"
@@ -34,3 +41,100 @@ def test_password_is_not_stored_plain(authentication: Authentication) -> None:
     user = authentication.user_data(username=EXISTING_USERNAME)
     assert user["password"] != CORRECT_PASSWORD
     assert user["password"] == authentication._hash_password(CORRECT_PASSWORD)
+
+
+def users_folder_authentication(data_folder: str) -> Authentication:
+    return Authentication(data_folder=data_folder, password_salt="a test salt", failed_login_delay_base=0)
+
+
+def test_users_file_is_parsed_once_while_unchanged(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "users.json"), os.path.join(tmp_path, "users.json"))
+    with patch("flask_calendar.serializer.load", wraps=serializer.load) as load:
+        for _ in range(3):
+            users_folder_authentication(str(tmp_path))
+        assert load.call_count == 1
+
+        # e.g. edited by hand
+        with open(os.path.join(tmp_path, "users.json")) as file:
+            contents = json.load(file)
+        contents["another_username"] = dict(contents[EXISTING_USERNAME], username="another_username")
+        with open(os.path.join(tmp_path, "users.json"), "w") as file:
+            json.dump(contents, file)
+
+        authentication = users_folder_authentication(str(tmp_path))
+        assert load.call_count == 2
+        assert authentication.user_data("another_username")["username"] == "another_username"
+
+
+def test_added_and_deleted_users_are_saved_and_seen_by_new_instances(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "users.json"), os.path.join(tmp_path, "users.json"))
+    users_folder_authentication(str(tmp_path)).add_user("a_new_username", "a_new_password", "a_calendar")
+
+    authentication = users_folder_authentication(str(tmp_path))
+    assert authentication.is_valid("a_new_username", "a_new_password")
+    with open(os.path.join(tmp_path, "users.json")) as file:
+        assert "a_new_username" in json.load(file)
+    assert sorted(os.listdir(tmp_path)) == [".users.lock", "users.json"]
+    with pytest.raises(ValueError):
+        authentication.add_user("a_new_username", "another_password", "a_calendar")
+
+    authentication.delete_user(EXISTING_USERNAME)
+    assert EXISTING_USERNAME not in authentication.contents
+    assert EXISTING_USERNAME not in users_folder_authentication(str(tmp_path)).contents
+    assert "a_new_username" in users_folder_authentication(str(tmp_path)).contents
+
+
+def _add_users_from_another_process(data_folder: str, worker: int, users_count: int) -> None:
+    for index in range(users_count):
+        users_folder_authentication(data_folder).add_user(
+            "user_{}_{}".format(worker, index), "a_password", "a_calendar"
+        )
+
+
+def test_users_added_by_several_processes_at_once_are_all_saved(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "users.json"), os.path.join(tmp_path, "users.json"))
+    workers_count = 4
+    users_count = 10
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_add_users_from_another_process, args=(str(tmp_path), worker, users_count))
+        for worker in range(workers_count)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    contents = users_folder_authentication(str(tmp_path)).contents
+    assert all(
+        "user_{}_{}".format(worker, index) in contents
+        for worker in range(workers_count)
+        for index in range(users_count)
+    )
+
+
+def test_ics_keys_identify_their_users(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "users.json"), os.path.join(tmp_path, "users.json"))
+    authentication = users_folder_authentication(str(tmp_path))
+    authentication.add_users([("user_1", "a_password", "a_calendar"), ("user_2", "a_password", "a_calendar")])
+
+    ics_keys = [authentication.user_data(username)["ics_key"] for username in ["user_1", "user_2"]]
+    assert ics_keys[0] != ics_keys[1]
+    assert authentication.ics_key_username(ics_keys[1]) == "user_2"
+    assert authentication.ics_key_username("an_unknown_ics_key") is None
+
+
+def test_placeholder_and_shared_ics_keys_identify_no_one(tmp_path: str) -> None:
+    shutil.copy(os.path.join("test", "fixtures", "users.json"), os.path.join(tmp_path, "users.json"))
+    authentication = users_folder_authentication(str(tmp_path))
+    authentication.add_users([("user_1", "a_password", "a_calendar"), ("user_2", "a_password", "a_calendar")])
+    contents = dict(authentication.contents)
+    contents[EXISTING_USERNAME] = dict(contents[EXISTING_USERNAME], ics_key=PLACEHOLDER_ICS_KEY)
+    contents["user_2"] = dict(contents["user_2"], ics_key=contents["user_1"]["ics_key"])
+    with open(os.path.join(tmp_path, "users.json"), "w") as file:
+        json.dump(contents, file)
+
+    authentication = users_folder_authentication(str(tmp_path))
+    assert authentication.ics_key_username(PLACEHOLDER_ICS_KEY) is None
+    assert authentication.ics_key_username(contents["user_1"]["ics_key"]) is None
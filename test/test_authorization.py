@@ -1,13 +1,20 @@
+import json
+import os
+import shutil
+from unittest.mock import patch
+
 import pytest
 from flask_calendar.authorization import Authorization
-from flask_calendar.calendar_data import CalendarData
+from flask_calendar.calendar_data import CalendarData, calendar_cache
+from flask_calendar import membership_index
+from flask_calendar.membership_index import MembershipIndex
 
 EXISTING_USERNAME = "a_username"
 
 
 @pytest.fixture
-def authorization() -> Authorization:
-    return Authorization(calendar_data=CalendarData("test/fixtures"))
+def authorization(fixtures_folder: str) -> Authorization:
+    return Authorization(calendar_data=CalendarData(fixtures_folder))
 
 
 def test_unauthorized_if_calendar_users_list_empty(authorization: Authorization,) -> None:
@@ -25,3 +32,79 @@ def test_authorized_if_calendar_user_in_list(authorization: Authorization) -> No
 def test_authorized_if_calendar_user_in_list_using_calendar_data(authorization: Authorization,) -> None:
     data = {"users": [EXISTING_USERNAME]}
     assert authorization.can_access(username=EXISTING_USERNAME, data=data) is True
+
+
+@pytest.fixture
+def writable_authorization(tmp_path: str) -> Authorization:
+    for filename in ["sample_data_file.json", "sample_empty_data_file.json"]:
+        shutil.copy(os.path.join("test", "fixtures", filename), os.path.join(tmp_path, filename))
+    return Authorization(calendar_data=CalendarData(str(tmp_path)))
+
+
+def test_indexed_access_does_not_parse_calendar(writable_authorization: Authorization) -> None:
+    assert writable_authorization.can_access(username=EXISTING_USERNAME, calendar_id="sample_data_file") is True
+    calendar_cache.clear()
+
+    with patch.object(CalendarData, "_read_calendar") as read_calendar_mock:
+        assert writable_authorization.can_access(username=EXISTING_USERNAME, calendar_id="sample_data_file") is True
+        assert not writable_authorization.can_access(username="an_irrelevant_user_id", calendar_id="sample_data_file")
+    read_calendar_mock.assert_not_called()
+
+
+def test_index_detects_users_changed_on_disk(writable_authorization: Authorization) -> None:
+    assert writable_authorization.can_access(username=EXISTING_USERNAME, calendar_id="sample_data_file") is True
+
+    path = os.path.join(writable_authorization.calendar_data.data_folder, "sample_data_file.json")
+    with open(path) as file:
+        data = json.load(file)
+    data["users"] = ["another_username"]
+    with open(path, "w") as file:
+        json.dump(data, file)
+
+    assert writable_authorization.can_access(username=EXISTING_USERNAME, calendar_id="sample_data_file") is False
+    assert writable_authorization.can_access(username="another_username", calendar_id="sample_data_file") is True
+
+
+def test_index_is_persisted(writable_authorization: Authorization) -> None:
+    data_folder = writable_authorization.calendar_data.data_folder
+    writable_authorization.can_access(username=EXISTING_USERNAME, calendar_id="sample_data_file")
+
+    index = MembershipIndex(data_folder)
+    version = writable_authorization.calendar_data._file_version(os.path.join(data_folder, "sample_data_file.json"))
+    assert index.users("sample_data_file", version) == frozenset([EXISTING_USERNAME])
+    assert index.user_calendars(EXISTING_USERNAME) == ["sample_data_file"]
+
+
+def test_lists_user_calendars(writable_authorization: Authorization) -> None:
+    assert writable_authorization.calendar_data.user_calendars(EXISTING_USERNAME) == ["sample_data_file"]
+    assert writable_authorization.calendar_data.user_calendars("an_irrelevant_user_id") == []
+
+
+def restart() -> None:
+    membership_index._indexes.clear()
+    calendar_cache.clear()
+
+
+def test_partial_index_is_not_trusted_after_a_restart(writable_authorization: Authorization) -> None:
+    data_folder = writable_authorization.calendar_data.data_folder
+    shutil.copy(os.path.join(data_folder, "sample_data_file.json"), os.path.join(data_folder, "another_calendar.json"))
+    assert writable_authorization.can_access(username=EXISTING_USERNAME, calendar_id="sample_data_file") is True
+    restart()
+
+    assert writable_authorization.calendar_data.user_calendars(EXISTING_USERNAME) == [
+        "another_calendar",
+        "sample_data_file",
+    ]
+
+
+def test_complete_index_picks_up_calendars_added_later(writable_authorization: Authorization) -> None:
+    data_folder = writable_authorization.calendar_data.data_folder
+    assert writable_authorization.calendar_data.user_calendars(EXISTING_USERNAME) == ["sample_data_file"]
+    restart()
+    shutil.copy(os.path.join(data_folder, "sample_data_file.json"), os.path.join(data_folder, "another_calendar.json"))
+
+    assert membership_index.membership_index(data_folder).complete is True
+    assert writable_authorization.calendar_data.user_calendars(EXISTING_USERNAME) == [
+        "another_calendar",
+        "sample_data_file",
+    ]
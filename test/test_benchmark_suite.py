@@ -0,0 +1,63 @@
+from flask_calendar.app_utils import STORAGE_BACKENDS
+from test.benchmark_suite import compare, run_repeat
+from test.synthetic_calendar import synthetic_calendar
+
+
+def test_synthetic_calendars_are_reproducible() -> None:
+    arguments = dict(years=1, tasks_per_day=1, repetitive_tasks=5, hidden_instances=10, multi_day_spans=3)
+    data = synthetic_calendar(**arguments)
+
+    assert synthetic_calendar(**arguments) == data
+    assert synthetic_calendar(seed=1, **arguments) != data
+    assert len(data["tasks"]["repetition"]) == 5
+    spans = [
+        task
+        for months in data["tasks"]["normal"].values()
+        for days in months.values()
+        for day_tasks in days.values()
+        for task in day_tasks
+        if task["title"].startswith("span")
+    ]
+    assert len({task["title"] for task in spans}) == 3
+    assert len({task["id"] for task in spans}) == len(spans)
+
+
+def test_only_slowdowns_over_the_threshold_and_the_noise_are_regressions() -> None:
+    baseline = {
+        "a": {"min_ms": 10.0, "spread_ms": 0.5},
+        "b": {"min_ms": 10.0, "spread_ms": 0.5},
+        "c": {"min_ms": 0.01, "spread_ms": 0.0},
+        "d": {"min_ms": 1.0, "spread_ms": 0.1},
+        "e": {"min_ms": 1.0, "spread_ms": 1.0},
+    }
+    results = {
+        "a": {"min_ms": 11.0, "spread_ms": 0.5},
+        "b": {"min_ms": 13.0, "spread_ms": 0.5},
+        "c": {"min_ms": 0.03, "spread_ms": 0.0},
+        "d": {"min_ms": 1.5, "spread_ms": 0.6},
+        "e": {"min_ms": 1.5, "spread_ms": 0.1},
+        "f": {"min_ms": 1.0, "spread_ms": 0.1},
+    }
+
+    assert compare(results, baseline, 0.2) == [
+        ("a", 10.0, 11.0, False),
+        ("b", 10.0, 13.0, True),
+        ("c", 0.01, 0.03, False),
+        ("d", 1.0, 1.5, False),
+        ("e", 1.0, 1.5, False),
+    ]
+    results["d"]["spread_ms"] = 0.1
+    assert compare(results, baseline, 0.2)[3] == ("d", 1.0, 1.5, True)
+
+
+def test_every_benchmark_runs_with_every_backend() -> None:
+    size = dict(years=1, tasks_per_day=1, repetitive_tasks=5, hidden_instances=5, multi_day_spans=2)
+    results = run_repeat(size, sorted(STORAGE_BACKENDS), 2, 0)
+
+    for backend in STORAGE_BACKENDS:
+        assert "{}.month_view_request".format(backend) in results
+        assert "{}.create_multi_day_task_day_by_day".format(backend) in results
+    assert {"serializer.json_dumps", "serializer.compressed_loads", "markup.decorate_task_details"} <= set(results)
+    for runs_ms, peak_mb in results.values():
+        assert len(runs_ms) == 2
+        assert peak_mb >= 0
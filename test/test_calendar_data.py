@@ -1,13 +1,29 @@
-from typing import Dict
+import json
+import multiprocessing
+import os
+import random
+import shutil
+from datetime import date
+from typing import Dict, List, Tuple  # noqa: F401
 from unittest.mock import ANY, MagicMock, patch
 
 import pytest
-from flask_calendar.calendar_data import CalendarData
+from flask import Flask
+from flask_calendar.calendar_data import CalendarCache, CalendarData, RepetitionRules, TaskIndex
+from flask_calendar.constants import WEEK_START_DAY_MONDAY, WEEK_START_DAY_SUNDAY
+from flask_calendar.gregorian_calendar import GregorianCalendar
 
 
 @pytest.fixture
-def calendar_data() -> CalendarData:
-    return CalendarData("test/fixtures")
+def calendar_data(fixtures_folder: str) -> CalendarData:
+    return CalendarData(fixtures_folder)
+
+
+@pytest.fixture
+def writable_calendar_data(tmp_path: str) -> CalendarData:
+    for filename in ["sample_data_file.json", "sample_empty_data_file.json"]:
+        shutil.copy(os.path.join("test", "fixtures", filename), os.path.join(tmp_path, filename))
+    return CalendarData(str(tmp_path))
 
 
 @pytest.fixture
@@ -261,3 +277,647 @@ def test_existing_repetitive_task_retrieval(calendar_data: CalendarData) -> None
 def test_non_existing_repetitive_task_retrieval(calendar_data: CalendarData) -> None:
     with pytest.raises(IndexError):
         calendar_data.repetitive_task_from_calendar(calendar_id="sample_data_file", year=2017, month=11, task_id=111)
+
+
+def test_loaded_calendar_is_cached_while_file_unchanged(calendar_data: CalendarData) -> None:
+    assert calendar_data.load_calendar("sample_data_file") is calendar_data.load_calendar("sample_data_file")
+
+
+def test_cached_calendar_is_reloaded_when_file_changes(writable_calendar_data: CalendarData) -> None:
+    data = writable_calendar_data.load_calendar("sample_data_file")
+    assert data["name"] == "Fixture 2017"
+
+    changed_data = dict(data, name="a changed name")
+    with open(os.path.join(writable_calendar_data.data_folder, "sample_data_file.json"), "w") as file:
+        # different size guarantees a different file version even with coarse mtime resolution
+        json.dump(changed_data, file)
+
+    assert writable_calendar_data.load_calendar("sample_data_file")["name"] == "a changed name"
+
+
+def test_retrieved_tasks_do_not_modify_cached_calendar(calendar_data: CalendarData) -> None:
+    calendar_data.task_from_calendar(calendar_id="sample_data_file", year=2017, month=11, day=6, task_id=4)
+    calendar_data.repetitive_task_from_calendar(calendar_id="sample_data_file", year=2017, month=11, task_id=2)
+    data = calendar_data.load_calendar("sample_data_file")
+    tasks = calendar_data.tasks_from_calendar(2017, 11, data)
+    calendar_data.add_repetitive_tasks_from_calendar(2017, 11, data, tasks)
+    calendar_data.hide_past_tasks(2017, 11, tasks)
+
+    data = calendar_data.load_calendar("sample_data_file")
+    assert "repeats" not in data["tasks"]["normal"]["2017"]["11"]["6"][0]
+    assert "date" not in data["tasks"]["repetition"][2]
+    assert len(data["tasks"]["normal"]["2017"]["11"]["6"]) == 1
+    assert len(data["tasks"]["normal"]["2017"]["12"]["25"]) == 2
+
+
+def test_saved_calendar_replaces_cached_one(app: Flask, writable_calendar_data: CalendarData) -> None:
+    writable_calendar_data.load_calendar("sample_empty_data_file")
+    with app.app_context():
+        writable_calendar_data.create_task(
+            calendar_id="sample_empty_data_file",
+            year=2017,
+            month=12,
+            day=10,
+            title="an irrelevant title",
+            is_all_day=True,
+            start_time="00:00",
+            details="",
+            color="an_irrelevant_color",
+            has_repetition=False,
+            repetition_type="",
+            repetition_subtype="",
+            repetition_value=0,
+        )
+
+    data = writable_calendar_data.load_calendar("sample_empty_data_file")
+    assert data["tasks"]["normal"]["2017"]["12"]["10"][0]["title"] == "an irrelevant title"
+
+
+@patch("flask_calendar.calendar_data.CalendarData._save_calendar")
+def test_creates_tasks_of_several_days_with_a_single_save(
+    save_calendar_mock: MagicMock, calendar_data: CalendarData
+) -> None:
+    result = calendar_data.create_tasks(
+        calendar_id="sample_empty_data_file",
+        dates=[(2017, 12, 31), (2018, 1, 1), (2018, 1, 2)],
+        title="an irrelevant title",
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type="",
+        repetition_subtype="",
+        repetition_value=0,
+    )
+    assert result is True
+
+    save_calendar_mock.assert_called_once_with(ANY, filename="sample_empty_data_file")
+    normal_tasks = save_calendar_mock.call_args[0][0]["tasks"]["normal"]
+    tasks = [normal_tasks["2017"]["12"]["31"][0], normal_tasks["2018"]["1"]["1"][0], normal_tasks["2018"]["1"]["2"][0]]
+    assert [task["title"] for task in tasks] == ["an irrelevant title"] * 3
+    assert len(set(task["id"] for task in tasks)) == 3
+
+
+@patch("flask_calendar.calendar_data.CalendarData._save_calendar")
+def test_creating_tasks_without_some_date_creates_none(
+    save_calendar_mock: MagicMock, calendar_data: CalendarData
+) -> None:
+    result = calendar_data.create_tasks(
+        calendar_id="sample_empty_data_file",
+        dates=[(2017, 12, 31), (None, None, None)],
+        title="an irrelevant title",
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type="",
+        repetition_subtype="",
+        repetition_value=0,
+    )
+    assert result is False
+    save_calendar_mock.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "new_date, expected_date",
+    [
+        ((2017, 12, 25), ("2017", "12", "25")),
+        ((2018, 1, 10), ("2018", "1", "10")),
+    ],
+)
+@patch("flask_calendar.calendar_data.CalendarData._save_calendar")
+def test_updates_normal_task_keeping_its_id(
+    save_calendar_mock: MagicMock, calendar_data: CalendarData, new_date: Tuple[int, int, int], expected_date: Tuple
+) -> None:
+    result = calendar_data.update_task(
+        calendar_id="sample_data_file",
+        year_str="2017",
+        month_str="12",
+        day_str="25",
+        task_id=0,
+        new_year=new_date[0],
+        new_month=new_date[1],
+        new_day=new_date[2],
+        title="an updated title",
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type="",
+        repetition_subtype="",
+        repetition_value=0,
+    )
+    assert result is True
+
+    save_calendar_mock.assert_called_once_with(ANY, filename="sample_data_file")
+    normal_tasks = save_calendar_mock.call_args[0][0]["tasks"]["normal"]
+    year_str, month_str, day_str = expected_date
+    updated_tasks = [task for task in normal_tasks[year_str][month_str][day_str] if task["id"] == 0]
+    assert [task["title"] for task in updated_tasks] == ["an updated title"]
+    all_tasks = [
+        task
+        for months in normal_tasks.values()
+        for days in months.values()
+        for tasks in days.values()
+        for task in tasks
+    ]
+    assert len([task for task in all_tasks if task["id"] == 0]) == 1
+
+
+def test_new_task_ids_are_unique_and_increasing(writable_calendar_data: CalendarData) -> None:
+    task_ids = [
+        task_id
+        for count in [5, 1, 3]
+        for task_id in writable_calendar_data._new_task_ids("sample_empty_data_file", count)
+    ]
+    assert task_ids == sorted(set(task_ids))
+
+
+def _new_task_ids_from_another_process(data_folder: str, ids_count: int, task_ids: "multiprocessing.Queue") -> None:
+    calendar_data = CalendarData(data_folder)
+    # every worker creating tasks within the same microsecond
+    with patch("flask_calendar.calendar_data.time.time_ns", return_value=1600000000000000000):
+        for _ in range(ids_count):
+            task_ids.put(calendar_data._new_task_ids("sample_empty_data_file", 1)[0])
+
+
+def test_task_ids_are_unique_across_processes(writable_calendar_data: CalendarData) -> None:
+    workers_count = 4
+    ids_count = 20
+    context = multiprocessing.get_context("fork")
+    task_ids = context.Queue()  # type: multiprocessing.Queue
+    processes = [
+        context.Process(
+            target=_new_task_ids_from_another_process,
+            args=(writable_calendar_data.data_folder, ids_count, task_ids),
+        )
+        for _ in range(workers_count)
+    ]
+    for process in processes:
+        process.start()
+    received_ids = [task_ids.get(timeout=10) for _ in range(workers_count * ids_count)]
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    assert len(set(received_ids)) == workers_count * ids_count
+
+
+def _create_tasks_from_another_process(
+    data_folder: str, worker: int, tasks_count: int, journal_max_operations: int
+) -> None:
+    app = Flask(__name__)
+    app.config["GC_ON_SAVE_CHANCE"] = 0
+    app.config["CALENDAR_JOURNAL_MAX_OPERATIONS"] = journal_max_operations
+    calendar_data = CalendarData(data_folder)
+    with app.app_context():
+        for index in range(tasks_count):
+            calendar_data.create_task(
+                calendar_id="sample_empty_data_file",
+                year=2017,
+                month=12,
+                day=10,
+                title="{}-{}".format(worker, index),
+                is_all_day=True,
+                start_time="00:00",
+                details="",
+                color="an_irrelevant_color",
+                has_repetition=False,
+                repetition_type="",
+                repetition_subtype="",
+                repetition_value=0,
+            )
+
+
+@pytest.mark.parametrize("journal_max_operations", [0, 7])
+def test_concurrent_writers_from_several_processes_do_not_lose_tasks(
+    writable_calendar_data: CalendarData, journal_max_operations: int
+) -> None:
+    workers_count = 8
+    tasks_count = 15
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=_create_tasks_from_another_process,
+            args=(writable_calendar_data.data_folder, worker, tasks_count, journal_max_operations),
+        )
+        for worker in range(workers_count)
+    ]
+    for process in processes:
+        process.start()
+    # meanwhile, readers must always find a complete calendar file
+    while any(process.is_alive() for process in processes):
+        writable_calendar_data.load_calendar_for_update("sample_empty_data_file")
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    data = writable_calendar_data.load_calendar("sample_empty_data_file")
+    titles = [task["title"] for task in data["tasks"]["normal"]["2017"]["12"]["10"]]
+    assert sorted(titles) == sorted(
+        "{}-{}".format(worker, index) for worker in range(workers_count) for index in range(tasks_count)
+    )
+    assert not [filename for filename in os.listdir(writable_calendar_data.data_folder) if filename.endswith(".tmp")]
+
+
+def _create_task_on_day(calendar_data: CalendarData, day: int) -> None:
+    calendar_data.create_task(
+        calendar_id="sample_empty_data_file",
+        year=2017,
+        month=12,
+        day=day,
+        title="task of day {}".format(day),
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type="",
+        repetition_subtype="",
+        repetition_value=0,
+    )
+
+
+def test_changes_are_journaled_until_compaction(app: Flask, writable_calendar_data: CalendarData) -> None:
+    calendar_path = os.path.join(writable_calendar_data.data_folder, "sample_empty_data_file.json")
+    journal_path = os.path.join(writable_calendar_data.data_folder, "sample_empty_data_file.journal")
+    with open(calendar_path) as file:
+        snapshot = file.read()
+
+    with app.app_context():
+        app.config["CALENDAR_JOURNAL_MAX_OPERATIONS"] = 3
+        for day in range(1, 4):
+            _create_task_on_day(writable_calendar_data, day)
+
+        with open(calendar_path) as file:
+            assert file.read() == snapshot
+        with open(journal_path) as file:
+            assert len(file.readlines()) == 3
+        data = writable_calendar_data.load_calendar("sample_empty_data_file")
+        assert sorted(data["tasks"]["normal"]["2017"]["12"]) == ["1", "2", "3"]
+
+        _create_task_on_day(writable_calendar_data, 4)
+
+    assert not os.path.exists(journal_path)
+    with open(calendar_path) as file:
+        assert sorted(json.load(file)["tasks"]["normal"]["2017"]["12"]) == ["1", "2", "3", "4"]
+    data = writable_calendar_data.load_calendar("sample_empty_data_file")
+    assert sorted(data["tasks"]["normal"]["2017"]["12"]) == ["1", "2", "3", "4"]
+
+
+def test_interrupted_journal_append_is_ignored(app: Flask, writable_calendar_data: CalendarData) -> None:
+    with app.app_context():
+        app.config["CALENDAR_JOURNAL_MAX_OPERATIONS"] = 10
+        _create_task_on_day(writable_calendar_data, 1)
+    with open(os.path.join(writable_calendar_data.data_folder, "sample_empty_data_file.journal"), "a") as file:
+        file.write('{"type": "delete", "ye')
+
+    data = writable_calendar_data.load_calendar_for_update("sample_empty_data_file")
+    assert list(data["tasks"]["normal"]["2017"]["12"]) == ["1"]
+
+    with app.app_context():
+        _create_task_on_day(writable_calendar_data, 2)
+    data = writable_calendar_data.load_calendar_for_update("sample_empty_data_file")
+    assert list(data["tasks"]["normal"]["2017"]["12"]) == ["1", "2"]
+
+
+def test_calendar_cache_evicts_least_recently_used_entries() -> None:
+    cache = CalendarCache(max_size=2)
+    cache.set("a", (1,), {"name": "a"})
+    cache.set("b", (1,), {"name": "b"})
+    assert cache.get("a", (1,)) is not None
+    cache.set("c", (1,), {"name": "c"})
+
+    assert cache.get("b", (1,)) is None
+    assert cache.get("a", (1,)) == {"name": "a"}
+    assert cache.get("c", (1,)) == {"name": "c"}
+
+
+def test_calendar_cache_discards_outdated_versions() -> None:
+    cache = CalendarCache(max_size=2)
+    cache.set("a", (1,), {"name": "a"})
+
+    assert cache.get("a", (2,)) is None
+    assert len(cache) == 0
+
+
+def legacy_repetitive_tasks_from_calendar(year: int, month: int, first_weekday: int, data: Dict) -> Dict:
+    # nested loops implementation that RepetitionRules replaced, kept as reference
+    def is_hidden_for_day(id_str: str, year_str: str, month_str: str, day_str: str) -> bool:
+        hidden = data["tasks"]["hidden_repetition"]
+        return day_str in hidden.get(id_str, {}).get(year_str, {}).get(month_str, {})
+
+    def is_hidden(id_str: str, year_str: str, month_str: str) -> bool:
+        return month_str in data["tasks"]["hidden_repetition"].get(id_str, {}).get(year_str, {})
+
+    repetitive_tasks = {}  # type: Dict
+    year_and_months = set([(day.year, day.month) for day in GregorianCalendar.month_days(year, month, first_weekday)])
+    for source_year, source_month in year_and_months:
+        month_str = str(source_month)
+        year_str = str(source_year)
+        repetitive_tasks[month_str] = {}
+        for task in data["tasks"]["repetition"]:
+            id_str = str(task["id"])
+            monthly_task_assigned = False
+            for week in GregorianCalendar.month_days_with_weekday(source_year, source_month, first_weekday):
+                for weekday, day in enumerate(week):
+                    if day == 0:
+                        continue
+                    day_str = str(day)
+                    if (
+                        task["repetition_type"] == "w"
+                        and not is_hidden_for_day(id_str, year_str, month_str, day_str)
+                        and task["repetition_value"] == weekday
+                    ):
+                        CalendarData.add_task_to_list(repetitive_tasks, day_str, month_str, task)
+                    elif task["repetition_type"] == "m" and not is_hidden(id_str, year_str, month_str):
+                        if task["repetition_subtype"] == "w":
+                            if task["repetition_value"] == weekday and not monthly_task_assigned:
+                                monthly_task_assigned = True
+                                CalendarData.add_task_to_list(repetitive_tasks, day_str, month_str, task)
+                        else:
+                            if task["repetition_value"] == day:
+                                CalendarData.add_task_to_list(repetitive_tasks, day_str, month_str, task)
+    return repetitive_tasks
+
+
+def random_repetitions_calendar(seed: int) -> Dict:
+    randomizer = random.Random(seed)
+    repetitions = []
+    hidden = {}  # type: Dict
+    for task_id in range(80):
+        repetition_type = randomizer.choice(["w", "m", "m", "x"])
+        repetition_subtype = randomizer.choice(["w", "m"])
+        if repetition_type == "m" and repetition_subtype == "m":
+            repetition_value = randomizer.randint(1, 31)
+        else:
+            repetition_value = randomizer.randint(0, 6)
+        repetitions.append(
+            {
+                "id": task_id,
+                "title": "task {}".format(task_id),
+                "repetition_type": repetition_type,
+                "repetition_subtype": repetition_subtype,
+                "repetition_value": repetition_value,
+            }
+        )
+        for _ in range(randomizer.randint(0, 6)):
+            year_str = str(randomizer.randint(2019, 2021))
+            month_str = str(randomizer.randint(1, 12))
+            days = hidden.setdefault(str(task_id), {}).setdefault(year_str, {}).setdefault(month_str, {})
+            days[str(randomizer.randint(1, 31))] = True
+    return {"users": [], "tasks": {"normal": {}, "repetition": repetitions, "hidden_repetition": hidden}}
+
+
+@pytest.mark.parametrize("first_weekday", [WEEK_START_DAY_MONDAY, WEEK_START_DAY_SUNDAY])
+def test_repetitive_tasks_match_legacy_expansion(fixtures_folder: str, first_weekday: int) -> None:
+    calendar_data = CalendarData(fixtures_folder, first_weekday)
+    calendars = [random_repetitions_calendar(seed) for seed in range(3)] + [
+        calendar_data.load_calendar(filename)
+        for filename in [
+            "sample_data_file",
+            "repetitive_monthly_monthday_hidden_task_data_file",
+            "repetitive_monthly_weekday_hidden_task_data_file",
+        ]
+    ]
+    for data in calendars:
+        for year in [2017, 2019, 2020, 2021]:
+            for month in range(1, 13):
+                assert calendar_data._repetitive_tasks_from_calendar(
+                    year, month, data
+                ) == legacy_repetitive_tasks_from_calendar(year, month, first_weekday, data)
+
+
+def test_repetition_rules_are_compiled_once_per_cached_calendar(calendar_data: CalendarData) -> None:
+    data = calendar_data.load_calendar("sample_data_file")
+
+    with patch("flask_calendar.calendar_data.RepetitionRules", wraps=RepetitionRules) as rules_mock:
+        for month in range(1, 13):
+            calendar_data.add_repetitive_tasks_from_calendar(2017, month, data, {})
+    assert rules_mock.call_count <= 1
+
+
+def test_task_index_is_built_once_per_cached_calendar(calendar_data: CalendarData) -> None:
+    calendar_data.load_calendar("sample_data_file")
+
+    with patch("flask_calendar.calendar_data.TaskIndex", wraps=TaskIndex) as index_mock:
+        calendar_data.task_from_calendar(calendar_id="sample_data_file", year=2017, month=11, day=6, task_id=4)
+        calendar_data.task_from_calendar(calendar_id="sample_data_file", year=2017, month=12, day=25, task_id=1)
+        calendar_data.repetitive_task_from_calendar(calendar_id="sample_data_file", year=2017, month=11, task_id=2)
+    assert index_mock.call_count <= 1
+
+
+def test_task_index_locates_every_task(sample_data_file_data: Dict) -> None:
+    index = TaskIndex(sample_data_file_data)
+    assert index.normal[4] == [("2017", "11", "6", 0)]
+    assert ("2017", "12", "25", 1) in index.normal[1]
+    assert index.repetitive == {0: 0, 1: 1, 2: 2, 3: 3}
+
+
+def test_deletes_task_by_id_whatever_its_day(app: Flask, writable_calendar_data: CalendarData) -> None:
+    data = writable_calendar_data.load_calendar_for_update("sample_data_file")
+    legacy_multi_day_task = dict(data["tasks"]["normal"]["2017"]["11"]["6"][0])
+    data["tasks"]["normal"]["2017"]["11"]["7"] = [legacy_multi_day_task]
+    with open(os.path.join(writable_calendar_data.data_folder, "sample_data_file.json"), "w") as file:
+        json.dump(data, file)
+
+    with app.app_context():
+        writable_calendar_data.delete_task_by_id(calendar_id="sample_data_file", task_id=4)
+        writable_calendar_data.delete_task_by_id(calendar_id="sample_data_file", task_id=3)
+
+    data = writable_calendar_data.load_calendar("sample_data_file")
+    assert 4 not in TaskIndex(data).normal
+    assert [task["id"] for task in data["tasks"]["repetition"]] == [0, 1, 2]
+
+
+class UnwalkableList(list):
+    def __iter__(self):  # type: ignore
+        raise AssertionError("walked a day without the task")
+
+
+def test_deleting_task_by_id_does_not_walk_other_days(sample_data_file_data: Dict) -> None:
+    data = json.loads(json.dumps(sample_data_file_data))
+    task_index = TaskIndex(data)
+    for months in data["tasks"]["normal"].values():
+        for days in months.values():
+            for day_str, day_tasks in days.items():
+                if all(task["id"] != 4 for task in day_tasks):
+                    days[day_str] = UnwalkableList(day_tasks)
+
+    operation = {"type": "delete", "year": None, "month": None, "day": None, "id": 4}
+    assert CalendarData._apply_operation(data, operation, task_index)
+    assert data["tasks"]["normal"]["2017"]["11"]["6"] == []
+
+
+def test_task_index_follows_the_operations_applied(sample_data_file_data: Dict) -> None:
+    data = json.loads(json.dumps(sample_data_file_data))
+    task = {"id": 100, "title": "task", "repetition_type": "w", "repetition_subtype": "", "repetition_value": 0}
+    operations = [  # type: List[Dict]
+        {"type": "create", "year": "2017", "month": "12", "day": "25", "task": dict(task, id=100)},
+        {"type": "create", "year": None, "month": None, "day": None, "task": dict(task, id=101)},
+        {"type": "move", "year": "2017", "month": "12", "day": "25", "id": 1, "new_day": "26"},
+        {"type": "delete", "year": "2017", "month": "12", "day": "25", "id": 0},
+        {"type": "delete", "year": None, "month": None, "day": None, "id": 1},
+        {"type": "delete", "year": None, "month": None, "day": None, "id": 2},
+        {
+            "type": "update",
+            "year": "2017",
+            "month": "12",
+            "day": "25",
+            "id": 100,
+            "new_year": "2018",
+            "new_month": "1",
+            "new_day": "2",
+            "task": dict(task, id=100),
+        },
+        {
+            "type": "update",
+            "year": "2017",
+            "month": "11",
+            "day": "6",
+            "id": 3,
+            "new_year": "2017",
+            "new_month": "11",
+            "new_day": "7",
+            "task": dict(task, id=3),
+        },
+    ]
+    task_index = TaskIndex(data)
+
+    for operation in operations:
+        CalendarData._apply_operation(data, operation, task_index)
+        expected_index = TaskIndex(data)
+        assert task_index.normal == expected_index.normal
+        assert task_index.repetitive == expected_index.repetitive
+    assert task_index.normal[100] == [("2018", "1", "2", 0)]
+    assert task_index.normal[3] == [("2017", "11", "7", 0)]
+    assert [task["id"] for task in data["tasks"]["repetition"]] == [0, 1, 101]
+
+
+def test_tasks_between_yields_ocurrences_in_date_order(
+    calendar_data: CalendarData, sample_data_file_data: Dict
+) -> None:
+    ocurrences = list(calendar_data.tasks_between(date(2017, 11, 1), date(2018, 1, 31), sample_data_file_data))
+
+    dates = [ocurrence_date for ocurrence_date, _ in ocurrences]
+    assert dates == sorted(dates)
+    assert dates[0] == date(2017, 11, 1)
+    assert dates[-1] == date(2018, 1, 29)
+    assert [task["id"] for ocurrence_date, task in ocurrences if ocurrence_date == date(2017, 11, 6)] == [4, 0]
+    assert [task["id"] for ocurrence_date, task in ocurrences if ocurrence_date == date(2017, 12, 25)] == [0, 1, 0]
+    # 1st of each month (id 2), 1st saturday (id 1), every monday (id 0) and thursday (id 3)
+    assert len(ocurrences) == 3 + 3 + (4 + 4 + 5) + (5 + 4 + 4) + 3
+
+
+def test_tasks_between_respects_range_bounds(calendar_data: CalendarData, sample_data_file_data: Dict) -> None:
+    ocurrences = list(calendar_data.tasks_between(date(2017, 12, 25), date(2017, 12, 25), sample_data_file_data))
+
+    assert [(ocurrence_date, task["id"]) for ocurrence_date, task in ocurrences] == [
+        (date(2017, 12, 25), 0),
+        (date(2017, 12, 25), 1),
+        (date(2017, 12, 25), 0),
+    ]
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_month_tasks_match_normal_and_repetitive_tasks_of_the_month_view(
+    calendar_data: CalendarData, seed: int
+) -> None:
+    data = random_repetitions_calendar(seed)
+    data["tasks"]["normal"] = calendar_data.load_calendar("sample_data_file")["tasks"]["normal"]
+
+    for year, month in [(2017, 11), (2017, 12), (2018, 1), (2020, 2), (2021, 8)]:
+        tasks = calendar_data.tasks_from_calendar(year, month, data)
+        tasks = calendar_data.add_repetitive_tasks_from_calendar(year, month, data, tasks)
+        expected_tasks = {}  # type: Dict
+        for day in GregorianCalendar.month_days(year, month, calendar_data.first_weekday):
+            day_tasks = tasks.get(str(day.month), {}).get(str(day.day), [])
+            if day_tasks:
+                expected_tasks.setdefault(str(day.month), {})[str(day.day)] = day_tasks
+
+        assert calendar_data.month_tasks(year, month, data) == expected_tasks
+
+
+def test_reads_only_months_of_a_range_once_saved_with_offsets(app: Flask, writable_calendar_data: CalendarData) -> None:
+    full_data = writable_calendar_data.load_calendar_for_update("sample_data_file")
+    # no month offsets until saved
+    assert writable_calendar_data._load_stored_months("sample_data_file", {(2017, 12)}) is None
+    with app.app_context():
+        app.config["GC_ON_SAVE_CHANCE"] = 0
+        writable_calendar_data._save_calendar(full_data, "sample_data_file")
+
+    data = writable_calendar_data.load_calendar_between("sample_data_file", date(2017, 12, 1), date(2017, 12, 31))
+    assert data["tasks"]["normal"] == {"2017": {"12": full_data["tasks"]["normal"]["2017"]["12"]}}
+    for key in ["users", "name", "repetition", "hidden_repetition"]:
+        assert data.get(key, data["tasks"].get(key)) == full_data.get(key, full_data["tasks"].get(key))
+
+    data = writable_calendar_data.load_calendar_between("sample_data_file", date(2017, 10, 30), date(2017, 12, 3))
+    assert data["tasks"]["normal"] == {"2017": full_data["tasks"]["normal"]["2017"]}
+
+
+def test_calendar_changed_after_saving_offsets_is_fully_read(app: Flask, writable_calendar_data: CalendarData) -> None:
+    full_data = writable_calendar_data.load_calendar_for_update("sample_data_file")
+    with app.app_context():
+        app.config["GC_ON_SAVE_CHANCE"] = 0
+        writable_calendar_data._save_calendar(full_data, "sample_data_file")
+    # edited by hand
+    with open(os.path.join(writable_calendar_data.data_folder, "sample_data_file.json"), "w") as file:
+        json.dump(full_data, file, indent=2)
+
+    assert writable_calendar_data._load_stored_months("sample_data_file", {(2017, 12)}) is None
+    data = writable_calendar_data.load_calendar_between("sample_data_file", date(2017, 12, 1), date(2017, 12, 31))
+    assert data == full_data
+
+
+def test_journaled_changes_are_replayed_over_read_months(app: Flask, writable_calendar_data: CalendarData) -> None:
+    with app.app_context():
+        app.config["GC_ON_SAVE_CHANCE"] = 0
+        writable_calendar_data._save_calendar(
+            writable_calendar_data.load_calendar_for_update("sample_data_file"), "sample_data_file"
+        )
+        app.config["CALENDAR_JOURNAL_MAX_OPERATIONS"] = 10
+        # moved from a month outside the range
+        writable_calendar_data.update_task_day("sample_data_file", "2017", "11", "6", 4, "7")
+        writable_calendar_data.update_task(
+            calendar_id="sample_data_file",
+            year_str="2017",
+            month_str="11",
+            day_str="7",
+            task_id=4,
+            new_year=2017,
+            new_month=12,
+            new_day=2,
+            title="moved task",
+            is_all_day=True,
+            start_time="00:00",
+            details="",
+            color="an_irrelevant_color",
+            has_repetition=False,
+            repetition_type="",
+            repetition_subtype="",
+            repetition_value=0,
+        )
+
+    data = writable_calendar_data.load_calendar_between("sample_data_file", date(2017, 12, 1), date(2017, 12, 31))
+    full_data = writable_calendar_data.load_calendar_for_update("sample_data_file")
+    assert data["tasks"]["normal"]["2017"]["12"] == full_data["tasks"]["normal"]["2017"]["12"]
+    assert [task["title"] for task in data["tasks"]["normal"]["2017"]["12"]["2"]] == ["moved task"]
+
+
+def test_compressed_calendar_is_read_back(app: Flask, writable_calendar_data: CalendarData) -> None:
+    full_data = writable_calendar_data.load_calendar_for_update("sample_data_file")
+    with app.app_context():
+        app.config["GC_ON_SAVE_CHANCE"] = 0
+        writable_calendar_data._save_calendar(full_data, "sample_data_file")
+        app.config["DATA_FILE_FORMAT"] = "compressed"
+        writable_calendar_data._save_calendar(full_data, "sample_data_file")
+
+    with open(os.path.join(writable_calendar_data.data_folder, "sample_data_file.json"), "rb") as file:
+        assert file.read().startswith(b"FCZ1")
+    assert not os.path.exists(writable_calendar_data._offsets_path("sample_data_file"))
+    assert writable_calendar_data.load_calendar("sample_data_file") == full_data
+    data = writable_calendar_data.load_calendar_between("sample_data_file", date(2017, 12, 1), date(2017, 12, 31))
+    assert data == full_data
@@ -0,0 +1,44 @@
+import calendar
+import threading
+from typing import List  # noqa: F401
+
+import pytest
+from flask_calendar.constants import WEEK_START_DAY_MONDAY, WEEK_START_DAY_SUNDAY
+from flask_calendar.gregorian_calendar import GregorianCalendar, month_grid
+
+
+@pytest.mark.parametrize("first_weekday", [WEEK_START_DAY_MONDAY, WEEK_START_DAY_SUNDAY])
+def test_month_grid_matches_calendar_module(first_weekday: int) -> None:
+    for year, month in [(2017, 12), (2018, 1), (2020, 2), (2021, 2)]:
+        days, weeks = month_grid(year, month, first_weekday)
+        month_calendar = calendar.Calendar(first_weekday)
+        assert list(days) == list(month_calendar.itermonthdates(year, month))
+        assert [list(week) for week in weeks] == month_calendar.monthdayscalendar(year, month)
+
+
+def test_month_grid_is_computed_once_per_month_and_first_weekday() -> None:
+    month_grid.cache_clear()
+    grid = month_grid(2017, 12, WEEK_START_DAY_MONDAY)
+    assert month_grid(2017, 12, WEEK_START_DAY_MONDAY) is grid
+    assert month_grid(2017, 12, WEEK_START_DAY_SUNDAY) is not grid
+    assert month_grid.cache_info().misses == 2
+
+
+def test_month_days_use_given_first_weekday() -> None:
+    assert GregorianCalendar.month_days(2017, 12, WEEK_START_DAY_SUNDAY)[0].weekday() == calendar.SUNDAY
+    assert GregorianCalendar.month_days_with_weekday(2017, 12, WEEK_START_DAY_SUNDAY)[0] == (0, 0, 0, 0, 0, 1, 2)
+    assert GregorianCalendar.month_days(2017, 12, WEEK_START_DAY_MONDAY)[0].weekday() == calendar.MONDAY
+
+
+def test_month_grid_is_shared_between_threads() -> None:
+    month_grid.cache_clear()
+    grids = []  # type: List
+    threads = [
+        threading.Thread(target=lambda: grids.append(month_grid(2030, 5, WEEK_START_DAY_MONDAY))) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(grid == grids[0] for grid in grids)
+    assert month_grid.cache_info().currsize == 1
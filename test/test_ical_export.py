@@ -0,0 +1,155 @@
+import json
+from datetime import date, datetime
+from typing import Dict, List, Optional  # noqa: F401
+
+import pytest
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.constants import WEEK_START_DAY_MONDAY, WEEK_START_DAY_SUNDAY
+from flask_calendar.ical_export import MAX_LINE_LENGTH, export_range, ics_chunks
+
+START = date(2017, 11, 1)
+END = date(2017, 12, 31)
+START_OF_2020 = datetime(2020, 1, 1)
+
+
+@pytest.fixture
+def data() -> Dict:
+    with open("test/fixtures/sample_data_file.json") as file:
+        return dict(json.load(file))
+
+
+def ics_lines(data: Dict, first_weekday: int = WEEK_START_DAY_MONDAY) -> List[str]:
+    feed = "".join(ics_chunks("a_calendar", data, START, END, first_weekday, "Europe/Madrid", datetime(2020, 1, 1)))
+    assert feed.endswith("\r\n")
+    # unfolded
+    return feed.replace("\r\n ", "").split("\r\n")[:-1]
+
+
+# Property lines of each event, by UID
+def events(lines: List[str]) -> Dict[str, List[str]]:
+    events = {}  # type: Dict[str, List[str]]
+    event = None  # type: Optional[List[str]]
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            event = []
+        elif line == "END:VEVENT" and event is not None:
+            uid = [line for line in event if line.startswith("UID:")][0]
+            events[uid.split(":", 1)[1]] = event
+            event = None
+        elif event is not None:
+            event.append(line)
+    return events
+
+
+def test_exports_the_months_starting_with_the_current_one() -> None:
+    assert export_range(date(2017, 11, 20), 3) == (date(2017, 11, 1), date(2018, 1, 31))
+    assert export_range(date(2017, 12, 31), 1) == (date(2017, 12, 1), date(2017, 12, 31))
+
+
+def test_normal_tasks_of_the_range_are_single_events(data: Dict) -> None:
+    exported = events(ics_lines(data))
+
+    assert exported["a_calendar-0-20171225@flask-calendar"][2:] == [
+        "DTSTART;VALUE=DATE:20171225",
+        "DTEND;VALUE=DATE:20171226",
+        "SUMMARY:Task title",
+        "DESCRIPTION:Task details",
+    ]
+    assert "DTSTART;TZID=Europe/Madrid:20171225T153000" in exported["a_calendar-1-20171225@flask-calendar"]
+    normal_tasks = [
+        "a_calendar-{}-{}@flask-calendar".format(task["id"], day.strftime("%Y%m%d"))
+        for day, task in CalendarData("test/fixtures").tasks_between(START, END, data)
+        if "repetition_type" not in task
+    ]
+    assert sorted(uid for uid in exported if "repetition" not in uid) == sorted(normal_tasks)
+
+
+@pytest.mark.parametrize("first_weekday", [WEEK_START_DAY_MONDAY, WEEK_START_DAY_SUNDAY])
+def test_repetitive_tasks_start_on_their_first_month_view_ocurrence(data: Dict, first_weekday: int) -> None:
+    exported = events(ics_lines(data, first_weekday))
+
+    first_ocurrences = {}  # type: Dict[int, date]
+    for day, task in CalendarData("test/fixtures", first_weekday).tasks_between(START, END, data):
+        if "repetition_type" in task:
+            first_ocurrences.setdefault(task["id"], day)
+    assert len(first_ocurrences) == len(data["tasks"]["repetition"])
+    for task_id, first_ocurrence in first_ocurrences.items():
+        event = exported["a_calendar-repetition-{}@flask-calendar".format(task_id)]
+        start = [line for line in event if line.startswith("DTSTART")][0]
+        assert start.split(":")[1].startswith(first_ocurrence.strftime("%Y%m%d"))
+        assert len([line for line in event if line.startswith("RRULE:")]) == 1
+
+
+def test_hidden_ocurrences_are_exception_dates(data: Dict) -> None:
+    # weekly ocurrences are hidden per day, monthly ones per month
+    data["tasks"]["hidden_repetition"] = {
+        "0": {"2017": {"11": {"13": True}}},
+        "2": {"2017": {"12": {"15": True}}},
+        "3": {"2017": {"11": {"16": True}}, "2016": {"11": {"17": True}}},
+    }
+    exported = events(ics_lines(data))
+
+    assert "EXDATE;VALUE=DATE:20171113" in exported["a_calendar-repetition-0@flask-calendar"]
+    assert "EXDATE;VALUE=DATE:20171201" in exported["a_calendar-repetition-2@flask-calendar"]
+    assert [line for line in exported["a_calendar-repetition-3@flask-calendar"] if line.startswith("EXDATE")] == [
+        "EXDATE;TZID=Europe/Madrid:20171116T193000"
+    ]
+    assert not [line for line in exported["a_calendar-repetition-1@flask-calendar"] if line.startswith("EXDATE")]
+
+
+def test_text_is_escaped_and_long_lines_folded(data: Dict) -> None:
+    data["tasks"]["normal"]["2017"]["12"]["25"][0]["title"] = "a title; with, special\\ characters\nand lines"
+    data["tasks"]["normal"]["2017"]["12"]["25"][0]["details"] = "ñ" * 100
+    feed = "".join(ics_chunks("a_calendar", data, START, END, WEEK_START_DAY_MONDAY, "UTC", datetime(2020, 1, 1)))
+
+    assert all(len(line.encode("utf-8")) <= MAX_LINE_LENGTH for line in feed.split("\r\n"))
+    exported = events(ics_lines(data))["a_calendar-0-20171225@flask-calendar"]
+    assert "SUMMARY:a title\\; with\\, special\\\\ characters\\nand lines" in exported
+    assert "DESCRIPTION:" + "ñ" * 100 in exported
+
+
+def test_the_timezone_of_timed_events_is_defined_with_its_offset_changes(data: Dict) -> None:
+    # a whole year, so both offset changes are in the range
+    start = date(2017, 1, 1)
+    feed = "".join(ics_chunks("a_calendar", data, start, END, WEEK_START_DAY_MONDAY, "Europe/Madrid", START_OF_2020))
+    lines = feed.split("\r\n")
+
+    begin, end = lines.index("BEGIN:VTIMEZONE"), lines.index("END:VTIMEZONE") + 1
+    # before any event using it
+    assert end <= lines.index("BEGIN:VEVENT")
+    assert lines[begin:end] == [
+        "BEGIN:VTIMEZONE",
+        "TZID:Europe/Madrid",
+        "BEGIN:STANDARD",
+        "DTSTART:20161231T010000",
+        "TZOFFSETFROM:+0100",
+        "TZOFFSETTO:+0100",
+        "TZNAME:CET",
+        "END:STANDARD",
+        "BEGIN:DAYLIGHT",
+        "DTSTART:20170326T020000",
+        "TZOFFSETFROM:+0100",
+        "TZOFFSETTO:+0200",
+        "TZNAME:CEST",
+        "END:DAYLIGHT",
+        "BEGIN:STANDARD",
+        "DTSTART:20171029T030000",
+        "TZOFFSETFROM:+0200",
+        "TZOFFSETTO:+0100",
+        "TZNAME:CET",
+        "END:STANDARD",
+        "END:VTIMEZONE",
+    ]
+    # the end of the last day in that timezone
+    repetition = events(lines)["a_calendar-repetition-3@flask-calendar"]
+    assert "RRULE:FREQ=WEEKLY;BYDAY=TH;UNTIL=20171231T225959Z" in repetition
+
+
+def test_timed_events_are_in_local_time_of_clients_without_the_timezone_definition(data: Dict) -> None:
+    feed = "".join(ics_chunks("a_calendar", data, START, END, WEEK_START_DAY_MONDAY, "Not/AZone", datetime(2020, 1, 1)))
+    lines = feed.split("\r\n")
+
+    assert "BEGIN:VTIMEZONE" not in lines
+    assert not [line for line in lines if "TZID=" in line]
+    assert "DTSTART:20171225T153000" in events(lines)["a_calendar-1-20171225@flask-calendar"]
+    assert "RRULE:FREQ=WEEKLY;BYDAY=TH;UNTIL=20171231T235959" in events(lines)["a_calendar-repetition-3@flask-calendar"]
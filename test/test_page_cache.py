@@ -0,0 +1,38 @@
+from flask_calendar.page_cache import RenderedPageCache
+
+
+def test_pages_are_served_while_their_version_matches() -> None:
+    cache = RenderedPageCache()
+    page = cache.set("a_key", (1,), b"a page")
+
+    assert cache.get("a_key", (1,)) is page
+    assert cache.get("a_key", (2,)) is None
+    # outdated pages are dropped
+    assert cache.get("a_key", (1,)) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "pages": 0, "size": 0}
+
+
+def test_etag_depends_on_page_contents() -> None:
+    cache = RenderedPageCache()
+    assert cache.set("a_key", (1,), b"a page").etag == cache.set("another_key", (1,), b"a page").etag
+    assert cache.set("a_key", (2,), b"a page").etag != cache.set("a_key", (3,), b"another page").etag
+
+
+def test_least_recently_used_pages_are_evicted_over_size() -> None:
+    cache = RenderedPageCache(max_size=10)
+    cache.set("a", (1,), b"1234")
+    cache.set("b", (1,), b"1234")
+    cache.get("a", (1,))
+    cache.set("c", (1,), b"1234")
+
+    assert cache.get("b", (1,)) is None
+    assert cache.get("a", (1,)) is not None
+    assert cache.get("c", (1,)) is not None
+    assert cache.stats()["size"] == 8
+
+    # pages bigger than the whole cache are not kept
+    cache.set("d", (1,), b"12345678901")
+    assert cache.get("d", (1,)) is None
+
+    cache.resize(0)
+    assert cache.stats()["pages"] == 0
@@ -0,0 +1,40 @@
+import json
+from typing import Dict  # noqa: F401
+from unittest.mock import patch
+
+import pytest
+from flask_calendar import serializer
+
+CONTENTS = {
+    "users": ["a_username"],
+    "name": "Áéíóú calendar",
+    "tasks": {"normal": {"2017": {"12": {"25": [{"id": 1, "title": "a task", "is_all_day": True}]}}}},
+}  # type: Dict
+
+
+@pytest.mark.parametrize("file_format", serializer.FILE_FORMATS)
+def test_contents_are_read_back_whatever_the_format(file_format: str) -> None:
+    assert serializer.loads(serializer.dumps(CONTENTS, file_format)) == CONTENTS
+
+
+def test_json_format_writes_plain_json() -> None:
+    assert json.loads(serializer.dumps(CONTENTS)) == CONTENTS
+
+
+def test_compressed_format_is_detected_by_its_header() -> None:
+    contents = serializer.dumps(CONTENTS, serializer.FORMAT_COMPRESSED)
+    assert contents.startswith(serializer.COMPRESSED_HEADER)
+    assert len(contents) < len(serializer.dumps(CONTENTS))
+
+
+@pytest.mark.parametrize("file_format", serializer.FILE_FORMATS)
+def test_standard_library_json_is_used_without_orjson(file_format: str) -> None:
+    contents = serializer.dumps(CONTENTS, file_format)
+    with patch.object(serializer, "orjson", None):
+        assert serializer.loads(contents) == CONTENTS
+        assert serializer.loads(serializer.dumps(CONTENTS, file_format)) == CONTENTS
+
+
+def test_unknown_format_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        serializer.dumps(CONTENTS, "an_unknown_format")
@@ -0,0 +1,120 @@
+import time
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from flask_calendar.session_store import (
+    FAILED_LOGINS_LIFETIME,
+    SESSION_LIFETIME,
+    MemorySessionStore,
+    SessionStore,
+    SqliteSessionStore,
+)
+
+
+def test_memory_sessions() -> None:
+    store = MemorySessionStore("an_irrelevant_folder")
+    store.set("a_session_id", "a_username")
+    assert store.get("a_session_id") == "a_username"
+    assert store.get("an_unknown_session_id") is None
+
+
+def test_incomplete_stores_cannot_be_created() -> None:
+    class IncompleteSessionStore(SessionStore):
+        def get(self, session_id: str) -> None:
+            return None
+
+    with pytest.raises(TypeError):
+        IncompleteSessionStore("an_irrelevant_folder")  # type: ignore
+
+
+def test_sqlite_sessions_are_shared_between_processes(tmp_path: str) -> None:
+    # each store stands for the one of a worker process
+    store = SqliteSessionStore(str(tmp_path))
+    another_store = SqliteSessionStore(str(tmp_path))
+    assert another_store.get("a_session_id") is None
+
+    store.set("a_session_id", "a_username")
+
+    assert another_store.get("a_session_id") == "a_username"
+    # e.g. after a restart
+    assert SqliteSessionStore(str(tmp_path)).get("a_session_id") == "a_username"
+
+
+def test_sqlite_sessions_expire(tmp_path: str) -> None:
+    store = SqliteSessionStore(str(tmp_path))
+    store.set("a_session_id", "a_username")
+    assert store.get("a_session_id") == "a_username"
+
+    with patch("time.time", return_value=time.time() + SESSION_LIFETIME + 1):
+        assert store.get("a_session_id") is None
+        assert SqliteSessionStore(str(tmp_path)).get("a_session_id") is None
+
+
+def test_expired_sqlite_sessions_are_deleted_in_bulk(tmp_path: str) -> None:
+    store = SqliteSessionStore(str(tmp_path))
+    for index in range(3):
+        store.set("session_{}".format(index), "a_username")
+    later = time.time() + SESSION_LIFETIME + 1
+
+    with patch("time.time", return_value=later):
+        store.set("a_session_id", "a_username")
+        rows = store._connection().execute("SELECT id FROM sessions").fetchall()
+    assert rows == [("a_session_id",)]
+
+
+def test_sqlite_sessions_in_memory_are_bounded(tmp_path: str) -> None:
+    store = SqliteSessionStore(str(tmp_path), cache_size=2)
+    for index in range(5):
+        store.set("session_{}".format(index), "user_{}".format(index))
+    assert list(store._cache) == ["session_3", "session_4"]
+
+    # read from the database and kept in memory again
+    assert store.get("session_0") == "user_0"
+    assert list(store._cache) == ["session_4", "session_0"]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def session_store(request: Any, tmp_path: str) -> SessionStore:
+    if request.param == "memory":
+        return MemorySessionStore(str(tmp_path))
+    return SqliteSessionStore(str(tmp_path))
+
+
+def test_failed_logins_delay_next_attempts(session_store: SessionStore) -> None:
+    assert session_store.login_retry_after("a_key") == 0
+
+    session_store.add_failed_login("a_key", 10)
+    assert 0 < session_store.login_retry_after("a_key") <= 1
+    session_store.add_failed_login("a_key", 10)
+    assert 1 < session_store.login_retry_after("a_key") <= 10
+    assert session_store.login_retry_after("another_key") == 0
+
+    with patch("time.time", return_value=time.time() + 10):
+        assert session_store.login_retry_after("a_key") == 0
+
+    session_store.clear_failed_logins("a_key")
+    assert session_store.login_retry_after("a_key") == 0
+
+
+def test_failed_logins_are_forgotten_after_a_while(session_store: SessionStore) -> None:
+    for _ in range(20):
+        session_store.add_failed_login("a_key", 10)
+    assert session_store.login_retry_after("a_key") == pytest.approx(FAILED_LOGINS_LIFETIME, abs=5)
+
+    with patch("time.time", return_value=time.time() + FAILED_LOGINS_LIFETIME + 1):
+        session_store.add_failed_login("a_key", 10)
+        assert 0 < session_store.login_retry_after("a_key") <= 1
+
+
+def test_free_failed_logins_are_not_delayed(session_store: SessionStore) -> None:
+    for _ in range(2):
+        session_store.add_failed_login("a_key", 10, free_attempts=2)
+        assert session_store.login_retry_after("a_key") == 0
+    session_store.add_failed_login("a_key", 10, free_attempts=2)
+    assert 0 < session_store.login_retry_after("a_key") <= 1
+
+
+def test_failed_logins_are_not_delayed_with_zero_base(session_store: SessionStore) -> None:
+    session_store.add_failed_login("a_key", 0)
+    assert session_store.login_retry_after("a_key") == 0
@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+from datetime import date
+from typing import Dict
+
+import pytest
+from flask import Flask
+from flask_calendar.app import create_app
+from flask_calendar.calendar_data import CalendarData
+from flask_calendar.sharded_calendar_data import ShardedCalendarData
+
+EXISTING_USERNAME = "a_username"
+CALENDAR_ID = "sample_data_file"
+
+
+@pytest.fixture
+def json_calendar_data(fixtures_folder: str) -> CalendarData:
+    return CalendarData(fixtures_folder)
+
+
+@pytest.fixture
+def sharded_calendar_data(tmp_path: str) -> ShardedCalendarData:
+    for filename in ["sample_data_file.json", "sample_empty_data_file.json", "users.json"]:
+        shutil.copy(os.path.join("test", "fixtures", filename), os.path.join(tmp_path, filename))
+    calendar_data = ShardedCalendarData(str(tmp_path))
+    calendar_data.import_json_calendars()
+    return calendar_data
+
+
+def create_normal_task(calendar_data: CalendarData, year: int, month: int, day: int, title: str) -> None:
+    calendar_data.create_task(
+        calendar_id=CALENDAR_ID,
+        year=year,
+        month=month,
+        day=day,
+        title=title,
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type="",
+        repetition_subtype="",
+        repetition_value=0,
+    )
+
+
+def test_converts_json_calendars_and_back(
+    sharded_calendar_data: ShardedCalendarData, json_calendar_data: CalendarData, tmp_path: str
+) -> None:
+    assert sharded_calendar_data.import_json_calendars() == ["sample_data_file", "sample_empty_data_file"]
+    assert sorted(os.listdir(os.path.join(tmp_path, CALENDAR_ID))) == ["2017-11.json", "2017-12.json", "calendar.json"]
+    with open(os.path.join(tmp_path, CALENDAR_ID, "calendar.json")) as file:
+        assert json.load(file)["tasks"]["normal"] == {}
+
+    exported_folder = os.path.join(tmp_path, "exported")
+    os.mkdir(exported_folder)
+    assert sharded_calendar_data.export_json_calendars(exported_folder) == [
+        "sample_data_file",
+        "sample_empty_data_file",
+    ]
+    for calendar_id in ["sample_data_file", "sample_empty_data_file"]:
+        json_data = json_calendar_data.load_calendar_for_update(calendar_id)
+        # empty years, months or days have no shard
+        CalendarData._clear_empty_entries(json_data)
+        assert sharded_calendar_data.load_calendar(calendar_id) == json_data
+        assert CalendarData(exported_folder).load_calendar(calendar_id) == json_data
+
+
+def test_unknown_calendar_is_not_found(sharded_calendar_data: ShardedCalendarData) -> None:
+    with pytest.raises(FileNotFoundError):
+        sharded_calendar_data.load_calendar("an_unknown_calendar")
+    with pytest.raises(FileNotFoundError):
+        sharded_calendar_data.calendar_users("an_unknown_calendar")
+
+
+def test_memberships(sharded_calendar_data: ShardedCalendarData) -> None:
+    assert sharded_calendar_data.calendar_users(CALENDAR_ID) == frozenset([EXISTING_USERNAME])
+    assert sharded_calendar_data.user_calendars(EXISTING_USERNAME) == [CALENDAR_ID]
+
+
+def test_loads_only_shards_of_a_range(sharded_calendar_data: ShardedCalendarData) -> None:
+    data = sharded_calendar_data.load_calendar_between(CALENDAR_ID, date(2017, 10, 30), date(2017, 12, 3))
+    assert list(data["tasks"]["normal"]["2017"].keys()) == ["11", "12"]
+
+    data = sharded_calendar_data.load_calendar_between(CALENDAR_ID, date(2017, 10, 30), date(2017, 11, 30))
+    assert list(data["tasks"]["normal"]["2017"].keys()) == ["11"]
+    assert len(data["tasks"]["repetition"]) == 4
+
+
+def test_writes_only_rewrite_changed_files(
+    app: Flask, sharded_calendar_data: ShardedCalendarData, tmp_path: str
+) -> None:
+    calendar_folder = os.path.join(tmp_path, CALENDAR_ID)
+    inodes = {
+        filename: os.stat(os.path.join(calendar_folder, filename)).st_ino for filename in os.listdir(calendar_folder)
+    }
+
+    with app.app_context():
+        app.config["GC_ON_SAVE_CHANCE"] = 0
+        create_normal_task(sharded_calendar_data, 2017, 12, 10, "a new task")
+
+    assert os.stat(os.path.join(calendar_folder, "2017-12.json")).st_ino != inodes["2017-12.json"]
+    assert os.stat(os.path.join(calendar_folder, "2017-11.json")).st_ino == inodes["2017-11.json"]
+    assert os.stat(os.path.join(calendar_folder, "calendar.json")).st_ino == inodes["calendar.json"]
+
+
+def test_mutations_match_json_storage(app: Flask, sharded_calendar_data: ShardedCalendarData, tmp_path: str) -> None:
+    json_calendar_data = CalendarData(str(tmp_path))
+    with app.app_context():
+        app.config["GC_ON_SAVE_CHANCE"] = 0
+        for calendar_data in [json_calendar_data, sharded_calendar_data]:
+            create_normal_task(calendar_data, 2018, 1, 5, "a new task")
+            calendar_data.update_task_day(CALENDAR_ID, "2017", "12", "25", 0, "26")
+            calendar_data.delete_task(CALENDAR_ID, "2017", "12", "25", 1)
+            calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "12", "4", "0")
+            calendar_data.delete_task(CALENDAR_ID, "2017", "12", "1", 3)
+            calendar_data.delete_task_by_id(CALENDAR_ID, 4)
+
+    sharded_data = sharded_calendar_data.load_calendar_for_update(CALENDAR_ID)
+    json_data = json_calendar_data.load_calendar_for_update(CALENDAR_ID)
+    CalendarData._clear_empty_entries(json_data)
+    # ids are creation timestamps, so differ between both
+    for data in [sharded_data, json_data]:
+        data["tasks"]["normal"]["2018"]["1"]["5"][0]["id"] = 0
+    assert sharded_data == json_data
+    assert sorted(os.listdir(os.path.join(tmp_path, CALENDAR_ID))) == ["2017-12.json", "2018-1.json", "calendar.json"]
+
+
+def test_month_view_with_sharded_storage(app_config: Dict, tmp_path: str) -> None:
+    ShardedCalendarData(str(tmp_path)).import_json_calendars(app_config["DATA_FOLDER"])
+    app = create_app({**app_config, "DATA_FOLDER": str(tmp_path), "STORAGE_BACKEND": "sharded"})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username=EXISTING_USERNAME, password="a_password"))
+
+    assert client.get("/sample/?y=2017&m=12").status_code == 200
+    assert client.get("/sample2/").status_code == 403
+    assert client.get("/an_unknown_calendar/").status_code == 404
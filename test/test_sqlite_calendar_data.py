@@ -0,0 +1,241 @@
+import os
+import shutil
+import threading
+import time
+from datetime import date
+from typing import Callable, Dict, Optional, Tuple
+
+import pytest
+from flask import Flask
+from flask_calendar.app import create_app
+from flask_calendar.calendar_data import OPERATION_MOVE_TASK, CalendarData
+from flask_calendar.sqlite_calendar_data import SqliteCalendarData
+
+EXISTING_USERNAME = "a_username"
+CALENDAR_ID = "sample_data_file"
+
+
+@pytest.fixture
+def json_calendar_data(fixtures_folder: str) -> CalendarData:
+    return CalendarData(fixtures_folder)
+
+
+@pytest.fixture
+def sqlite_calendar_data(tmp_path: str) -> SqliteCalendarData:
+    for filename in ["sample_data_file.json", "sample_empty_data_file.json", "users.json"]:
+        shutil.copy(os.path.join("test", "fixtures", filename), os.path.join(tmp_path, filename))
+    calendar_data = SqliteCalendarData(str(tmp_path))
+    calendar_data.import_json_calendars()
+    return calendar_data
+
+
+def create_normal_task(calendar_data: CalendarData, year: int, month: int, day: int, title: str) -> None:
+    calendar_data.create_task(
+        calendar_id=CALENDAR_ID,
+        year=year,
+        month=month,
+        day=day,
+        title=title,
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=False,
+        repetition_type="",
+        repetition_subtype="",
+        repetition_value=0,
+    )
+
+
+def test_imports_json_calendars(sqlite_calendar_data: SqliteCalendarData, json_calendar_data: CalendarData) -> None:
+    assert sqlite_calendar_data.import_json_calendars() == ["sample_data_file", "sample_empty_data_file"]
+    for calendar_id in ["sample_data_file", "sample_empty_data_file"]:
+        json_data = json_calendar_data.load_calendar_for_update(calendar_id)
+        # empty years, months or days have no rows
+        CalendarData._clear_empty_entries(json_data)
+        assert sqlite_calendar_data.load_calendar(calendar_id) == json_data
+
+
+def test_unknown_calendar_is_not_found(sqlite_calendar_data: SqliteCalendarData) -> None:
+    with pytest.raises(FileNotFoundError):
+        sqlite_calendar_data.load_calendar("an_unknown_calendar")
+    with pytest.raises(FileNotFoundError):
+        sqlite_calendar_data.calendar_users("an_unknown_calendar")
+
+
+def test_memberships(sqlite_calendar_data: SqliteCalendarData) -> None:
+    assert sqlite_calendar_data.calendar_users(CALENDAR_ID) == frozenset([EXISTING_USERNAME])
+    assert sqlite_calendar_data.user_calendars(EXISTING_USERNAME) == [CALENDAR_ID]
+
+
+def test_loads_only_months_of_a_range(sqlite_calendar_data: SqliteCalendarData) -> None:
+    data = sqlite_calendar_data.load_calendar_between(CALENDAR_ID, date(2017, 10, 30), date(2017, 12, 3))
+    assert list(data["tasks"]["normal"]["2017"].keys()) == ["11", "12"]
+
+    data = sqlite_calendar_data.load_calendar_between(CALENDAR_ID, date(2017, 10, 30), date(2017, 11, 30))
+    assert list(data["tasks"]["normal"]["2017"].keys()) == ["11"]
+    assert len(data["tasks"]["repetition"]) == 4
+
+
+def test_mutations_match_json_storage(app: Flask, sqlite_calendar_data: SqliteCalendarData, tmp_path: str) -> None:
+    json_calendar_data = CalendarData(str(tmp_path))
+    with app.app_context():
+        app.config["GC_ON_SAVE_CHANCE"] = 0
+        for calendar_data in [json_calendar_data, sqlite_calendar_data]:
+            create_normal_task(calendar_data, 2017, 12, 25, "a new task")
+            calendar_data.update_task_day(CALENDAR_ID, "2017", "12", "25", 0, "26")
+            calendar_data.delete_task(CALENDAR_ID, "2017", "12", "25", 1)
+            calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "12", "4", "0")
+            calendar_data.delete_task(CALENDAR_ID, "2017", "12", "1", 3)
+            calendar_data.delete_task_by_id(CALENDAR_ID, 4)
+
+    sqlite_data = sqlite_calendar_data.load_calendar_for_update(CALENDAR_ID)
+    json_data = json_calendar_data.load_calendar_for_update(CALENDAR_ID)
+    CalendarData._clear_empty_entries(json_data)
+    # ids are creation timestamps, so might differ between both
+    for data in [sqlite_data, json_data]:
+        data["tasks"]["normal"]["2017"]["12"]["25"][0]["id"] = 0
+    assert sqlite_data == json_data
+    assert [task["title"] for task in sqlite_data["tasks"]["normal"]["2017"]["12"]["25"]] == ["a new task"]
+    assert [task["id"] for task in sqlite_data["tasks"]["normal"]["2017"]["12"]["26"]] == [0]
+    assert [task["id"] for task in sqlite_data["tasks"]["repetition"]] == [0, 1, 2]
+    assert sqlite_data["tasks"]["hidden_repetition"] == {"0": {"2017": {"12": {"4": True}}}}
+
+
+# Runs the change in another thread (so through another connection, like another worker would) while this one holds the
+# write lock to execute the operation
+def while_locked(app: Flask, calendar_data: SqliteCalendarData, change: Callable[[], None], operation: Dict) -> None:
+    def run_change() -> None:
+        with app.app_context():
+            change()
+
+    connection = calendar_data._connection()
+    connection.execute("BEGIN IMMEDIATE")
+    thread = threading.Thread(target=run_change)
+    thread.start()
+    # time for the change to read whatever it reads before waiting for the lock
+    time.sleep(0.2)
+    with connection:
+        calendar_data._execute_operation(connection, CALENDAR_ID, operation)
+    thread.join()
+
+
+# Title of the task by day it is on, in December 2017
+def task_days(calendar_data: CalendarData, task_id: int) -> Dict[str, str]:
+    days = calendar_data.load_calendar_for_update(CALENDAR_ID)["tasks"]["normal"]["2017"]["12"]
+    return {
+        day_str: task["title"] for day_str, day_tasks in days.items() for task in day_tasks if task["id"] == task_id
+    }
+
+
+def test_concurrent_moves_do_not_duplicate_tasks(app: Flask, sqlite_calendar_data: SqliteCalendarData) -> None:
+    app.config["GC_ON_SAVE_CHANCE"] = 0
+    while_locked(
+        app,
+        sqlite_calendar_data,
+        lambda: sqlite_calendar_data.update_task_day(CALENDAR_ID, "2017", "12", "25", 0, "27"),
+        {"type": OPERATION_MOVE_TASK, "year": "2017", "month": "12", "day": "25", "id": 0, "new_day": "26"},
+    )
+
+    assert list(task_days(sqlite_calendar_data, 0)) == ["26"]
+
+
+def test_concurrent_user_changes_are_not_lost(sqlite_calendar_data: SqliteCalendarData) -> None:
+    connection = sqlite_calendar_data._connection()
+    connection.execute("BEGIN IMMEDIATE")
+    thread = threading.Thread(target=lambda: sqlite_calendar_data.update_calendar_users(CALENDAR_ID, ["x"]))
+    thread.start()
+    # time for the change to read the users before waiting for the lock
+    time.sleep(0.2)
+    with connection:
+        connection.execute(
+            "INSERT INTO calendar_users (calendar_id, username, position) VALUES (?, 'y', 1)", (CALENDAR_ID,)
+        )
+    thread.join()
+
+    assert sqlite_calendar_data.calendar_users(CALENDAR_ID) == frozenset([EXISTING_USERNAME, "x", "y"])
+
+
+def update_task(
+    calendar_data: CalendarData,
+    task_date: Tuple[str, str, str],
+    task_id: int,
+    new_date: Optional[Tuple[int, int, int]],
+    title: str,
+    repetition: Tuple[str, str, int] = ("", "", 0),
+) -> None:
+    calendar_data.update_task(
+        CALENDAR_ID,
+        *task_date,
+        task_id=task_id,
+        new_year=None if new_date is None else new_date[0],
+        new_month=None if new_date is None else new_date[1],
+        new_day=None if new_date is None else new_date[2],
+        title=title,
+        is_all_day=True,
+        start_time="00:00",
+        details="",
+        color="an_irrelevant_color",
+        has_repetition=new_date is None,
+        repetition_type=repetition[0],
+        repetition_subtype=repetition[1],
+        repetition_value=repetition[2],
+    )
+
+
+def test_concurrent_updates_are_not_lost(app: Flask, sqlite_calendar_data: SqliteCalendarData) -> None:
+    app.config["GC_ON_SAVE_CHANCE"] = 0
+    while_locked(
+        app,
+        sqlite_calendar_data,
+        lambda: update_task(sqlite_calendar_data, ("2017", "12", "25"), 0, (2017, 12, 25), "edited"),
+        {"type": OPERATION_MOVE_TASK, "year": "2017", "month": "12", "day": "25", "id": 0, "new_day": "26"},
+    )
+
+    # no longer on its day once updated, so the edit is kept as a new task like in JSON calendars
+    assert task_days(sqlite_calendar_data, 0) == {"25": "edited", "26": "Task title"}
+
+
+def test_updates_match_json_storage(app: Flask, sqlite_calendar_data: SqliteCalendarData, tmp_path: str) -> None:
+    json_calendar_data = CalendarData(str(tmp_path))
+    with app.app_context():
+        app.config["GC_ON_SAVE_CHANCE"] = 0
+        for calendar_data in [json_calendar_data, sqlite_calendar_data]:
+            calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "12", "2", "1")
+            calendar_data.hide_repetition_task_instance(CALENDAR_ID, "2017", "12", "1", "2")
+            update_task(calendar_data, ("2017", "12", "25"), 0, (2017, 12, 25), "same day")
+            update_task(calendar_data, ("2017", "12", "25"), 1, (2018, 1, 2), "another day")
+            update_task(calendar_data, ("2017", "12", "2"), 1, None, "same repetition", ("m", "w", 5))
+            update_task(calendar_data, ("2017", "12", "1"), 2, None, "another repetition", ("m", "m", 2))
+            update_task(calendar_data, ("2017", "11", "6"), 4, None, "now repetitive", ("w", "w", 1))
+
+    sqlite_data = sqlite_calendar_data.load_calendar_for_update(CALENDAR_ID)
+    json_data = json_calendar_data.load_calendar_for_update(CALENDAR_ID)
+    CalendarData._clear_empty_entries(json_data)
+    assert sqlite_data == json_data
+    assert [task["title"] for task in sqlite_data["tasks"]["normal"]["2017"]["12"]["25"]] == ["same day"]
+    assert [task["id"] for task in sqlite_data["tasks"]["normal"]["2018"]["1"]["2"]] == [1]
+    assert [task["id"] for task in sqlite_data["tasks"]["repetition"]] == [0, 1, 2, 3, 4]
+    assert sqlite_data["tasks"]["hidden_repetition"] == {"1": {"2017": {"12": {"2": True}}}}
+
+
+def test_cached_calendar_follows_writes(app: Flask, sqlite_calendar_data: SqliteCalendarData) -> None:
+    data = sqlite_calendar_data.load_calendar(CALENDAR_ID)
+    assert sqlite_calendar_data.load_calendar(CALENDAR_ID) is data
+
+    with app.app_context():
+        create_normal_task(sqlite_calendar_data, 2018, 1, 1, "a new task")
+
+    data = sqlite_calendar_data.load_calendar(CALENDAR_ID)
+    assert data["tasks"]["normal"]["2018"]["1"]["1"][0]["title"] == "a new task"
+
+
+def test_month_view_with_sqlite_storage(app_config: Dict, tmp_path: str) -> None:
+    SqliteCalendarData(str(tmp_path)).import_json_calendars(app_config["DATA_FOLDER"])
+    app = create_app({**app_config, "DATA_FOLDER": str(tmp_path), "STORAGE_BACKEND": "sqlite"})
+    client = app.test_client()
+    client.post("/do_login", data=dict(username=EXISTING_USERNAME, password="a_password"))
+
+    assert client.get("/sample/?y=2017&m=12").status_code == 200
+    assert client.get("/sample2/").status_code == 403
+    assert client.get("/an_unknown_calendar/").status_code == 404
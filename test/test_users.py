@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+from typing import Dict
+
+import pytest
+from flask_calendar import membership_index
+from flask_calendar.app import create_app
+from flask_calendar.app_utils import STORAGE_BACKENDS
+from flask_calendar.authentication import Authentication
+from flask_calendar.calendar_data import CalendarData, calendar_cache
+from flask_calendar.sharded_calendar_data import ShardedCalendarData
+from flask_calendar.sqlite_calendar_data import SqliteCalendarData
+from flask_calendar.users import main
+
+EXISTING_USERNAME = "a_username"
+CALENDAR_ID = "sample_data_file"
+OTHER_CALENDAR_ID = "sample_empty_data_file"
+
+
+@pytest.fixture(params=["json", "sharded", "sqlite"])
+def config(request: pytest.FixtureRequest, tmp_path: str) -> Dict:
+    for filename in ["sample_data_file.json", "sample_empty_data_file.json", "users.json"]:
+        shutil.copy(os.path.join("test", "fixtures", filename), os.path.join(tmp_path, filename))
+    if request.param == "sharded":
+        ShardedCalendarData(str(tmp_path)).import_json_calendars()
+    elif request.param == "sqlite":
+        SqliteCalendarData(str(tmp_path)).import_json_calendars()
+    return {
+        "DATA_FOLDER": str(tmp_path),
+        "USERS_DATA_FOLDER": str(tmp_path),
+        "STORAGE_BACKEND": request.param,
+        "PASSWORD_SALT": "a test salt",
+    }
+
+
+def calendar_users(config: Dict, calendar_id: str) -> list:
+    calendar_data_class = {"json": CalendarData, "sharded": ShardedCalendarData, "sqlite": SqliteCalendarData}[
+        config["STORAGE_BACKEND"]
+    ]
+    return list(calendar_data_class(config["DATA_FOLDER"]).load_calendar_for_update(calendar_id)["users"])
+
+
+def authentication(config: Dict) -> Authentication:
+    return Authentication(config["USERS_DATA_FOLDER"], password_salt="a test salt", failed_login_delay_base=0)
+
+
+def test_imports_users_from_csv(config: Dict, tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "new_users.csv")
+    with open(path, "w") as file:
+        file.write("username,password,default_calendar,calendars\n")
+        file.write("user_1,password_1,{},\n".format(CALENDAR_ID))
+        file.write("user_2,password_2,{},{} an_unknown_calendar\n".format(OTHER_CALENDAR_ID, CALENDAR_ID))
+
+    main(["import", path], config)
+
+    assert authentication(config).is_valid("user_1", "password_1")
+    assert authentication(config).user_data("user_2")["default_calendar"] == OTHER_CALENDAR_ID
+    assert calendar_users(config, CALENDAR_ID) == [EXISTING_USERNAME, "user_1", "user_2"]
+    assert calendar_users(config, OTHER_CALENDAR_ID) == ["user_2"]
+
+
+def test_imports_users_from_json(config: Dict, tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "new_users.json")
+    with open(path, "w") as file:
+        json.dump(
+            [
+                {"username": "user_1", "password": "password_1", "default_calendar": CALENDAR_ID},
+                {
+                    "username": "user_2",
+                    "password": "password_2",
+                    "default_calendar": OTHER_CALENDAR_ID,
+                    "calendars": [CALENDAR_ID],
+                },
+            ],
+            file,
+        )
+
+    main(["import", path], config)
+
+    assert authentication(config).is_valid("user_2", "password_2")
+    assert calendar_users(config, CALENDAR_ID) == [EXISTING_USERNAME, "user_1", "user_2"]
+    assert calendar_users(config, OTHER_CALENDAR_ID) == ["user_2"]
+
+
+def test_import_of_existing_users_changes_nothing(config: Dict, tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "new_users.csv")
+    with open(path, "w") as file:
+        file.write("username,password,default_calendar\n")
+        file.write("user_1,password_1,{}\n".format(OTHER_CALENDAR_ID))
+        file.write("{},password_2,{}\n".format(EXISTING_USERNAME, OTHER_CALENDAR_ID))
+
+    with pytest.raises(SystemExit):
+        main(["import", path], config)
+
+    assert "user_1" not in authentication(config).contents
+    assert calendar_users(config, OTHER_CALENDAR_ID) == []
+
+
+def test_deletes_users_and_their_memberships(config: Dict) -> None:
+    main(["delete", EXISTING_USERNAME], config)
+
+    assert EXISTING_USERNAME not in authentication(config).contents
+    assert calendar_users(config, CALENDAR_ID) == []
+
+    with pytest.raises(SystemExit):
+        main(["delete", EXISTING_USERNAME], config)
+
+
+def test_deletes_users_given_both_as_arguments_and_in_a_file(
+    config: Dict, tmp_path: str, capsys: pytest.CaptureFixture
+) -> None:
+    path = os.path.join(tmp_path, "deleted_users.csv")
+    with open(path, "w") as file:
+        file.write("username,password,default_calendar\n")
+        file.write("{},,\n".format(EXISTING_USERNAME))
+        file.write("{},,\n".format(EXISTING_USERNAME))
+
+    main(["delete", EXISTING_USERNAME, "--file", path], config)
+
+    assert EXISTING_USERNAME not in authentication(config).contents
+    assert calendar_users(config, CALENDAR_ID) == []
+    assert capsys.readouterr().out == "Deleted 1 users\n"
+
+
+def test_deletes_memberships_of_calendars_used_before_a_restart(config: Dict) -> None:
+    app = create_app({**config, "TESTING": True, "FAILED_LOGIN_DELAY_BASE": 0})
+    with app.app_context():
+        STORAGE_BACKENDS[config["STORAGE_BACKEND"]](config["DATA_FOLDER"]).update_calendar_users(
+            OTHER_CALENDAR_ID, added_users=[EXISTING_USERNAME]
+        )
+    # memberships from before there was any index, e.g. those of calendars edited by hand
+    index_path = membership_index.membership_index(config["DATA_FOLDER"]).path
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    membership_index._indexes.clear()
+    client = app.test_client()
+    client.post("/do_login", data=dict(username=EXISTING_USERNAME, password="a_password"))
+    assert client.get("/{}/".format(CALENDAR_ID)).status_code == 200
+    # a new process, with just the memberships the requests left behind
+    membership_index._indexes.clear()
+    calendar_cache.clear()
+
+    main(["delete", EXISTING_USERNAME], config)
+
+    assert calendar_users(config, CALENDAR_ID) == []
+    assert calendar_users(config, OTHER_CALENDAR_ID) == []
+
+
+def test_lists_users_and_their_calendars(config: Dict, capsys: pytest.CaptureFixture) -> None:
+    main(["list"], config)
+
+    assert capsys.readouterr().out == "{}\tsample\t{}\n".format(EXISTING_USERNAME, CALENDAR_ID)